@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares the size and decoding speed of a slowly changing time series as
+plain, delta and run-length encoded array.
+
+Usage: python bench/compact.py [samples]
+"""
+
+from __future__ import print_function, division
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from striptease import Struct, Dynamic, Array, Integer, uint32
+from striptease.compact import DeltaArray, RLEArray
+
+
+def main():
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    values = [1000 + i // 8 for i in range(samples)]
+    for array in [Array('values'), DeltaArray('values'), RLEArray('values')]:
+        series = Struct().append(
+            uint32('count'),
+            Dynamic('count', array.of(Integer('', False, 4))),
+        )
+        dikt, payload = series.encode({'values': values})
+        elapsed = timeit.timeit(lambda: series.decode(payload, dict()),
+                                number=5)
+        print('%-10s %8d bytes %10.0f samples/s'
+              % (type(array).__name__, len(payload), 5 * samples / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures the wall-clock time of ``import striptease`` in fresh interpreter
+processes, against the startup time of a bare interpreter.
+
+Usage: python bench/import_time.py [runs]
+"""
+
+from __future__ import print_function, division
+
+import os
+import sys
+import subprocess
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(statement, runs):
+    """ Return the median time in ms of ``runs`` interpreters running
+    ``statement`` """
+    env = dict(os.environ, PYTHONPATH=ROOT, PYTHONDONTWRITEBYTECODE='')
+    timings = list()
+    for i in range(runs):
+        start = timeit.default_timer()
+        subprocess.check_call([sys.executable, '-c', statement], env=env)
+        timings.append(timeit.default_timer() - start)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    baseline = measure('pass', runs)
+    for statement in ['import striptease',
+                      'import striptease; striptease.Struct().append('
+                      'striptease.uint8("foo"))',
+                      'import striptease.checksum']:
+        elapsed = measure(statement, runs)
+        print('%-70s %6.1f ms (+%.1f ms)' % (statement, elapsed,
+                                              elapsed - baseline))
+    print('%-70s %6.1f ms' % ('interpreter startup', baseline))
+
+
+if __name__ == '__main__':
+    main()
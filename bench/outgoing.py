@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Queues replies to a peer which doesn't read them, like a slow client of the
+tutorial server. ``asyncore.dispatcher_with_send`` appends every message to
+one growing string, the tutorial ``Connection`` queues the encoded buffers.
+
+Needs ``asyncore``, which Python 3.12 removed, and the dependencies of
+``examples/tutorial.py``.
+
+Usage: python bench/outgoing.py [replies] [size]
+"""
+
+from __future__ import print_function, division
+
+import os
+import sys
+import socket
+import asyncore
+import threading
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'examples'))
+
+from tutorial import Connection, FetchResponse
+
+
+class Baseline(asyncore.dispatcher_with_send):
+
+    def send_message(self, msg):
+        self.send(msg.encode())
+
+
+def queue(connection_type, replies, size):
+    sock, peer = socket.socketpair()
+    connection = connection_type(sock)
+    # replies are sent by the loop thread, which never waits for a drain
+    connection.loop_thread = threading.current_thread()
+    msg = FetchResponse(1, 0, 'name', 'x' * size)
+    try:
+        return timeit.timeit(lambda: [connection.send_message(msg)
+                                      for i in range(replies)], number=1)
+    finally:
+        connection.close()
+        peer.close()
+
+
+def main():
+    replies = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    for label, connection_type in [('dispatcher_with_send', Baseline),
+                                   ('Connection', Connection)]:
+        elapsed = queue(connection_type, replies, size)
+        print('%-22s %8.3f s for %d unread replies of %d bytes'
+              % (label, elapsed, replies, size))
+
+
+if __name__ == '__main__':
+    main()
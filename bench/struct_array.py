@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Decodes a routing table of small fixed-size structs, compiled against the
+generic per-element path.
+
+Usage: python bench/struct_array.py [entries]
+"""
+
+from __future__ import print_function, division
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from striptease import Struct, Padding, Dynamic, Array, uint8, uint16, uint32
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    route = Struct().append(
+        uint32('prefix'),
+        uint8('length'),
+        Padding('\x00'),
+        uint16('metric'),
+        uint32('nexthop'),
+    )
+    table = Struct().append(
+        uint32('count'),
+        Dynamic('count', Array('routes').of(route)),
+    )
+    routes = [dict(prefix=i, length=24, metric=i % 100, nexthop=i * 7)
+              for i in range(entries)]
+    dikt, payload = table.encode({'routes': routes})
+
+    compiled = timeit.timeit(lambda: table.decode(payload, dict()), number=5)
+    array = table.structure[1].seqtype
+    array.element_decoder = lambda: None
+    generic = timeit.timeit(lambda: table.decode(payload, dict()), number=5)
+    print('compiled %8.0f entries/s' % (5 * entries / compiled))
+    print('generic  %8.0f entries/s' % (5 * entries / generic))
+
+
+if __name__ == '__main__':
+    main()
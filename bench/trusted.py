@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares strict and trusted decoding of a checksummed record with paddings.
+
+Usage: python bench/trusted.py [records]
+"""
+
+from __future__ import print_function, division
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from striptease import Struct, Padding, Dynamic, String, uint8, uint16, uint32
+from striptease.checksum import CRC
+
+
+def schema():
+    return Struct().append(
+        uint32('seq'),
+        Padding('\x00' * 4),
+        CRC('crc', 'crc-32').child(Struct('body').append(
+            uint16('len'),
+            uint16('kind'),
+            Dynamic('len', String('data')),
+        )),
+    )
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    struct = schema()
+    dikt, payload = struct.encode({'seq': 1, 'body': {'kind': 2,
+                                                      'data': 'x' * 256}})
+    for label, trusted in [('strict', False), ('trusted', True)]:
+        elapsed = timeit.timeit(
+            lambda: struct.decode(payload, dict(), trusted=trusted),
+            number=records)
+        print('%-8s %8.0f records/s' % (label, records / elapsed))
+
+
+if __name__ == '__main__':
+    main()
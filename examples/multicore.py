@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The storage server of the tutorial on all cores. ``N`` worker processes
+each bind their own listening socket to the same port with
+``SO_REUSEPORT``, so the kernel spreads incoming connections across them.
+Every worker runs an ``asyncio`` loop, which splits the received bytes into
+messages with the tutorial's ``Message.DISPATCHER`` and answers all
+messages of one read with a single write.
+
+SIGINT or SIGTERM shut the server down gracefully: the workers stop
+accepting, flush the replies of open connections and close their
+databases.
+
+Requires Python 3.7 to 3.11 and Linux 3.9 or another system with
+``SO_REUSEPORT``. The messages and storage come from the tutorial, which is
+built on ``asyncore``, and Python 3.12 removed ``asyncore``.
+
+Usage::
+
+    python3 examples/multicore.py server [workers]
+    python3 examples/multicore.py bench [workers] [connections] [seconds]
+
+``bench`` measures requests per second of the single-process ``asyncore``
+server of the tutorial and of this server with one and with ``workers``
+processes, each with ``connections`` clients doing store requests. The
+clients start once all of them are connected.
+"""
+
+import os
+import sys
+import time
+import signal
+import socket
+import asyncio
+import tempfile
+import multiprocessing
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [HERE, os.path.dirname(HERE)]
+
+import tutorial
+from tutorial import Message, StoreRequest, StorageHandler
+
+HOST, PORT = 'localhost', 4712
+
+#: Seconds to wait for open connections on shutdown
+GRACE = 5.0
+
+DISPATCHER = Message.DISPATCHER
+
+#: Barrier of the client processes of a benchmark, see :py:func:`measure`
+BARRIER = None
+
+
+class StorageProtocol(asyncio.Protocol):
+    """
+    The tutorial's ``StorageHandler`` as ``asyncio`` protocol. Received data
+    is buffered until complete messages are framed, a read may contain
+    several messages or only part of one.
+    """
+
+    SUCCESS = StorageHandler.SUCCESS
+    EIO = StorageHandler.EIO
+    EKEY = StorageHandler.EKEY
+    FAIL = StorageHandler.FAIL
+
+    # same storage semantics as the tutorial
+    store = StorageHandler.store
+    store_batch = StorageHandler.store_batch
+    put = StorageHandler.put
+    fetch = StorageHandler.fetch
+
+    def __init__(self, directory, connections):
+        self.directory = directory
+        self.connections = connections
+        self.buffer = bytearray()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        host, port = transport.get_extra_info('peername')[:2]
+        name = '%s-%d.dbm' % (host, port)
+        self.db = tutorial.gnudbm.open(os.path.join(self.directory, name),
+                                       'c')
+        self.connections.add(self)
+
+    def data_received(self, data):
+        buffer = self.buffer
+        buffer += data
+        pos, replies = 0, list()
+        while True:
+            end = DISPATCHER.frame(buffer, pos)
+            if end is None:
+                break
+            reply = DISPATCHER.decode(buffer, pos, end).process(self)
+            if reply:
+                replies.append(reply.encode())
+            pos = end
+        del buffer[:pos]
+        if replies:
+            self.transport.writelines(replies)
+
+    def connection_lost(self, exc):
+        self.db.close()
+        self.connections.discard(self)
+
+
+def listener(host, port):
+    """ A listening socket sharing ``port`` with the other workers """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    sock.setblocking(False)
+    return sock
+
+
+async def serve(host, port, directory):
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    connections = set()
+    server = await loop.create_server(
+        lambda: StorageProtocol(directory, connections),
+        sock=listener(host, port))
+    await stop.wait()
+
+    # stop accepting, then flush the replies of open connections
+    server.close()
+    for protocol in list(connections):
+        protocol.transport.close()
+    deadline = loop.time() + GRACE
+    while connections and loop.time() < deadline:
+        await asyncio.sleep(0.01)
+    await server.wait_closed()
+
+
+def worker(host, port, directory):
+    asyncio.run(serve(host, port, directory))
+
+
+def start_server(host, port, workers, directory):
+    """ Fork ``workers`` processes sharing ``port`` """
+    processes = [multiprocessing.Process(target=worker,
+                                         args=(host, port, directory))
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+    return processes
+
+
+def stop_server(processes):
+    for process in processes:
+        if process.is_alive():
+            os.kill(process.pid, signal.SIGTERM)
+    for process in processes:
+        process.join()
+
+
+def run_server(workers):
+    directory = os.getcwd()
+    processes = start_server(HOST, PORT, workers, directory)
+    print('Serving on %s:%d with %d workers' % (HOST, PORT, workers))
+
+    def shutdown(signum, frame):
+        stop_server(processes)
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+    for process in processes:
+        process.join()
+
+
+async def client(reader, writer, deadline):
+    """ Store requests one after another until ``deadline`` """
+    request = StoreRequest.marshal(1, b'key', list(range(16))).encode()
+    requests = 0
+    while time.time() < deadline:
+        writer.write(request)
+        header = await reader.readexactly(DISPATCHER.size)
+        key, length = DISPATCHER.peek(header)
+        await reader.readexactly(length)
+        requests += 1
+    writer.close()
+    return requests
+
+
+async def gather_clients(host, port, connections, seconds):
+    """
+    Connect ``connections`` clients, then wait at the barrier for the
+    clients of the other processes, before all of them send for ``seconds``.
+    """
+    streams = [await asyncio.open_connection(host, port)
+               for i in range(connections)]
+    BARRIER.wait()
+    deadline = time.time() + seconds
+    return await asyncio.gather(*[client(reader, writer, deadline)
+                                  for reader, writer in streams])
+
+
+def init_clients(barrier):
+    global BARRIER
+    BARRIER = barrier
+
+
+def clients(args):
+    """ Run ``connections`` clients in one process, returns the requests """
+    return sum(asyncio.run(gather_clients(*args)))
+
+
+def measure(port, connections, seconds):
+    """
+    Requests per second of ``connections`` clients on all cores. Every
+    process of the pool takes one task, since it blocks at the barrier until
+    all tasks are taken.
+    """
+    processes = multiprocessing.cpu_count()
+    barrier = multiprocessing.Barrier(processes)
+    pool = multiprocessing.Pool(processes, init_clients, (barrier,))
+    try:
+        counts = pool.map(clients, [
+            (HOST, port, connections // processes +
+             (i < connections % processes), seconds)
+            for i in range(processes)])
+    finally:
+        pool.close()
+        pool.join()
+    return sum(counts) / seconds
+
+
+def wait_listening(port, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection((HOST, port)).close()
+            return
+        except socket.error:
+            time.sleep(0.05)
+    raise RuntimeError('Server on port %d did not start' % port)
+
+
+def bench(workers, connections, seconds):
+    directory = tempfile.mkdtemp()
+    os.chdir(directory) # the tutorial creates its databases in the cwd
+
+    single = multiprocessing.Process(target=tutorial.start_server,
+                                     args=(HOST, PORT + 1))
+    single.start()
+    wait_listening(PORT + 1)
+    rate = measure(PORT + 1, connections, seconds)
+    single.terminate()
+    single.join()
+    print('asyncore, 1 process:    %8.0f requests/s' % rate)
+
+    for n in sorted(set([1, workers])):
+        processes = start_server(HOST, PORT, n, directory)
+        wait_listening(PORT)
+        rate = measure(PORT, connections, seconds)
+        stop_server(processes)
+        print('asyncio, %2d worker(s):  %8.0f requests/s' % (n, rate))
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('server', 'bench'):
+        print(__doc__)
+        return 1
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else \
+        multiprocessing.cpu_count()
+    if sys.argv[1] == 'server':
+        run_server(workers)
+    else:
+        connections = int(sys.argv[3]) if len(sys.argv) > 3 else 64
+        seconds = float(sys.argv[4]) if len(sys.argv) > 4 else 5.0
+        bench(workers, connections, seconds)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
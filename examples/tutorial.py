@@ -4,13 +4,20 @@
 from __future__ import print_function, division
 
 import sys
+import time
+import errno
 import socket
 import marshal
 import asyncore
 import threading
 
+from collections import deque
+from itertools import islice
 from base64 import b64encode, b64decode
-from striptease import Struct, uint8, uint16, String
+from striptease import Struct, uint8, uint16, String, Array, Dynamic
+from striptease.dispatch import Dispatcher
+from striptease.base import GATHER_THRESHOLD, as_bytes, chunk_size
+from striptease.util import IOV_MAX, byte_view, advance
 
 if sys.version_info.major < 3:
     import gdbm as gnudbm
@@ -18,6 +25,10 @@ if sys.version_info.major < 3:
 else:
     import dbm.gnu as gnudbm
 
+DISCONNECTED = frozenset((errno.ECONNRESET, errno.ENOTCONN, errno.ESHUTDOWN,
+                          errno.ECONNABORTED, errno.EPIPE, errno.EBADF))
+SENDMSG = hasattr(socket.socket, 'sendmsg')
+
 
 class Decoder(type):
     """
@@ -30,16 +41,20 @@ class Decoder(type):
 
     def __new__(mcs, name, bases, dikt):
         cls = type.__new__(mcs, name, bases, dikt)
+        if 'MSG_ID' not in dikt: # the base class of Message
+            return cls
         msgid = dikt['MSG_ID']
         if msgid in mcs.REGISTRY:
             raise LookupError('MsgID: 0x%X already assigned to %s' %
                     (msgid, mcs.REGISTRY[msgid]))
         dikt['REGISTRY'] = mcs.REGISTRY
         mcs.REGISTRY[msgid] = cls
+        if 'STRUCTURE' in dikt:
+            cls.DISPATCHER.register(msgid, dikt['STRUCTURE'], cls)
         return cls
 
 
-class Message(object):
+class Message(Decoder('MessageBase', (object,), {})):
     """
     Base class for all messages, uses the Decoder metaclass to automatically
     provide a decoding-service to all its subclasses. Subclasses *must*
@@ -47,36 +62,53 @@ class Message(object):
     of striptease.Token.
     """
 
-    __metaclass__ = Decoder
-
     MSG_ID = -1
     HEADER = Struct().append(
         uint8('msg_id'),
         uint16('length'),
     )
-
-    LENGTH_ERR = "Packet lenght is {0}, {1} expected!"
-
-    def update(self, dikt):
-        self.__dict__.update(dikt)
+    DISPATCHER = Dispatcher(HEADER, 'msg_id', 'length')
+    # attributes which may hold payloads worth sending without a copy
+    LARGE = ()
 
     @classmethod
     def decode(cls, data):
-        # Decode Header and determine msg-type
-        payload, dikt = cls.HEADER.decode(data, dict())
-        msg = cls.REGISTRY[dikt['msg_id']]()
-        assert len(payload) == (dikt['length']),\
-                LENGTH_ERR.format(len(payload), dikt['length'])
-        # Decode payload and update the internal data
-        msg.STRUCTURE.decode(payload, dikt)
-        msg.update(dikt)
-        return msg
+        # Peek msg-type and length, decode the payload into a new instance
+        return cls.DISPATCHER.decode(data)
 
     def encode(self):
-        dikt, payload = self.STRUCTURE.encode(self.__dict__)
-        header_data = dict(msg_id = self.MSG_ID, length = len(payload))
+        return self.DISPATCHER.encode(self.MSG_ID, self)
+
+    def write(self, fileobj):
+        """
+        Write the encoded message chunk by chunk into ``fileobj``, without
+        concatenating header and payload.
+        """
+        chunks = list(self.STRUCTURE.iter_encode(self.__dict__))
+        header_data = dict(msg_id = self.MSG_ID,
+                           length = sum(len(chunk) for chunk in chunks))
+        self.HEADER.write(header_data, fileobj)
+        for chunk in chunks:
+            fileobj.write(chunk)
+
+    def encode_buffers(self):
+        """
+        Encode the message into a list of buffers for ``socket.sendmsg``,
+        large payloads like ``StoreRequest.data`` are not copied. Messages
+        without any are encoded as a whole, which is faster.
+        """
+        if all(chunk_size(getattr(self, name)) < GATHER_THRESHOLD
+               for name in self.LARGE):
+            return [self.encode()]
+        buffers = self.STRUCTURE.encode_buffers(self.__dict__)
+        header_data = dict(msg_id = self.MSG_ID,
+                           length = sum(chunk_size(buf) for buf in buffers))
         dikt, header = self.HEADER.encode(header_data)
-        return header + payload
+        if buffers and chunk_size(buffers[0]) < GATHER_THRESHOLD:
+            buffers[0] = header + as_bytes(buffers[0])
+        else:
+            buffers.insert(0, header)
+        return buffers
 
     def process(self, handler):
         msg = "Subclass must implement this, but {0} doesn't"
@@ -89,6 +121,7 @@ class StoreRequest(Message):
     """
 
     MSG_ID = 0x01
+    LARGE = ('data',)
     STRUCTURE = Struct().append(
         uint8('trans'),
         uint8('nlen'),
@@ -170,6 +203,7 @@ class FetchResponse(Message):
     """
 
     MSG_ID = 0x04
+    LARGE = ('data',)
     STRUCTURE = Struct().append(
         uint8('trans'),
         uint8('status'),
@@ -192,6 +226,196 @@ class FetchResponse(Message):
         return self.name, marshal.loads(b64decode(self.data))
 
 
+class BatchStoreRequest(Message):
+    """
+    Several StoreRequests in a single frame, which the server stores at once
+    and answers with a single BatchStoreResponse
+    """
+
+    MSG_ID = 0x05
+    STRUCTURE = Struct().append(
+        uint16('count'),
+        Dynamic('count', Array('requests').of(Struct().append(
+            uint8('trans'),
+            uint8('nlen'),
+            String('name')['nlen'],
+            uint16('dlen'),
+            String('data')['dlen'],
+        ))),
+    )
+
+    def __init__(self, requests=()):
+        self.requests = [vars(request) for request in requests]
+
+    def process(self, handler):
+        statuses = handler.store_batch([(request['name'], request['data'])
+                                        for request in self.requests])
+        return BatchStoreResponse([
+            StoreResponse(request['trans'], request['name'], status)
+            for request, status in zip(self.requests, statuses)])
+
+
+class BatchStoreResponse(Message):
+    """
+    Sent as a reply upon a BatchStoreRequest, holding the status of every
+    request of the batch.
+    """
+
+    MSG_ID = 0x06
+    STRUCTURE = Struct().append(
+        uint16('count'),
+        Dynamic('count', Array('responses').of(Struct().append(
+            uint8('trans'),
+            uint8('nlen'),
+            String('name')['nlen'],
+            uint8('status'),
+        ))),
+    )
+
+    def __init__(self, responses=()):
+        self.responses = [vars(response) for response in responses]
+
+    def process(self, client):
+        for response in self.responses:
+            client.store_done(StoreResponse(response['trans'],
+                                            response['name'],
+                                            response['status']))
+
+
+class Connection(asyncore.dispatcher):
+    """
+    Base class of both ends of a connection. Received data is buffered until
+    complete messages can be framed, since a read may contain several
+    messages or just a part of a large batch.
+
+    Messages to send are encoded into buffers by the calling thread, without
+    holding any lock. What the socket doesn't take right away is queued as
+    it is, to be sent with as few ``sendmsg`` calls as possible. Once more
+    than ``HIGH_WATERMARK`` bytes are queued, the connection is paused:
+    other threads than the one running the loop block in ``send_message``
+    until the queue has drained below ``LOW_WATERMARK`` bytes.
+    """
+
+    HIGH_WATERMARK = 256 * 1024
+    LOW_WATERMARK = 64 * 1024
+
+    def __init__(self, sock=None):
+        asyncore.dispatcher.__init__(self, sock)
+        self.received = bytearray()
+        self.outgoing = deque()
+        self.outgoing_bytes = 0
+        self.paused = False
+        self.send_lock = threading.RLock()
+        self.drained = threading.Condition(self.send_lock)
+        self.loop_thread = None
+
+    def handle_read(self):
+        self.loop_thread = threading.current_thread()
+        data = self.recv(4096)
+        if data:
+            self.received += data
+            self.process_received()
+
+    def process_received(self):
+        """ Process the complete messages received, while still readable """
+        received = self.received
+        pos = 0
+        while self.readable():
+            end = Message.DISPATCHER.frame(received, pos)
+            if end is None:
+                break
+            msg = Message.DISPATCHER.decode(received, pos, end)
+            pos = end
+            reply = msg.process(self)
+            if reply:
+                self.send_message(reply)
+        del received[:pos]
+
+    def wait_drained(self):
+        """
+        Block while the connection is paused, unless called by the thread
+        running the loop, which is the one draining the queue.
+        """
+        with self.send_lock:
+            while self.paused and \
+                    threading.current_thread() is not self.loop_thread:
+                self.drained.wait()
+
+    def send_message(self, msg, block=True):
+        """
+        Send or queue ``msg``. Unless ``block`` is false, wait for the queue
+        to drain first while the connection is paused.
+        """
+        views = [buf if isinstance(buf, bytes) else byte_view(buf)
+                 for buf in msg.encode_buffers()]
+        size = sum(map(len, views))
+        with self.send_lock:
+            if block:
+                self.wait_drained()
+            outgoing = self.outgoing
+            if outgoing or not self.connected or len(views) > IOV_MAX:
+                outgoing.extend(views)
+                self.outgoing_bytes += size
+                self.initiate_send()
+            else:
+                # nothing queued, only queue what the socket didn't take
+                sent = self.send_views(views)
+                if sent == size:
+                    return
+                outgoing.extend(views)
+                advance(outgoing, sent)
+                self.outgoing_bytes += size - sent
+            if self.outgoing_bytes > self.HIGH_WATERMARK:
+                self.paused = True
+
+    def initiate_send(self):
+        with self.send_lock:
+            outgoing = self.outgoing
+            while outgoing and self.connected:
+                sent = self.send_views(list(islice(outgoing, IOV_MAX)))
+                if not sent:
+                    break
+                advance(outgoing, sent)
+                self.outgoing_bytes -= sent
+            if self.paused and self.outgoing_bytes <= self.LOW_WATERMARK:
+                self.paused = False
+                self.drained.notify_all()
+
+    def send_views(self, views):
+        """
+        Send as much of ``views`` as the socket takes without blocking,
+        returns the number of bytes sent
+        """
+        try:
+            if SENDMSG:
+                return self.socket.sendmsg(views)
+            return self.socket.send(views[0])
+        except socket.error as e:
+            if e.args[0] in (errno.EWOULDBLOCK, errno.EAGAIN):
+                return 0
+            elif e.args[0] in DISCONNECTED:
+                self.handle_close()
+                return 0
+            raise
+
+    def writable(self):
+        return not self.connected or bool(self.outgoing)
+
+    def handle_write(self):
+        self.loop_thread = threading.current_thread()
+        self.initiate_send()
+        if self.received and self.readable():
+            self.process_received() # resume after a pause
+
+    def close(self):
+        with self.send_lock:
+            self.outgoing.clear()
+            self.outgoing_bytes = 0
+            self.paused = False
+            self.drained.notify_all()
+        asyncore.dispatcher.close(self)
+
+
 class StorageServer(asyncore.dispatcher):
 
     def __init__(self, host, port):
@@ -211,7 +435,7 @@ class StorageServer(asyncore.dispatcher):
             handler = StorageHandler(sock, addr)
 
 
-class StorageHandler(asyncore.dispatcher_with_send):
+class StorageHandler(Connection):
 
     SUCCESS = 0x00
     EIO = 0x01
@@ -219,17 +443,13 @@ class StorageHandler(asyncore.dispatcher_with_send):
     FAIL = 0xFF
 
     def __init__(self, sock, addr):
-        asyncore.dispatcher_with_send.__init__(self, sock)
+        Connection.__init__(self, sock)
         self.addr = addr
         self.db = gnudbm.open(str(addr) + '.dbm', 'c')
 
-    def handle_read(self):
-        data = self.recv(4096)
-        if data:
-            msg = Message.decode(data)
-            reply = msg.process(self)
-            if reply:
-                self.send(reply.encode())
+    def readable(self):
+        # stop processing requests while the client doesn't read the replies
+        return not self.paused
 
     def handle_close(self):
         print("Closing database for {0}".format(self.addr))
@@ -237,6 +457,24 @@ class StorageHandler(asyncore.dispatcher_with_send):
         self.close()
 
     def store(self, name, data):
+        return self.store_batch([(name, data)])[0]
+
+    def store_batch(self, items):
+        """
+        Store all ``(name, data)`` pairs of ``items`` in one transaction,
+        which ends with a single sync of the database. Returns the status of
+        every item.
+        """
+        statuses = [self.put(name, data) for name, data in items]
+        try:
+            self.db.sync()
+        except gnudbm.error as e:
+            print(e)
+            statuses = [self.EIO if status == self.SUCCESS else status
+                        for status in statuses]
+        return statuses
+
+    def put(self, name, data):
         status = self.FAIL
         try:
             self.db[name] = data
@@ -263,23 +501,35 @@ class StorageHandler(asyncore.dispatcher_with_send):
             return status, data
 
 
-class StorageClient(asyncore.dispatcher_with_send):
+class StorageClient(Connection):
 
     TRANS = 0
 
+    #: Store requests are batched until this many are pending,
+    BATCH_SIZE = 64
+    #: their names and data exceed this many bytes,
+    BATCH_BYTES = 16384
+    #: or the first one waited this many seconds. 0 disables batching.
+    BATCH_DELAY = 0.002
+
     def __init__(self, host, port):
-        asyncore.dispatcher_with_send.__init__(self)
+        Connection.__init__(self)
         self.lock = threading.RLock()
         self._connected = False
         self.callbacks = dict()
         self.error_callbacks = dict()
+        self.pending = list()
+        self.pending_bytes = 0
+        self.timer = None
+        self.flush_lock = threading.RLock()
+        self.released = threading.Condition(self.lock)
         self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
         self.connect((host, port))
 
     @property
     def connected(self):
         with self.lock:
-            self._connected = True
+            return self._connected
 
     @connected.setter
     def connected(self, state):
@@ -289,36 +539,99 @@ class StorageClient(asyncore.dispatcher_with_send):
     def handle_connect(self):
         self.connected = True
 
-    def handle_read(self):
-        data = self.recv(4096)
-        if data:
-            msg = Message.decode(data)
-            reply = msg.process(self)
-            if reply:
-                self.send(reply.encode())
+    def next_trans(self):
+        """
+        The next transaction number, which is encoded as uint8, that isn't
+        waiting for a response. Blocks while all are in use, unless called
+        by the thread running the loop, which receives the responses.
+        """
+        with self.lock:
+            while len(self.callbacks) >= 0xFF:
+                if threading.current_thread() is self.loop_thread:
+                    raise IOError('All transaction numbers are in use')
+                self.released.wait()
+            trans = self.TRANS % 0xFF + 1
+            while trans in self.callbacks:
+                trans = trans % 0xFF + 1
+            self.TRANS = trans
+            return trans
 
     def store(self, name, data, callback):
+        request = StoreRequest.marshal(0, name, data)
         with self.lock:
             if not self.connected:
                 raise IOError('We are not connected to a server!')
-            self.TRANS += 1
-            self.callbacks[self.TRANS] = callback
-            self.send(StoreRequest.marshal(self.TRANS, name, data).encode())
+            request.trans = self.next_trans()
+            self.callbacks[request.trans] = callback
+            self.pending.append(request)
+            self.pending_bytes += len(request.name) + len(request.data)
+            full = not self.BATCH_DELAY or \
+                len(self.pending) >= self.BATCH_SIZE or \
+                self.pending_bytes >= self.BATCH_BYTES
+            if not full and self.timer is None:
+                self.timer = threading.Timer(self.BATCH_DELAY, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        Send the pending store requests, several in a single batch. Only
+        taking the requests requires the lock, ``flush_lock`` just keeps
+        concurrent flushes in order. It is not held while waiting for a
+        paused connection to drain, since callbacks on the loop thread may
+        store or fetch and take it too.
+        """
+        with self.flush_lock:
+            self.send_pending()
+        self.wait_drained()
+
+    def send_pending(self):
+        """ Send the pending store requests without waiting for a drain """
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            pending, self.pending = self.pending, list()
+            self.pending_bytes = 0
+        batch, size = list(), 0
+        for request in pending:
+            request_size = len(request.name) + len(request.data)
+            if batch and (len(batch) == self.BATCH_SIZE or
+                          size + request_size > self.BATCH_BYTES):
+                self.send_batch(batch)
+                batch, size = list(), 0
+            batch.append(request)
+            size += request_size
+        if batch:
+            self.send_batch(batch)
+
+    def send_batch(self, requests):
+        if len(requests) == 1:
+            self.send_message(requests[0], block=False)
+        else:
+            self.send_message(BatchStoreRequest(requests), block=False)
 
     def store_done(self, store_response):
         with self.lock:
             callback = self.callbacks[store_response.trans]
             del self.callbacks[store_response.trans]
+            self.released.notify()
         callback(store_response.name, store_response.status)
 
     def fetch(self, name, callback, error_cb):
+        request = FetchRequest(0, name)
         with self.lock:
             if not self.connected:
                 raise IOError('We are not connected to a server!')
-            self.TRANS += 1
-            self.callbacks[self.TRANS] = callback
-            self.error_callbacks[self.TRANS] = error_cb
-            self.send(FetchRequest(self.TRANS, name).encode())
+            request.trans = self.next_trans()
+            self.callbacks[request.trans] = callback
+            self.error_callbacks[request.trans] = error_cb
+        with self.flush_lock:
+            self.send_pending() # don't overtake pending stores
+            self.send_message(request, block=False)
+        self.wait_drained()
 
     def fetch_done(self, fetch_response):
         with self.lock:
@@ -326,6 +639,7 @@ class StorageClient(asyncore.dispatcher_with_send):
             callback = self.callbacks[fetch_response.trans]
             del self.error_callbacks[fetch_response.trans]
             del self.callbacks[fetch_response.trans]
+            self.released.notify()
         if fetch_response.status != 0:
             error_cb(fetch_response.name, fetch_response.status)
         else:
@@ -365,11 +679,21 @@ def start_client(host, port):
 
 class ClientTestrun():
 
+    #: Seconds to wait for the connection to the server
+    TIMEOUT = 10
+
     def __init__(self):
         print('Waiting for Connection', end='')
         self.client, loop = start_client('localhost', 4711)
+        deadline = time.time() + self.TIMEOUT
         while not self.client.connected:
+            if time.time() > deadline:
+                print('failed')
+                self.client.close() # ends the loop
+                sys.exit(1)
             print('.', end='')
+            sys.stdout.flush()
+            time.sleep(0.1)
         print('connected')
 
     def store_done(self, name, status):
@@ -382,7 +706,7 @@ class ClientTestrun():
         sys.exit(0)
 
     def fetch_fail(self, name, status):
-        print_fetch_fail(name, dataus)
+        print_fetch_fail(name, status)
         sys.exit(1)
 
     def __call__(self):
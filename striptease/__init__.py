@@ -9,9 +9,13 @@
     :license: BSD, see LICENSE for details
 """
 
+import sys
+import importlib
+
 from striptease.base import Token, Padding, Struct
 from striptease.numbers import Integer, Float
-from striptease.sequences import Dynamic, Static, Consumer, Array, String, array_factory
+from striptease.sequences import Dynamic, Static, Consumer, Array, String, \
+                                 PaddedString, CString, array_factory
 
 
 class NumberFactory(object):
@@ -25,7 +29,7 @@ class NumberFactory(object):
         self.sign = sign
         self.length = length
 
-    def __call__(self, name, endian='!'):
+    def __call__(self, name='', endian='!'):
         raise AttributeError("Subclass should implement this!")
 
 
@@ -39,7 +43,7 @@ class IntegerFactory(NumberFactory):
     def __init__(self, sign, length):
         NumberFactory.__init__(self, sign, length)
 
-    def __call__(self, name, endian='!'):
+    def __call__(self, name='', endian='!'):
         factory = array_factory(Integer)
         return factory(name, self.sign, self.length, endian)
 
@@ -57,7 +61,7 @@ class FloatFactory(NumberFactory):
             raise ValueError("Floats can only have length 4 or 8")
         else: NumberFactory.__init__(self, True, length)
 
-    def __call__(self, name, endian='!'):
+    def __call__(self, name='', endian='!'):
         factory = array_factory(Float)
         return factory(name, self.length, endian)
 
@@ -74,7 +78,37 @@ Bytes = String
 
 Struct = array_factory(Struct)
 
-try:
-    from striptease.bitstring import Bitfield
-except ImportError:
-    pass # Ignore
+# optional subsystems, which are only imported on first access
+LAZY = {
+    'Bitfield': 'striptease.bitfield',
+    'Checksum': 'striptease.checksum',
+    'XOR': 'striptease.checksum',
+    'CRC': 'striptease.checksum',
+    'ChecksumError': 'striptease.checksum',
+    'Compressed': 'striptease.compress',
+    'DeltaArray': 'striptease.compact',
+    'RLEArray': 'striptease.compact',
+    'Dispatcher': 'striptease.dispatch',
+    'Optional': 'striptease.conditional',
+    'If': 'striptease.conditional',
+    'Record': 'striptease.record',
+}
+
+
+def __getattr__(name):
+    """
+    Import optional subsystems listed in ``LAZY`` on first access. Raises
+    an ``ImportError`` if an optional dependency is not installed.
+    """
+    if name not in LAZY:
+        raise AttributeError("module %r has no attribute %r"
+                             % (__name__, name))
+    value = getattr(importlib.import_module(LAZY[name]), name)
+    globals()[name] = value
+    return value
+
+
+if sys.version_info < (3, 7):
+    # module level __getattr__ is not supported, let a module subclass call it
+    from striptease import util
+    sys.modules[__name__] = util.LazyModule(sys.modules[__name__])
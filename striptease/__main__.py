@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""
+    striptease.__main__
+    ~~~~~~~~~~~~~~~~~~~
+
+    Entry point of ``python -m striptease``, see :py:mod:`striptease.cli`.
+
+    :copyright: Copyright 2011 by the University of Paderborn
+    :license: BSD, see LICENSE for details
+"""
+
+import sys
+
+from striptease.cli import main
+
+sys.exit(main())
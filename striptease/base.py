@@ -14,14 +14,85 @@
 """
 
 import sys
-import random
+import itertools
 
-from striptease.util import logged, logging
+from striptease.util import logged
 
 # Python 2 backwards compatibility
 if sys.version_info.major < 3:
     bytes = str
 
+# unique suffixes for the names of Padding token
+PADDING_IDS = itertools.count()
+
+# creation order of all token, the field order of a :py:class:`.Record`
+CREATED = itertools.count()
+
+#: Encoded chunks smaller than this many bytes are joined by
+#: :py:meth:`.Struct.iter_encode` before they are handed out.
+COALESCE_THRESHOLD = 4096
+
+#: Encoded chunks smaller than this many bytes are joined by
+#: :py:meth:`.Struct.encode_buffers`. Below about a kilobyte, copying data is
+#: cheaper than handing the kernel another entry of the I/O vector.
+GATHER_THRESHOLD = 1024
+
+
+def as_bytes(chunk):
+    """
+    Convert a chunk, which may be any object supporting the buffer protocol
+    like ``memoryview``, ``bytearray`` or ``array.array``, into a bytestring.
+    """
+    if isinstance(chunk, bytes):
+        return chunk
+    elif isinstance(chunk, memoryview):
+        return chunk.tobytes()
+    elif hasattr(chunk, 'tobytes'):
+        return chunk.tobytes()
+    elif hasattr(chunk, 'tostring'): # array.array in Python 2
+        return chunk.tostring()
+    return bytes(chunk)
+
+
+def decode_token(token, payload, dikt, trusted=False):
+    """
+    Decode ``token`` from ``payload`` into ``dikt``. ``trusted`` is passed on
+    to token whose ``decode`` takes it, see :py:attr:`.Token.takes_trusted`,
+    so validation is skipped within nested token too.
+    """
+    if trusted and token.takes_trusted:
+        return token.decode(payload, dikt, trusted)
+    return token.decode(payload, dikt)
+
+
+def chunk_size(chunk):
+    """ The length of ``chunk`` in bytes, not in elements """
+    return len(chunk) * getattr(chunk, 'itemsize', 1)
+
+
+def coalesce(chunks, threshold=COALESCE_THRESHOLD):
+    """
+    Join consecutive small ``chunks`` of encoded data until they reach
+    ``threshold`` bytes. Chunks of at least ``threshold`` bytes are passed
+    through as they are, i.e. without being copied.
+    """
+    pending, size = list(), 0
+    for chunk in chunks:
+        if chunk_size(chunk) >= threshold:
+            if pending:
+                yield bytes().join(pending)
+                pending, size = list(), 0
+            yield chunk
+        elif chunk:
+            chunk = as_bytes(chunk)
+            pending.append(chunk)
+            size += len(chunk)
+            if size >= threshold:
+                yield bytes().join(pending)
+                pending, size = list(), 0
+    if pending:
+        yield bytes().join(pending)
+
 
 class Token(object):
     """
@@ -41,8 +112,15 @@ class Token(object):
     determined dynamically, based on the provided values
     """
 
+    #: trusted token skip validation while decoding, see :py:meth:`.trust`
+    trusted = False
+    #: whether :py:meth:`decode <.Token.decode>` takes a ``trusted`` argument,
+    #: because the token validates data or contains token which do
+    takes_trusted = False
+
     def __init__(self, parent=None):
         self.__parent = parent
+        self.created = next(CREATED)
 
     @property
     def parent(self):
@@ -64,6 +142,17 @@ class Token(object):
         """
         raise AttributeError("Not implemented")
 
+    def iter_encode(self, dikt):
+        """
+        Look up associated value from ``dikt`` and yield its encoded data in
+        one or more chunks. Unlike :py:meth:`encode <.Token.encode>`, token
+        may hand out large values as they are, instead of copying them into
+        the payload. The default implementation yields the result of
+        :py:meth:`encode <.Token.encode>` as a single chunk.
+        """
+        dikt, payload = self.encode(dikt, bytes())
+        yield payload
+
     def decode(self, payload, dikt):
         """
         Decode the value for this token from ``payload`` and put it under the
@@ -110,6 +199,35 @@ class Token(object):
         else:
             raise TypeError('parm must be str or dict')
 
+    def children(self):
+        """
+        Return the list of token nested into this token, e.g. the sub-token
+        of a :py:class:`.Struct` or the type of an array.
+        """
+        return []
+
+    def trust(self, trusted=True):
+        """
+        Mark this token and all nested token as ``trusted``, i.e. decoding
+        skips validation like comparing padding bytes, asserting array
+        lengths or verifying checksums. Use this only for data which is
+        known to be correct, e.g. read back from checksummed archives.
+        Returns ``self``.
+        """
+        self.trusted = trusted
+        for child in self.children():
+            child.trust(trusted)
+        return self
+
+    def static_size(self):
+        """
+        Return the length in bytes of the encoded token if it is known without
+        looking at any data, i.e. the token always encodes to the same number
+        of bytes. Returns ``None`` for token with a data-dependent length,
+        which is also the default.
+        """
+        return None
+
 
 class Padding(Token):
     """
@@ -117,18 +235,23 @@ class Padding(Token):
     bytestring representation which can be inlined into the payload.
     """
 
+    #: whether decoding checks the padding bytes
+    verify = True
+    takes_trusted = True
+
     def __init__(self, padd):
         Token.__init__(self)
         assert type(padd) == bytes
         self.padd = padd
-        self.name = 'Pad:%X' % random.randint(0,255)
+        self.name = 'Pad:%X' % next(PADDING_IDS)
 
     def encode(self, dikt, payload):
         return dikt, payload + self.padd
 
-    def decode(self, payload, dikt):
+    def decode(self, payload, dikt, trusted=False):
         length = len(self.padd)
-        assert payload[:length] == self.padd
+        if not (trusted or self.trusted):
+            assert payload[:length] == self.padd
         return payload[length:], dikt
 
     def encode_len(self, dikt):
@@ -138,6 +261,25 @@ class Padding(Token):
         length = len(self.padd)
         return lenght, payload[length:]
 
+    def static_size(self):
+        return len(self.padd)
+
+
+class Alignment(Padding):
+    """
+    ``size`` padding bytes, which aligned :py:class:`Structs <.Struct>`
+    insert to mimic the memory layout of a C compiler. Alignment bytes are
+    encoded as NUL-bytes, but their content is ignored when decoding.
+    """
+
+    verify = False
+
+    def __init__(self, size):
+        Padding.__init__(self, b'\x00' * size)
+
+    def decode(self, payload, dikt, trusted=False):
+        return payload[len(self.padd):], dikt
+
 
 @logged()
 class Struct(Token):
@@ -164,13 +306,24 @@ class Struct(Token):
 
     :param name: (optional) used to store and retrieve data from the supplied
                  dictonary during de- and encoding
+    :param aligned: (optional) if ``True``, :py:meth:`.append` inserts
+                    :py:class:`.Alignment` before each token and at the end,
+                    so the struct has the memory layout a C compiler would
+                    give it, see :py:meth:`.ctype`. Aligned structs may only
+                    contain token with a static size.
     """
 
-    def __init__(self, name=""):
+    takes_trusted = True
+
+    def __init__(self, name="", aligned=False):
         Token.__init__(self)
         self.registry = dict()
         self.structure = list()
         self.name = name
+        self.aligned = aligned
+        self._tail = None
+        self._plan = None
+        self._flat = dict()
 
     def append(self, *items):
         """
@@ -180,16 +333,56 @@ class Struct(Token):
         number of arguments, all of which must be subclasses of
         :py:class:`.Token`.
         """
+        if self.aligned and self._tail is not None:
+            self.structure.remove(self._tail)
+            del self.registry[self._tail.name]
+            self._tail = None
         for item in items:
+            if self.aligned:
+                self.align(item)
             self.registry[item.name] = item
             self.structure.append(item)
             item.parent = self
-            self.logger.debug('Item %s, Parent %s' % (item, self.parent))
+            self.logger.debug('Item %s, Parent %s', item, self.parent)
+        if self.aligned:
+            self._tail = self.align(self)
+        self._plan = None
+        self._flat = dict()
         return self
 
+    def align(self, item):
+        """
+        Append :py:class:`.Alignment`, so ``item`` starts at a multiple of
+        its natural alignment. Returns the alignment token or ``None``.
+        """
+        from striptease.layout import alignment
+        offset = self.static_size()
+        if offset is None:
+            raise ValueError('Aligned struct %r contains token without a '
+                             'static size' % self.name)
+        size = -offset % alignment(item)
+        if not size:
+            return None
+        pad = Alignment(size)
+        self.registry[pad.name] = pad
+        self.structure.append(pad)
+        pad.parent = self
+        return pad
+
+    def ctype(self, name=None):
+        """
+        Return a ``ctypes.Structure`` with the same memory layout as this
+        struct, see :py:func:`striptease.layout.struct_ctype`.
+        """
+        from striptease.layout import struct_ctype
+        return struct_ctype(self, name)
+
     def __contains__(self, key):
         return key in self.registry or key in self.structure
 
+    def children(self):
+        return list(self.structure)
+
     def encode(self, dikt, payload=bytes()):
         """
         Iterates over all tokens in the structure and encode the data from
@@ -198,22 +391,95 @@ class Struct(Token):
         """
         parent_dikt = dikt
         if self.parent:
-            self.logger.debug("Parent: %s" % (self.parent))
+            self.logger.debug("Parent: %s", self.parent)
             dikt = parent_dikt[self.name]
         for token in self.structure:
             dikt, payload = token.encode(dikt, payload)
-        if self.parent:
-            parent_dikt[self.name] = dikt
         return parent_dikt, payload
 
-    def decode(self, payload, dikt):
+    def iter_encode(self, dikt, threshold=COALESCE_THRESHOLD):
+        """
+        Encode ``dikt`` like :py:meth:`.encode`, but yield the encoded data
+        in chunks while iterating over the structure, instead of building the
+        whole payload. Large strings are handed out as they are and small
+        chunks are joined up to ``threshold`` bytes, so the memory needed
+        for encoding is bounded by ``threshold`` instead of the payload size.
+
+        >>> from striptease import Struct, uint8, String
+        >>> struct = Struct().append(
+        ...     uint8('len'),
+        ...     String('data')['len'],
+        ... )
+        >>> list(struct.iter_encode(dict(data='moo')))
+        ['\\x03moo']
+        """
+        chunks = self.iter_tokens(dikt)
+        if self.parent:
+            return chunks # the enclosing struct joins our chunks
+        return coalesce(chunks, threshold)
+
+    def iter_tokens(self, dikt):
+        """
+        Yield the chunks of all token in the structure without joining them.
+        """
+        parent_dikt = dikt
+        if self.parent:
+            dikt = parent_dikt[self.name]
+        for token in self.structure:
+            for chunk in token.iter_encode(dikt):
+                yield chunk
+
+    def write(self, dikt, fileobj, threshold=COALESCE_THRESHOLD):
+        """
+        Encode ``dikt`` chunk by chunk into ``fileobj``, which may be a file
+        like object with a ``write`` method or a socket. Returns the number
+        of bytes written.
+        """
+        write = getattr(fileobj, 'write', None) or fileobj.sendall
+        written = 0
+        for chunk in self.iter_encode(dikt, threshold):
+            write(chunk)
+            written += chunk_size(chunk)
+        return written
+
+    def encode_buffers(self, dikt, threshold=GATHER_THRESHOLD):
+        """
+        Encode ``dikt`` into a list of buffers, suitable for scatter-gather
+        I/O via ``socket.sendmsg`` or ``os.writev``, see
+        :py:func:`striptease.util.send_buffers`. Large strings and arrays
+        whose in-memory representation already matches the encoding are
+        handed out as the original objects, all smaller chunks are joined up
+        to ``threshold`` bytes.
+        """
+        return list(self.iter_encode(dikt, threshold))
+
+    def encode_into(self, dikt, buffer, offset=0):
+        """
+        Encode ``dikt`` directly into the writable ``buffer`` at ``offset``
+        and return the offset behind the record, see
+        :py:meth:`.Plan.encode_into`.
+        """
+        return self.plan().encode_into(dikt, buffer, offset)
+
+    def decode(self, payload, dikt, trusted=False):
         """
         Iterates over all tokens in the structure and successively decodes
         their values from ``payload`` into ``dikt``, thereby consuming
         ``payload``. Returns the initial ``payload`` minus the decoded data.
         If necessary, you have to manually preserve ``payload`` before handing
         it to ``decode``.
+
+        If ``trusted`` is ``True``, the struct is decoded via its compiled
+        :py:meth:`.plan`, skipping validation for this call, also within
+        nested token, see :py:meth:`.Plan.decode`. To skip all validation of
+        a schema permanently, use :py:meth:`.trust`.
         """
+        if trusted:
+            if not self.parent:
+                return self.plan().decode(payload, dikt, trusted)
+            payload, dikt[self.name] = self.plan().decode(payload, dict(),
+                                                          trusted)
+            return payload, dikt
         parent_dikt = dikt
         if self.parent:
             dikt = dict()
@@ -236,6 +502,109 @@ class Struct(Token):
             _length += len
         return _length, parm
 
+    def static_size(self):
+        """
+        The sum of the static sizes of all sub-token, or ``None`` if any of
+        them has a data-dependent length.
+        """
+        size = 0
+        for token in self.structure:
+            _size = token.static_size()
+            if _size is None:
+                return None
+            size += _size
+        return size
+
+    def plan(self):
+        """
+        Return the :py:class:`.Plan` of this struct, i.e. the precomputed
+        offsets and sizes of all its sub-token. The plan is computed once and
+        cached until the next call of :py:meth:`.append`.
+        """
+        if self._plan is None:
+            from striptease.plan import Plan
+            self._plan = Plan(self)
+            metrics = getattr(self, 'metrics', None)
+            if metrics is not None:
+                from striptease.metrics import instrument_plan
+                instrument_plan(self._plan, metrics)
+        return self._plan
+
+    def flat_plan(self, sep='.'):
+        """
+        Return the :py:class:`.FlatPlan` of this struct for keys separated by
+        ``sep``. Like :py:meth:`.plan` it is cached until the next
+        :py:meth:`.append`.
+        """
+        if sep not in self._flat:
+            from striptease.flat import FlatPlan
+            self._flat[sep] = FlatPlan(self, sep)
+        return self._flat[sep]
+
+    def decode_flat(self, payload, dikt=None, sep='.', trusted=False):
+        """
+        Decode ``payload`` into a single flat dictionary, where the values of
+        nested structs are stored under dotted keys like ``'baz.moo'``,
+        instead of one dictionary per struct. Returns the remaining payload
+        and the flat dictionary. See :py:meth:`.Plan.decode` for
+        ``trusted``.
+        """
+        if dikt is None:
+            dikt = dict()
+        return self.flat_plan(sep).decode(payload, dikt, trusted)
+
+    def encode_flat(self, dikt, payload=bytes(), sep='.'):
+        """
+        Encode a flat dictionary, as returned by :py:meth:`.decode_flat`.
+        """
+        return self.flat_plan(sep).encode(dikt, payload)
+
+    def decode_stream(self, fileobj, dikt=None):
+        """
+        Decode one record from the file-like ``fileobj``, reading only as
+        many bytes as needed. A trailing :py:class:`.Consumer` is decoded
+        lazily, see :py:func:`striptease.stream.decode_stream`.
+        """
+        from striptease.stream import decode_stream
+        return decode_stream(self, fileobj, dikt)
+
+    def decode_columns(self, buffer, fields=None):
+        """
+        Decode a ``buffer`` of back-to-back encoded records of this struct
+        into one column per requested field, see
+        :py:func:`striptease.columns.decode_columns`.
+        """
+        from striptease.columns import decode_columns
+        return decode_columns(self, buffer, fields)
+
+    def scan(self, buffer, where=None):
+        """
+        Iterate over the decoded records in a ``buffer`` of back-to-back
+        encoded records of this struct, which match ``where``. Predicates are
+        evaluated on the raw bytes, so only matching records are decoded,
+        see :py:func:`striptease.scan.scan`.
+        """
+        from striptease.scan import scan
+        return scan(self, buffer, where)
+
+    def patch(self, buffer, values, offset=0):
+        """
+        Write ``values`` directly into the encoded record at ``offset`` in
+        the writable ``buffer``, fixing up enclosing checksums, see
+        :py:func:`striptease.patch.patch`.
+        """
+        from striptease.patch import patch
+        patch(self, buffer, values, offset)
+
+    def instrument(self, name=None, sample=None):
+        """
+        Collect metrics of all en- and decoding of this top-level struct and
+        return the :py:class:`.Metrics`, see
+        :py:func:`striptease.metrics.instrument`.
+        """
+        from striptease.metrics import instrument
+        return instrument(self, name, sample)
+
 
 if __name__ == '__main__':
     import doctest
@@ -10,6 +10,8 @@
 
 from bitstring import BitString
 
+from striptease.base import Token
+
 
 class Bitfield(Token):
 
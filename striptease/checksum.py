@@ -10,13 +10,16 @@
     :license: BSD, see LICENSE for details
 """
 
-from crcmod import Crc
-from crcmod.predefined import PredefinedCrc
-
-from striptease.base import Integer
+from striptease.base import as_bytes, decode_token
+from striptease.numbers import Integer
+from striptease.sequences import Consumer
 from striptease.util import logged
 
 
+class ChecksumError(ValueError):
+    """ Raised when decoding data with an incorrect checksum """
+
+
 @logged()
 class Checksum(Integer):
     """
@@ -34,22 +37,49 @@ class Checksum(Integer):
     be of type ``str``.
     """
 
+    takes_trusted = True
+
     def __init__(self, name, length, endian='!'):
-        self.child = None
+        self.wrapped = None
         Integer.__init__(self, name, False, length, endian)
 
     def child(self, child):
-        self.child = child
+        """
+        Set the token, whose encoded data is checksummed. Returns ``self``,
+        so it can be chained with the constructor.
+        """
+        self.wrapped = child
+        self.wrapped.parent = self
         return self
 
+    def children(self):
+        return [self.wrapped] if self.wrapped else []
+
     def encode(self, dikt, payload):
-        _payload = self.child.encode(dikt, '')
+        dikt, _payload = self.wrapped.encode(dikt, '')
         chksum = self.checksum(_payload)
         dikt[self.name] = chksum
         dikt, _payload = Integer.encode(self, dikt, _payload)
         return dikt, payload + _payload
 
-    def decode(self, payload, dikt):
+    def child_length(self, payload):
+        """
+        Determine the length of the child's data at the front of
+        ``payload``, which is followed by the checksum.
+        """
+        size = self.wrapped.static_size()
+        if size is not None:
+            return size
+        plan = getattr(self.wrapped, 'plan', None)
+        if plan is not None:
+            if any(isinstance(f.token, Consumer) for f in plan().fields):
+                return len(payload) - Integer.static_size(self)
+            positions, end, values = plan().locate(payload)
+            return end
+        rest, dikt = self.wrapped.decode(payload, dict())
+        return len(payload) - len(rest)
+
+    def decode(self, payload, dikt, trusted=None):
         """
         1.) Determine length of child and slice off respective payload
         2.) Slice off checksum bytes
@@ -57,29 +87,46 @@ class Checksum(Integer):
         4.) decode child
         5.) Return remaining payload
 
-        If the checksum is not correct an exception is raised
+        If the checksum is not correct a :py:class:`.ChecksumError` is
+        raised. If the token is ``trusted``, step 3.) is skipped and the
+        child is decoded without validation.
         """
-        self.logger.info("data payload %r" % payload)
+        self.logger.debug("data payload %r", payload)
+        if trusted is None:
+            trusted = self.trusted
 
-        child_len = self.child.length(payload)
-        if child_len == len(payload): # consumer case
-            child_len -= self.length  # reduce child-length by checksum
+        size = Integer.static_size(self)
+        child_len = self.child_length(payload)
         child_payload = payload[:child_len]
-        chk_bytes = payload[child_len:self.length]
-        _payload = payload[child_len + self.length:] # remaining payload
+        chk_bytes = payload[child_len:child_len + size]
+        _payload = payload[child_len + size:] # remaining payload
 
         chk_bytes, dikt = Integer.decode(self, chk_bytes, dikt)
-        chk_sum = self.checksum(self, child_payload)
-
-        if dikt[self.name] != chk_sum:
-            raise ValueError('Checksum failure for %s'  % self.child.name)
-        else:
-            child_payload, dikt = self.child.decode(child_payload, dikt)
-            return _payload, dikt
+        if not trusted and dikt[self.name] != self.checksum(child_payload):
+            raise ChecksumError('Checksum failure for %s' % self.name)
+        child_payload, dikt = decode_token(self.wrapped, child_payload, dikt,
+                                           trusted)
+        return _payload, dikt
 
     def checksum(self, bytes):
         raise AttributeError("Implement this")
 
+    def update(self, value, data, changes):
+        """
+        Return the checksum of ``data`` computed incrementally from the
+        previous checksum ``value``, after parts of ``data`` were
+        overwritten. ``changes`` lists the offset and the previous bytes of
+        every overwritten part, in the order of writing. Returns ``None`` if
+        the algorithm can't be updated incrementally, which is the default.
+        """
+        return None
+
+    def static_size(self):
+        size = self.wrapped.static_size() if self.wrapped else None
+        if size is None:
+            return None
+        return size + Integer.static_size(self)
+
 
 class XOR(Checksum):
     """
@@ -92,12 +139,61 @@ class XOR(Checksum):
         Checksum.__init__(self, name, length, endian)
 
     def checksum(self, bytes):
+        length = Integer.static_size(self)
         chk_sum = self.bitmask
-        while bytes:
-            chunk, bytes = bytes[0:self.length], bytes[self.length:]
-            chk_sum ^= sum(ord(c) for c in chunk)
+        for start in range(0, len(bytes), length):
+            chk_sum ^= sum(bytearray(bytes[start:start + length]))
         return chk_sum
 
+    def update(self, value, data, changes):
+        """
+        Only the sums of the chunks touched by ``changes`` are recomputed.
+        """
+        length = Integer.static_size(self)
+        chunks = set()
+        for offset, old in changes:
+            chunks.update(range(offset // length,
+                                (offset + len(old) - 1) // length + 1))
+        for chunk in chunks:
+            start = chunk * length
+            new = bytearray(data[start:start + length])
+            previous = bytearray(new)
+            for offset, old in reversed(changes):
+                begin = max(offset, start)
+                end = min(offset + len(old), start + len(new))
+                if begin < end:
+                    previous[begin - start:end - start] = \
+                        old[begin - offset:end - offset]
+            value ^= sum(previous) ^ sum(new)
+        return value
+
+
+#: ``crcmod.predefined.PredefinedCrc`` instances by name, see
+#: :py:func:`predefined_crc`
+PREDEFINED = dict()
+
+
+def predefined_crc(name):
+    """
+    Return the ``crcmod.predefined.PredefinedCrc`` called ``name``. Its
+    lookup table is built once and shared by all :py:class:`.CRC` token.
+    """
+    crc = PREDEFINED.get(name)
+    if crc is None:
+        from crcmod.predefined import PredefinedCrc
+        crc = PREDEFINED[name] = PredefinedCrc(name)
+    return crc
+
+
+def crc_width(poly):
+    """
+    Determine the width in bits of the CRC with the generator polynom
+    ``poly``, which may be the name of a predefined CRC.
+    """
+    if type(poly) == str:
+        poly = predefined_crc(poly).poly
+    return poly.bit_length() - 1
+
 
 class CRC(Checksum):
     """
@@ -106,17 +202,31 @@ class CRC(Checksum):
     `str` it is interpreted as a name of a well-known crc-function and looked
     up from `crcmod.predefined` using the `crcmod.predefined.PredefinedCRC`
     module.
+
+    Predefined CRCs are looked up when the token is created, their lookup
+    tables are built once per name. For other polynoms, `crcmod` is imported
+    and the lookup table built when the first checksum is calculated.
     """
 
     def __init__(self, name, poly, endian='!'):
-        if type(poly) == str:
-            self.crc = PredefinedCrc(poly)
-        elif type(poly) == int:
-            self.poly = poly
-            self.crc = Crc(poly)
-        Checksum.__init__(self, name, self.crc.digest_size, endian)
+        self.poly = poly
+        self._crc = None
+        Checksum.__init__(self, name, (crc_width(poly) + 7) // 8, endian)
+
+    @property
+    def crc(self):
+        if self._crc is None:
+            if type(self.poly) == str:
+                self._crc = predefined_crc(self.poly)
+            else:
+                from crcmod import Crc
+                self._crc = Crc(self.poly)
+        return self._crc
 
     def checksum(self, bytes):
-        crc = self.crc.new(bytes)
+        try:
+            crc = self.crc.new(bytes)
+        except TypeError: # crcmod only reads some buffers without copying
+            crc = self.crc.new(as_bytes(bytes))
         return int(crc.hexdigest(), 16)
 
@@ -0,0 +1,485 @@
+# -*- coding: utf-8 -*-
+"""
+    striptease.cli
+    ~~~~~~~~~~~~~~
+
+    Bulk conversion of back-to-back encoded records to JSON Lines or CSV and
+    back, run via ``python -m striptease``::
+
+        python -m striptease decode mypackage.schema:message capture.bin
+        python -m striptease encode schema.py:message records.csv -f csv \\
+                                    -o capture.bin
+
+    The schema is given as ``module:attribute`` or ``path.py:attribute``,
+    where the attribute is a :py:class:`.Struct` or a callable returning
+    one. Records are read in batches and converted by ``--jobs`` worker
+    processes, so memory is bounded by the batch size times the number of
+    jobs. A schema with a :py:class:`.Consumer` is the exception, the whole
+    input is a single record then. Throughput statistics are written to
+    stderr at the end.
+
+    Binary strings are written with Python escapes like ``\\x00``, nested
+    structs and arrays become JSON objects and lists. CSV files have one
+    column per leaf field, named by the dotted keys of
+    :py:meth:`.Struct.decode_flat`.
+
+    :copyright: Copyright 2011 by the University of Paderborn
+    :license: BSD, see LICENSE for details
+"""
+
+from __future__ import print_function, division
+
+import io
+import os
+import sys
+import csv
+import json
+import time
+import codecs
+import contextlib
+import struct
+import argparse
+import importlib
+import collections
+
+from striptease.base import Token, Struct
+from striptease.flat import flatten
+from striptease.numbers import Integer, Float
+from striptease.checksum import Checksum
+from striptease.sequences import LengthSpecifier, Static, Dynamic, Consumer, \
+                                 Array, CString
+from striptease.stream import read_exactly, CHUNK_SIZE
+
+
+#: Number of records converted by a worker at once
+BATCH_SIZE = 1000
+
+# the schema of the current process, see load()
+SCHEMA = None
+
+PY2 = sys.version_info[0] == 2
+
+text_type = type(u'')
+
+
+def load_source(path):
+    """ Import the Python file ``path`` as a module """
+    name = os.path.splitext(os.path.basename(path))[0]
+    try:
+        from importlib.util import spec_from_file_location, module_from_spec
+    except ImportError:
+        import imp
+        return imp.load_source(name, path)
+    spec = spec_from_file_location(name, path)
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load(spec):
+    """
+    Load the struct named by ``spec``, either ``module:attribute`` or
+    ``path.py:attribute``. If the attribute is not a token but callable, it
+    is called to create the struct. For a :py:class:`.Record` its
+    ``STRUCTURE`` is loaded.
+    """
+    global SCHEMA
+    if ':' not in spec:
+        raise ValueError('Schema %r is not of the form module:attribute'
+                         % spec)
+    module, attr = spec.rsplit(':', 1)
+    if module.endswith('.py'):
+        namespace = vars(load_source(module))
+    else:
+        namespace = vars(importlib.import_module(module))
+    if attr not in namespace:
+        raise ValueError('%s has no attribute %r' % (module, attr))
+    schema = namespace[attr]
+    if isinstance(getattr(schema, 'STRUCTURE', None), Struct): # a Record
+        schema = schema.STRUCTURE
+    elif not isinstance(schema, Token) and callable(schema):
+        schema = schema()
+    if not isinstance(schema, Struct):
+        raise ValueError('%s is not a Struct' % spec)
+    SCHEMA = schema
+    return schema
+
+
+def escape(value):
+    """ Convert the binary string ``value`` to text with Python escapes """
+    return codecs.escape_encode(value)[0].decode('ascii')
+
+
+def unescape(text):
+    """ Convert escaped ``text`` back to a binary string """
+    return codecs.escape_decode(text.encode('utf-8'))[0]
+
+
+def jsonable(value):
+    """ Convert a decoded value to JSON types """
+    if isinstance(value, bytes):
+        return escape(value)
+    elif isinstance(value, dict):
+        return dict((key, jsonable(v)) for key, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        return [jsonable(v) for v in value]
+    return value
+
+
+def restore(token, value):
+    """ Convert the JSON ``value`` of ``token`` back to a decodable value """
+    if isinstance(token, LengthSpecifier):
+        return restore(token.seqtype, value)
+    elif isinstance(token, Struct):
+        tokens = dict((t.name, t) for t in token.structure)
+        return dict((key, restore(tokens[key], v) if key in tokens else v)
+                    for key, v in value.items())
+    elif isinstance(token, Array):
+        return [restore(token.atype, v) for v in value]
+    elif isinstance(value, text_type) and not getattr(token, 'encoding',
+                                                      None):
+        return unescape(value)
+    return value
+
+
+def parse(token, text):
+    """ Convert the CSV cell ``text`` of ``token`` to a decodable value """
+    if isinstance(token, Integer):
+        return int(text)
+    elif isinstance(token, Float):
+        return float(text)
+    elif isinstance(getattr(token, 'seqtype', token), (Array, Struct)):
+        return restore(token, json.loads(text))
+    if PY2:
+        text = text.decode('utf-8')
+    return restore(token, text)
+
+
+def cell(value):
+    """ Convert a decoded value to a CSV cell """
+    value = jsonable(value)
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, sort_keys=True)
+    elif PY2 and isinstance(value, text_type):
+        return value.encode('utf-8')
+    return value
+
+
+def decode_batch(args):
+    """ Worker: decode a buffer of records into JSON lines or CSV rows """
+    data, fmt = args
+    plan = SCHEMA.plan()
+    records = list()
+    if fmt == 'csv':
+        flat_plan = SCHEMA.flat_plan()
+        while data:
+            data, flat = flat_plan.decode(data, dict())
+            records.append([cell(flat.get(key)) for key in flat_plan.keys])
+    else:
+        while data:
+            data, dikt = plan.decode(data, dict())
+            records.append(json.dumps(jsonable(dikt), sort_keys=True))
+    return records
+
+
+def encode_batch(args):
+    """ Worker: encode JSON lines or CSV rows into one buffer """
+    records, fmt = args
+    chunks = list()
+    if fmt == 'csv':
+        flat_plan = SCHEMA.flat_plan()
+        tokens = dict(flatten(SCHEMA))
+        for row in records:
+            flat = dict((key, parse(tokens[key], text))
+                        for key, text in row.items())
+            chunks.append(flat_plan.encode(flat)[1])
+    else:
+        for line in records:
+            dikt = restore(SCHEMA, json.loads(line))
+            chunks.append(SCHEMA.plan().encode(dikt)[1])
+    return bytes().join(chunks)
+
+
+def record_end(plan, buffer, pos):
+    """
+    Return the end of the record starting at ``pos`` in ``buffer``. If the
+    buffer ends before the record, the returned end lies behind the buffer,
+    it is the number of bytes needed at least, or ``None`` if unknown yet.
+    Only running out of bytes is reported that way, other decode errors
+    are raised.
+    """
+    size, values = len(buffer), dict()
+    dependencies = plan.dependencies
+    for field in plan.fields:
+        if field.size is not None:
+            end = pos + field.size
+            if end > size:
+                return end
+            if field.name in dependencies:
+                plan.skip(field, buffer, pos, values)
+            pos = end
+            continue
+        end = token_end(field.token, buffer, pos, values)
+        if end is False:
+            try:
+                end = plan.skip(field, buffer, pos, values)
+            except struct.error: # unpacking behind the end of the buffer
+                return None
+        if end is None or end > size:
+            return end
+        pos = end
+    return pos
+
+
+def token_end(token, buffer, pos, values):
+    """
+    Like :py:func:`record_end` for a single ``token`` of variable size,
+    whose content is framed without decoding it. Returns ``False`` for
+    token, which must be decoded to find their end.
+    """
+    if isinstance(token, Struct):
+        return record_end(token.plan(), buffer, pos)
+    elif isinstance(token, Checksum):
+        end = token_end(token.wrapped, buffer, pos, values)
+        if end is False:
+            return False
+        return end if end is None else end + Integer.static_size(token)
+    elif isinstance(token, CString):
+        end = buffer.find(b'\x00', pos)
+        return None if end == -1 else end + 1
+    elif isinstance(token, (Static, Dynamic)) and \
+            isinstance(token.seqtype, Array) and \
+            token.seqtype.atype.static_size() is None:
+        atype = token.seqtype.atype
+        count = token.length if isinstance(token, Static) else \
+            values[token.len_name]
+        for i in range(count):
+            end = token_end(atype, buffer, pos, dict())
+            if end is False:
+                try:
+                    rest, _ = atype.decode(buffer[pos:], dict())
+                except struct.error:
+                    return None
+                end = len(buffer) - len(rest)
+            if end is None or end > len(buffer):
+                return end
+            pos = end
+        return pos
+    return False
+
+
+def iter_batches(struct_token, fileobj, batch_size=BATCH_SIZE):
+    """
+    Generator splitting the records in ``fileobj`` into buffers of up to
+    ``batch_size`` complete records. Fixed-size records are read directly,
+    variable-size records are framed with the struct's :py:class:`.Plan`,
+    without decoding fields of a known size. Structs with a
+    :py:class:`.Consumer` make up the whole stream, which is a single
+    record and therefore read at once.
+    """
+    plan = struct_token.plan()
+    if any(isinstance(field.token, Consumer) for field in plan.fields):
+        yield fileobj.read()
+        return
+    if plan.size:
+        while True:
+            data = fileobj.read(plan.size * batch_size)
+            if not data:
+                return
+            if len(data) % plan.size:
+                data += read_exactly(fileobj,
+                                     plan.size - len(data) % plan.size)
+            yield data
+    pending, eof = bytearray(), False
+    while True:
+        records, pos = 0, 0
+        while records < batch_size:
+            end = record_end(plan, pending, pos)
+            if end is not None and end <= len(pending):
+                records, pos = records + 1, end
+                continue
+            if eof:
+                break
+            # read at least up to the known end of the record at once
+            needed = CHUNK_SIZE if end is None else \
+                max(CHUNK_SIZE, end - len(pending))
+            while needed > 0:
+                chunk = fileobj.read(needed)
+                if not chunk:
+                    eof = True
+                    break
+                pending += chunk
+                needed -= len(chunk)
+        if pos:
+            yield bytes(pending[:pos])
+            del pending[:pos]
+        if eof and records < batch_size:
+            if pending:
+                raise ValueError('%d trailing bytes are no complete record'
+                                 % len(pending))
+            return
+
+
+def iter_lines(fileobj, fmt, batch_size=BATCH_SIZE):
+    """ Generator splitting JSON lines or CSV rows into batches """
+    if fmt == 'csv':
+        lines = csv.DictReader(fileobj)
+    else:
+        lines = (line for line in fileobj if line.strip())
+    batch = list()
+    for line in lines:
+        batch.append(line)
+        if len(batch) == batch_size:
+            yield batch
+            batch = list()
+    if batch:
+        yield batch
+
+
+def imap(pool, func, batches, window):
+    """
+    Like ``pool.imap``, but with at most ``window`` batches in flight, so
+    batches are not read faster than they are converted.
+    """
+    if pool is None:
+        for batch in batches:
+            yield func(batch)
+        return
+    pending = collections.deque()
+    for batch in batches:
+        pending.append(pool.apply_async(func, (batch,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+@contextlib.contextmanager
+def open_input(path, binary):
+    """ Open the input file ``path``, stdin stays open for ``'-'`` """
+    if path in (None, '-'):
+        yield getattr(sys.stdin, 'buffer', sys.stdin) if binary else sys.stdin
+    elif binary or PY2:
+        with open(path, 'rb') as fileobj:
+            yield fileobj
+    else:
+        with io.open(path, 'r', newline='', encoding='utf-8') as fileobj:
+            yield fileobj
+
+
+@contextlib.contextmanager
+def open_output(path, binary):
+    """ Open the output file ``path``, stdout stays open for ``'-'`` """
+    if path in (None, '-'):
+        stream = getattr(sys.stdout, 'buffer', sys.stdout) if binary else \
+            sys.stdout
+        yield stream
+        stream.flush()
+    elif binary or PY2:
+        with open(path, 'wb') as fileobj:
+            yield fileobj
+    else:
+        with io.open(path, 'w', newline='', encoding='utf-8') as fileobj:
+            yield fileobj
+
+
+class Stats(object):
+    """ Counts records and bytes of a conversion """
+
+    def __init__(self):
+        self.start = time.time()
+        self.records = 0
+        self.bytes = 0
+
+    def report(self, command, fileobj=None):
+        """ Print the statistics to ``fileobj``, defaults to stderr """
+        elapsed = max(time.time() - self.start, 1e-9)
+        print('%s: %d records, %d bytes in %.2f s (%.0f records/s, '
+              '%.2f MB/s)' % (command, self.records, self.bytes, elapsed,
+                              self.records / elapsed,
+                              self.bytes / elapsed / 1e6),
+              file=fileobj or sys.stderr)
+
+
+def decode(args, pool, stats):
+    """ Convert binary records to JSON lines or CSV """
+    with open_input(args.input, True) as fileobj, \
+            open_output(args.output, False) as output:
+        writer = csv.writer(output) if args.format == 'csv' else None
+        if writer is not None:
+            writer.writerow(SCHEMA.flat_plan().keys)
+
+        def batches():
+            for batch in iter_batches(SCHEMA, fileobj, args.batch):
+                stats.bytes += len(batch)
+                yield batch, args.format
+
+        for records in imap(pool, decode_batch, batches(), 2 * args.jobs):
+            stats.records += len(records)
+            if writer is not None:
+                writer.writerows(records)
+            else:
+                output.write('\n'.join(records) + '\n')
+
+
+def encode(args, pool, stats):
+    """ Convert JSON lines or CSV to binary records """
+    with open_input(args.input, False) as fileobj, \
+            open_output(args.output, True) as output:
+
+        def batches():
+            for batch in iter_lines(fileobj, args.format, args.batch):
+                stats.records += len(batch)
+                yield batch, args.format
+
+        for data in imap(pool, encode_batch, batches(), 2 * args.jobs):
+            stats.bytes += len(data)
+            output.write(data)
+
+
+COMMANDS = {'decode': decode, 'encode': encode}
+
+
+def parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m striptease',
+        description='Convert binary records to JSON Lines or CSV and back.')
+    parser.add_argument('command', choices=sorted(COMMANDS))
+    parser.add_argument('schema', help='the struct of the records, as '
+                        'module:attribute or path.py:attribute')
+    parser.add_argument('input', nargs='?', default='-',
+                        help='input file, defaults to stdin')
+    parser.add_argument('-o', '--output', default='-',
+                        help='output file, defaults to stdout')
+    parser.add_argument('-f', '--format', choices=['jsonl', 'csv'],
+                        default='jsonl', help='the text format')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of worker processes, 0 for one per '
+                        'CPU, defaults to 1')
+    parser.add_argument('-b', '--batch', type=int, default=BATCH_SIZE,
+                        help='records per batch, defaults to %d'
+                        % BATCH_SIZE)
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='do not print statistics')
+    return parser
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    load(args.schema)
+    if args.jobs == 0:
+        import multiprocessing
+        args.jobs = multiprocessing.cpu_count()
+    pool = None
+    if args.jobs > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(args.jobs, load, (args.schema,))
+    stats = Stats()
+    try:
+        COMMANDS[args.command](args, pool, stats)
+    finally:
+        if pool is not None:
+            pool.terminate()
+    if not args.quiet:
+        stats.report(args.command)
+    return 0
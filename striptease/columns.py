@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+    striptease.columns
+    ~~~~~~~~~~~~~~~~~~
+
+    Columnar batch decoding. Instead of decoding a buffer of records into one
+    dictionary per record, the requested fields of all records are decoded
+    into one compact column per field. Fields which are not requested are
+    skipped with the help of the struct's :py:class:`.Plan`.
+
+    :copyright: Copyright 2011 by the University of Paderborn
+    :license: BSD, see LICENSE for details
+"""
+
+import array
+import struct
+
+from striptease.numbers import plain_number
+from striptease.sequences import Consumer, String
+
+
+TYPECODES = {
+    'b': 'bhilq', 'h': 'bhilq', 'i': 'bhilq', 'l': 'bhilq', 'q': 'bhilq',
+    'B': 'BHILQ', 'H': 'BHILQ', 'I': 'BHILQ', 'L': 'BHILQ', 'Q': 'BHILQ',
+    'f': 'fd', 'd': 'fd',
+}
+
+
+def typecode(fmt, size):
+    """
+    Find the :py:mod:`array` typecode matching the :py:mod:`struct` format
+    ``fmt`` of a number with ``size`` bytes. Returns ``None`` if the platform
+    has no matching typecode.
+    """
+    for code in TYPECODES[fmt[-1]]:
+        try:
+            if array.array(code).itemsize == size:
+                return code
+        except ValueError: # typecode not supported by this python version
+            continue
+    return None
+
+
+class StringColumn(object):
+    """
+    A column of strings, stored as one shared bytestring ``data`` containing
+    all values back-to-back and an array of ``offsets``, where the ``i``-th
+    value is ``data[offsets[i]:offsets[i + 1]]``.
+    """
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class Column(object):
+    """
+    Collects the values of one field during decoding. Depending on the type
+    of the field, values go into an ``array.array``, a
+    :py:class:`.StringColumn` or a plain list.
+    """
+
+    def __init__(self, field):
+        self.field = field
+        self.string = isinstance(field.sequence, String)
+        self.parts = list()
+        self.values = None
+        if plain_number(field.token):
+            code = typecode(field.token.fmt(), field.size)
+            if code is not None:
+                self.values = array.array(code)
+        if self.values is None:
+            self.values = array.array('L', [0]) if self.string else list()
+
+    def finish(self):
+        if self.string:
+            return StringColumn(self.values, "".join(self.parts))
+        return self.values
+
+
+def fused_codec(plan, columns):
+    """
+    If the records have a static size and all requested fields are numbers of
+    the same byte-order, return a single ``struct.Struct`` which unpacks all
+    requested values of a record at once and skips the rest via pad bytes.
+    """
+    if plan.size is None:
+        return None
+    fields = sorted((c.field for c in columns), key=lambda f: f.offset)
+    if not all(plain_number(f.token) for f in fields):
+        return None
+    endians = set(f.token.endian for f in fields)
+    if len(endians) != 1 or '@' in endians:
+        return None
+    fmt, pos = [endians.pop()], 0
+    for field in fields:
+        if field.offset > pos:
+            fmt.append('%dx' % (field.offset - pos))
+        fmt.append(field.token.fmt()[1:])
+        pos = field.offset + field.size
+    return struct.Struct("".join(fmt)), [c for f in fields
+                                         for c in columns if c.field is f]
+
+
+def decode_columns(struct_token, buffer, fields=None):
+    """
+    Decode ``buffer`` containing back-to-back encoded records of
+    ``struct_token`` and return a dict, mapping the name of every field in
+    ``fields`` to a column of its values:
+
+    * numbers are collected in an ``array.array`` of the matching type, which
+      can be handed to ``numpy.frombuffer`` without copying,
+    * strings are collected in a :py:class:`.StringColumn`,
+    * all other fields are decoded into a list.
+
+    Fields which are not requested are skipped via their precomputed offsets.
+    Only length fields of :py:class:`.Dynamic` sequences are decoded for
+    skipping. If ``fields`` is ``None``, all fields are decoded.
+
+    .. note::
+        Structs containing a :py:class:`.Consumer` can't be decoded
+        column-wise, since their records can not be delimited.
+    """
+    plan = struct_token.plan()
+    for field in plan.fields:
+        if isinstance(field.token, Consumer):
+            raise ValueError('Cannot delimit records of a struct containing '
+                             'the consumer %s' % field.name)
+    if fields is None:
+        fields = [field.name for field in plan.fields]
+    columns = [Column(plan[name]) for name in fields]
+    fused = fused_codec(plan, columns)
+    index = dict((field.name, i) for i, field in enumerate(plan.fields))
+    end = len(buffer)
+    pos = records = 0
+
+    if fused is not None:
+        codec, ordered = fused
+        appends = [column.values.append for column in ordered]
+        while pos < end:
+            for append, value in zip(appends, codec.unpack_from(buffer, pos)):
+                append(value)
+            pos += plan.size
+        records = pos // plan.size
+    else:
+        last = len(plan.fields) - 1
+        while pos < end:
+            positions, stop, values = plan.locate(buffer, pos)
+            for column in columns:
+                i = index[column.field.name]
+                start = positions[i]
+                field = column.field
+                if field.codec is not None:
+                    column.values.append(field.codec.unpack_from(buffer,
+                                                                 start)[0])
+                    continue
+                data = buffer[start:stop if i == last else positions[i + 1]]
+                if column.string:
+                    value = field.sequence.unpad(data)
+                    column.parts.append(value)
+                    column.values.append(column.values[-1] + len(value))
+                else:
+                    _values = dict(values)
+                    field.token.decode(data, _values)
+                    column.values.append(_values.get(field.name))
+            pos = stop
+            records += 1
+
+    metrics = getattr(struct_token, 'metrics', None)
+    if metrics is not None:
+        metrics.add(decoded=records, bytes_in=pos)
+    return dict((name, column.finish()) for name, column in zip(fields,
+                                                                columns))
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""
+    striptease.compact
+    ~~~~~~~~~~~~~~~~~~
+
+    Compact encodings for arrays of integers which change slowly, like
+    timestamps or sensor samples. Both token are :py:class:`Sequences
+    <.Sequence>`, so they are wrapped by a :py:class:`.Static`,
+    :py:class:`.Dynamic` or :py:class:`.Consumer` length-specifier, whose
+    length is the number of *elements*, just like for an :py:class:`.Array`.
+
+    :py:class:`.DeltaArray`:
+            stores the first element with its full width, followed by the
+            differences between successive elements as narrower integers.
+            The encoded size only depends on the number of elements.
+
+    :py:class:`.RLEArray`:
+            stores runs of equal elements as pairs of a repeat count and the
+            element. The encoded size depends on the data.
+
+    >>> from striptease import Struct, Static, Integer
+    >>> from striptease.compact import DeltaArray, RLEArray
+    >>> struct = Struct().append(
+    ...     Static(4, DeltaArray('time').of(Integer('', False, 4))),
+    ...     Static(4, RLEArray('level').of(Integer('', True, 2))),
+    ... )
+    >>> payload = struct.encode({'time': [1000, 1001, 1003, 1002],
+    ...                          'level': [7, 7, 7, -1]})[1]
+    >>> len(payload)
+    13
+    >>> struct.decode(payload, dict())[1]['time']
+    [1000, 1001, 1003, 1002]
+
+    If NumPy is installed, arrays of at least :py:data:`NUMPY_THRESHOLD`
+    elements are en- and decoded vectorized, otherwise a loop over
+    precompiled ``struct.Struct`` formats is used. Both yield the same
+    payload and decode into lists of ints.
+
+    :copyright: Copyright 2011 by the University of Paderborn
+    :license: BSD, see LICENSE for details
+"""
+
+import struct
+import itertools
+
+from striptease.numbers import Integer
+from striptease.sequences import Sequence
+from striptease.util import logged
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+#: Arrays with fewer elements are not worth converting to NumPy arrays
+NUMPY_THRESHOLD = 64
+
+NUMPY_ENDIAN = {'@': '=', '=': '=', '<': '<', '>': '>', '!': '>'}
+
+
+def bounds(token):
+    """ The smallest and largest value of the integer ``token`` """
+    bits = 8 * token.static_size()
+    if token.sign:
+        return -(1 << (bits - 1)), (1 << (bits - 1)) - 1
+    return 0, (1 << bits) - 1
+
+
+def dtype(token, endian=None):
+    """ The NumPy dtype of the integer ``token`` """
+    return numpy.dtype('%s%s%d' % (NUMPY_ENDIAN[endian or token.endian],
+                                   'i' if token.sign else 'u',
+                                   token.static_size()))
+
+
+def vectorized(length, token=None):
+    """
+    Whether to use NumPy for ``length`` elements. Values of unsigned 64 bit
+    ``token`` may exceed the ``int64`` NumPy accumulates in.
+    """
+    if token is not None and token.static_size() == 8 and not token.sign:
+        return False
+    return numpy is not None and length >= NUMPY_THRESHOLD
+
+
+class CompactArray(Sequence):
+    """
+    Abstract base class of compact integer arrays. Like for an
+    :py:class:`.Array`, the type of the elements is specified via
+    :py:meth:`of`, which must be an :py:class:`.Integer`.
+    """
+
+    def __init__(self, name):
+        Sequence.__init__(self)
+        self.name = name
+        self.atype = None
+
+    def of(self, atype):
+        """
+        Specify the type of the elements, returns ``self``.
+
+        :param atype: an instance of :py:class:`.Integer`
+        """
+        if not isinstance(atype, Integer):
+            raise TypeError('%s only supports integer elements, not %r'
+                            % (type(self).__name__, atype))
+        self.atype = atype
+        self.atype.parent = self
+        return self
+
+    def children(self):
+        return [self.atype] if self.atype else []
+
+    def values(self, length, dikt):
+        """ The value of the array in ``dikt``, checked against ``length`` """
+        data = dikt[self.name]
+        if length != -1 and not self.trusted:
+            assert len(data) == length
+        return data
+
+
+@logged()
+class DeltaArray(CompactArray):
+    """
+    An array of integers, which is encoded as its first element followed by
+    the differences between successive elements. Differences must fit into
+    the ``delta`` type, otherwise encoding raises a ``ValueError``.
+
+    :param name: the token's name
+    :param delta: (optional) the :py:class:`.Integer` token of the
+                  differences, defaults to a signed 8 bit integer in the
+                  byte order of the elements.
+    """
+
+    def __init__(self, name, delta=None):
+        CompactArray.__init__(self, name)
+        self.delta = delta
+
+    def delta_type(self):
+        if self.delta is not None:
+            return self.delta
+        return Integer('', True, 1, self.atype.endian)
+
+    def formats(self, length):
+        """ The ``struct`` formats of the first element and the deltas """
+        delta = self.delta_type()
+        return (self.atype.fmt(),
+                delta.endian + '%d%s' % (length - 1, delta.fmt()[-1]))
+
+    def deltas(self, data):
+        """ Compute the differences of successive elements in ``data`` """
+        low, high = bounds(self.delta_type())
+        if vectorized(len(data), self.atype):
+            deltas = numpy.diff(numpy.asarray(data, dtype=numpy.int64))
+            if len(deltas) and (deltas.min() < low or deltas.max() > high):
+                raise ValueError('Deltas of %s exceed the range %d..%d'
+                                 % (self.name, low, high))
+            return deltas.astype(dtype(self.delta_type()))
+        deltas = [b - a for a, b in zip(data, data[1:])]
+        if deltas and (min(deltas) < low or max(deltas) > high):
+            raise ValueError('Deltas of %s exceed the range %d..%d'
+                             % (self.name, low, high))
+        return deltas
+
+    def encode(self, length, dikt, payload=""):
+        data = self.values(length, dikt)
+        if not len(data):
+            return dikt, payload
+        first, rest = self.formats(len(data))
+        deltas = self.deltas(data)
+        if numpy is not None and isinstance(deltas, numpy.ndarray):
+            packed = deltas.tobytes()
+        else:
+            packed = struct.pack(rest, *deltas)
+        return dikt, payload + struct.pack(first, data[0]) + packed
+
+    def count(self, payload):
+        """ The number of elements encoded in all of ``payload`` """
+        if not len(payload):
+            return 0
+        size, dsize = self.atype.static_size(), self.delta_type().static_size()
+        if (len(payload) - size) % dsize:
+            raise ValueError('%d bytes are no complete %s'
+                             % (len(payload), self.name))
+        return 1 + (len(payload) - size) // dsize
+
+    def decode(self, length, payload, dikt):
+        if length == -1: # consumer case
+            length = self.count(payload)
+        if length == 0:
+            dikt[self.name] = []
+            return payload, dikt
+        size = self.static_size(length)
+        first, rest = self.formats(length)
+        value = struct.unpack_from(first, payload)[0]
+        offset = self.atype.static_size()
+        if vectorized(length, self.atype):
+            deltas = numpy.frombuffer(payload, dtype(self.delta_type()),
+                                      length - 1, offset)
+            array = numpy.empty(length, numpy.int64)
+            array[0] = value
+            numpy.cumsum(deltas, out=array[1:])
+            array[1:] += value
+            array = array.tolist()
+        else:
+            array = [value] * length
+            for i, delta in enumerate(struct.unpack_from(rest, payload,
+                                                         offset)):
+                value += delta
+                array[i + 1] = value
+        dikt[self.name] = array
+        return payload[size:], dikt
+
+    def static_size(self, length=1):
+        if length == 0:
+            return 0
+        return self.atype.static_size() + \
+            (length - 1) * self.delta_type().static_size()
+
+
+@logged()
+class RLEArray(CompactArray):
+    """
+    An array of integers, which is encoded as runs of equal elements: pairs
+    of a repeat count and the element, both in the byte order of the
+    elements. Runs longer than the largest count are split.
+
+    :param name: the token's name
+    :param count: (optional) the :py:class:`.Integer` token of the repeat
+                  counts, defaults to an unsigned 8 bit integer.
+    """
+
+    def __init__(self, name, count=None):
+        CompactArray.__init__(self, name)
+        self.count = count
+
+    def count_type(self):
+        if self.count is not None:
+            return self.count
+        return Integer('', False, 1, self.atype.endian)
+
+    def pair(self, runs=1):
+        """ The ``struct`` format of ``runs`` pairs of count and element """
+        return self.atype.endian + runs * (self.count_type().fmt()[-1] +
+                                           self.atype.fmt()[-1])
+
+    def pair_dtype(self):
+        endian = self.atype.endian
+        return numpy.dtype([('count', dtype(self.count_type(), endian)),
+                            ('value', dtype(self.atype))])
+
+    def runs(self, data):
+        """
+        Split ``data`` into runs, returns the list of the counts and the
+        list of the elements.
+        """
+        limit = bounds(self.count_type())[1]
+        counts, values = list(), list()
+        for value, run in itertools.groupby(data):
+            run = sum(1 for _ in run)
+            while run > 0:
+                counts.append(min(run, limit))
+                values.append(value)
+                run -= limit
+        return counts, values
+
+    def encode_vectorized(self, data):
+        limit = bounds(self.count_type())[1]
+        data = numpy.asarray(data)
+        starts = numpy.flatnonzero(data[1:] != data[:-1]) + 1
+        starts = numpy.concatenate(([0], starts))
+        lengths = numpy.diff(numpy.concatenate((starts, [len(data)])))
+        # split runs exceeding the largest count
+        pieces = (lengths + limit - 1) // limit
+        pairs = numpy.empty(pieces.sum(), self.pair_dtype())
+        pairs['count'] = limit
+        last = numpy.cumsum(pieces) - 1
+        pairs['count'][last] = lengths - (pieces - 1) * limit
+        pairs['value'] = numpy.repeat(data[starts], pieces)
+        return pairs.tobytes()
+
+    def encode(self, length, dikt, payload=""):
+        data = self.values(length, dikt)
+        if not len(data):
+            return dikt, payload
+        if vectorized(len(data)):
+            return dikt, payload + self.encode_vectorized(data)
+        counts, values = self.runs(data)
+        pairs = [None] * (2 * len(counts))
+        pairs[::2], pairs[1::2] = counts, values
+        return dikt, payload + struct.pack(self.pair(len(counts)), *pairs)
+
+    def decode_vectorized(self, length, payload):
+        """
+        Decode ``length`` elements, returns the elements and the size of
+        their pairs in ``payload``.
+        """
+        dtype = self.pair_dtype()
+        runs = len(payload) // dtype.itemsize
+        if length != -1:
+            runs = min(runs, length) # every run has at least one element
+        pairs = numpy.frombuffer(payload, dtype, runs)
+        counts = numpy.cumsum(pairs['count'], dtype=numpy.int64)
+        if length != -1:
+            runs = int(numpy.searchsorted(counts, length)) + 1
+            if runs > len(counts) or counts[runs - 1] != length:
+                raise ValueError('Runs of %s do not add up to %d elements'
+                                 % (self.name, length))
+            pairs = pairs[:runs]
+        array = numpy.repeat(pairs['value'], pairs['count']).tolist()
+        return array, runs * dtype.itemsize
+
+    def decode(self, length, payload, dikt):
+        pair = struct.Struct(self.pair())
+        if length == -1 and len(payload) % pair.size:
+            raise ValueError('%d bytes are no complete %s'
+                             % (len(payload), self.name))
+        if vectorized(length if length != -1 else len(payload) // pair.size):
+            array, size = self.decode_vectorized(length, payload)
+            dikt[self.name] = array
+            return payload[size:], dikt
+        array, pos = list(), 0
+        end = len(payload) if length == -1 else None
+        while pos != end and len(array) != length:
+            count, value = pair.unpack_from(payload, pos)
+            if length != -1 and count > length - len(array):
+                raise ValueError('Runs of %s do not add up to %d elements'
+                                 % (self.name, length))
+            array.extend(itertools.repeat(value, count))
+            pos += pair.size
+        dikt[self.name] = array
+        return payload[pos:], dikt
+
+    def static_size(self, length=1):
+        return None
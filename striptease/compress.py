@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+    striptease.compress
+    ~~~~~~~~~~~~~~~~~~~
+
+    A token compressing the encoded data of its child. Like a
+    :py:class:`.Checksum`, :py:class:`.Compressed` wraps a child token: on
+    encoding the child's data is compressed, on decoding it is decompressed
+    before the child decodes it.
+
+    The child's data is streamed chunk by chunk through the compressor, so
+    a large child never exists as a whole, uncompressed payload. Likewise,
+    a struct whose fields have static sizes or are :py:class:`.Dynamic`
+    sequences is decoded field by field while it is decompressed. Data
+    smaller than ``threshold`` is stored raw.
+
+    The compressed data is preceded by a header of a flag byte, which is
+    ``1`` for compressed and ``0`` for raw data, and the length of the
+    following data as an unsigned 32 bit integer in network byte order.
+
+    :copyright: Copyright 2011 by the University of Paderborn
+    :license: BSD, see LICENSE for details
+"""
+
+import struct
+import itertools
+
+from striptease.base import Token, Struct, as_bytes, chunk_size, decode_token
+from striptease.sequences import Dynamic
+from striptease.stream import decode_stream, CHUNK_SIZE
+from striptease.util import logged, window
+
+
+#: Encoded data smaller than this is stored raw by default
+COMPRESS_THRESHOLD = 512
+
+HEADER = struct.Struct('!BI')
+
+RAW, COMPRESSED = 0, 1
+
+
+def codec(name, level=None):
+    """
+    Return a pair of factories ``(compressor, decompressor)`` for the
+    streaming compression ``codec``, one of ``'zlib'``, ``'bz2'`` and
+    ``'lzma'``. The respective module is imported on demand, ``lzma``
+    requires Python 3.3 or the ``backports.lzma`` package.
+    """
+    if name == 'zlib':
+        import zlib
+        level = -1 if level is None else level
+        return lambda: zlib.compressobj(level), zlib.decompressobj
+    elif name == 'bz2':
+        import bz2
+        level = 9 if level is None else level
+        return lambda: bz2.BZ2Compressor(level), bz2.BZ2Decompressor
+    elif name == 'lzma':
+        try:
+            import lzma
+        except ImportError:
+            from backports import lzma
+        return (lambda: lzma.LZMACompressor(preset=level),
+                lzma.LZMADecompressor)
+    raise ValueError('Unknown compression codec %r' % name)
+
+
+@logged()
+class Compressed(Token):
+    """
+    Compresses the encoded data of ``child`` with ``codec``, see
+    :py:func:`codec`. The token takes the name of its child.
+
+    :param child: the token whose data is compressed
+    :param codec: (optional) the compression codec, defaults to ``'zlib'``
+    :param threshold: (optional) encoded data smaller than ``threshold``
+                      bytes is stored raw, defaults to
+                      :py:data:`COMPRESS_THRESHOLD`
+    :param level: (optional) the compression level, defaults to the
+                  codec's default
+    """
+
+    takes_trusted = True
+
+    def __init__(self, child, codec='zlib', threshold=COMPRESS_THRESHOLD,
+                 level=None):
+        if isinstance(child, Dynamic):
+            raise TypeError('Cannot compress the dynamic sequence %s, wrap '
+                            'it in a Struct with its length field'
+                            % child.name)
+        Token.__init__(self)
+        self.codec = codec
+        self.threshold = threshold
+        self.level = level
+        self.wrapped = child
+        self.wrapped.parent = self
+
+    @property
+    def name(self):
+        return self.wrapped.name
+
+    def children(self):
+        return [self.wrapped]
+
+    def compress(self, chunks):
+        """
+        Return the flag and the list of chunks to store for the encoded data
+        ``chunks``. Chunks are buffered until ``threshold`` is reached, from
+        then on they are passed through the compressor.
+        """
+        pending, size = list(), 0
+        rest = iter(chunks)
+        for chunk in rest:
+            pending.append(chunk)
+            size += chunk_size(chunk)
+            if size >= self.threshold:
+                break
+        else:
+            return RAW, pending
+        compressor = codec(self.codec, self.level)[0]()
+        compressed = list()
+        for chunk in itertools.chain(pending, rest):
+            data = compressor.compress(as_bytes(chunk))
+            if data:
+                compressed.append(data)
+        compressed.append(compressor.flush())
+        return COMPRESSED, compressed
+
+    def iter_encode(self, dikt):
+        """
+        Yield the header and the compressed data of the child, which is
+        encoded via its ``iter_encode``.
+        """
+        flag, chunks = self.compress(self.wrapped.iter_encode(dikt))
+        yield HEADER.pack(flag, sum(chunk_size(c) for c in chunks))
+        for chunk in chunks:
+            yield chunk
+
+    def encode(self, dikt, payload=""):
+        chunks = [payload]
+        for chunk in self.iter_encode(dikt):
+            chunks.append(as_bytes(chunk))
+        return dikt, "".join(chunks)
+
+    def decompress(self, payload, pos, length):
+        """
+        Generator decompressing the ``length`` bytes at ``pos`` in
+        ``payload``, which are fed to the decompressor in chunks of at most
+        :py:data:`CHUNK_SIZE <striptease.stream.CHUNK_SIZE>` bytes without
+        copying them. Yields the decompressed chunks.
+        """
+        decompressor = codec(self.codec)[1]()
+        end = pos + length
+        while pos < end:
+            data = decompressor.decompress(
+                window(payload, pos, min(pos + CHUNK_SIZE, end)))
+            if data:
+                yield data
+            pos += CHUNK_SIZE
+        flush = getattr(decompressor, 'flush', None)
+        if flush is not None:
+            data = flush()
+            if data:
+                yield data
+
+    def streamed(self):
+        """
+        Whether the child is a struct, which is decoded field by field
+        straight from the decompressor, see :py:func:`.decode_stream`.
+        Every field must have a static size or be a :py:class:`.Dynamic`
+        sequence of elements with a static size.
+        """
+        if type(self.wrapped) != Struct:
+            return False
+        for field in self.wrapped.plan().fields:
+            if field.size is None and not (
+                    isinstance(field.token, Dynamic) and
+                    field.token.seqtype.static_size() is not None):
+                return False
+        return True
+
+    def decode(self, payload, dikt, trusted=False):
+        flag, length = HEADER.unpack_from(payload)
+        pos = HEADER.size
+        if flag == COMPRESSED:
+            chunks = self.decompress(payload, pos, length)
+            if self.streamed():
+                reader = Reader(chunks)
+                dikt[self.name] = decode_stream(self.wrapped, reader,
+                                                trusted=trusted)
+                data = reader.read()
+            else:
+                data, dikt = decode_token(self.wrapped, "".join(chunks), dikt,
+                                          trusted)
+        elif flag == RAW:
+            data, dikt = decode_token(self.wrapped,
+                                      payload[pos:pos + length], dikt,
+                                      trusted)
+        else:
+            raise ValueError('Invalid compression flag %d for %s'
+                             % (flag, self.name))
+        if data:
+            self.logger.warning("%d bytes left after decompressing %s",
+                                len(data), self.name)
+        return payload[pos + length:], dikt
+
+
+class Reader(object):
+    """ A file-like object reading from an iterator over ``chunks`` """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.chunk = ""
+        self.pos = 0
+
+    def read(self, size=-1):
+        pieces = list()
+        while size:
+            if self.pos == len(self.chunk):
+                self.chunk, self.pos = next(self.chunks, ""), 0
+                if not self.chunk:
+                    break
+            end = len(self.chunk) if size < 0 else \
+                min(len(self.chunk), self.pos + size)
+            pieces.append(self.chunk[self.pos:end])
+            if size > 0:
+                size -= end - self.pos
+            self.pos = end
+        return "".join(pieces)
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+    striptease.conditional
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Token for fields which are only present in the payload, if preceding
+    fields say so, e.g. a flag bit or a version field:
+
+    >>> from striptease import Struct, uint8, uint16
+    >>> from striptease.conditional import If
+    >>> struct = Struct().append(
+    ...     uint8('flags'),
+    ...     If('flags', 0x01, uint16('seq'), mask=0x01),
+    ...     uint8('data'),
+    ... )
+    >>> struct.encode({'flags': 0, 'data': 7})[1]
+    '\\x00\\x07'
+    >>> struct.decode('\\x01\\x00\\x02\\x07', dict())[1]['seq']
+    2
+
+    The condition is evaluated on the values decoded so far, so the
+    surrounding struct is decoded in a single pass. Within a
+    :py:class:`.Plan`, conditional fields are variable-size token, hence the
+    numbers in front of and behind them are still fused into runs.
+
+    :copyright: Copyright 2011 by the University of Paderborn
+    :license: BSD, see LICENSE for details
+"""
+
+from striptease.base import Token, decode_token
+
+
+class Optional(Token):
+    """
+    Wraps ``token``, which is only en- and decoded if ``when(dikt)`` returns
+    ``True``, where ``dikt`` holds the values of the enclosing struct, as far
+    as they are decoded yet. If the condition is false, the value of
+    ``token`` is neither encoded nor stored in ``dikt`` when decoding. The
+    token takes the name of the wrapped token.
+
+    :param token: the conditional token
+    :param when: a callable getting the values of the enclosing struct
+    :param fields: (optional) the names of the fields ``when`` reads. Plans
+                   decode only these fields to skip the token, by default
+                   all preceding fields are decoded.
+    """
+
+    takes_trusted = True
+
+    def __init__(self, token, when, fields=None):
+        Token.__init__(self)
+        self.wrapped = token
+        self.when = when
+        self.fields = fields
+
+    @property
+    def name(self):
+        return self.wrapped.name
+
+    @property
+    def parent(self):
+        return self.wrapped.parent
+
+    @parent.setter
+    def parent(self, parent):
+        """
+        The wrapped token is a direct child of the enclosing struct, so e.g.
+        :py:class:`.Dynamic` sequences find their length field.
+        """
+        self.wrapped.parent = parent
+
+    def children(self):
+        return [self.wrapped]
+
+    def present(self, dikt):
+        """ Check whether the token is present for the values ``dikt`` """
+        return bool(self.when(dikt))
+
+    def encode(self, dikt, payload=""):
+        if not self.present(dikt):
+            return dikt, payload
+        return self.wrapped.encode(dikt, payload)
+
+    def iter_encode(self, dikt):
+        if not self.present(dikt):
+            return iter(())
+        return self.wrapped.iter_encode(dikt)
+
+    def decode(self, payload, dikt, trusted=False):
+        if not self.present(dikt):
+            return payload, dikt
+        return decode_token(self.wrapped, payload, dikt, trusted)
+
+    def size(self, dikt):
+        """
+        The size of the token for the values ``dikt``, which is ``0`` if the
+        token is absent, or ``None`` if it depends on the token's data.
+        """
+        if not self.present(dikt):
+            return 0
+        len_name = getattr(self.wrapped, 'len_name', None)
+        if len_name is not None: # a dynamic sequence
+            return self.wrapped.seqtype.static_size(dikt[len_name])
+        return self.wrapped.static_size()
+
+    def static_size(self):
+        return None
+
+
+class If(Optional):
+    """
+    An :py:class:`.Optional` ``token``, which is present if the field
+    ``field`` of the enclosing struct equals ``value``. With ``mask``, the
+    field is masked before comparing, so ``If('flags', 0x04, token,
+    mask=0x04)`` tests a single flag bit.
+    """
+
+    def __init__(self, field, value, token, mask=None):
+        self.field = field
+        self.value = value
+        self.mask = mask
+        Optional.__init__(self, token, self.test, (field,))
+
+    def test(self, dikt):
+        value = dikt[self.field]
+        if self.mask is not None:
+            value &= self.mask
+        return value == self.value
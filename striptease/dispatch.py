@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+    striptease.dispatch
+    ~~~~~~~~~~~~~~~~~~~
+
+    Routing of framed messages to their structs. Protocols often prefix
+    every message with a header of fixed size, holding a message type and
+    the length of the body. A :py:class:`.Dispatcher` reads both directly at
+    their offsets in the header, without decoding it into a dict, looks up
+    the compiled :py:class:`.Plan` of the body and decodes the body straight
+    into the attributes of a new message object:
+
+    >>> from striptease import Struct, uint8, uint16
+    >>> from striptease.dispatch import Dispatcher
+    >>> class Ping(object):
+    ...     pass
+    >>> dispatcher = Dispatcher(Struct().append(uint8('msg_id'),
+    ...                                         uint16('length')))
+    >>> dispatcher.register(0x01, Struct().append(uint8('ttl')), Ping)
+    >>> message = dispatcher.decode('\\x01\\x00\\x01\\x40')
+    >>> type(message).__name__, message.ttl
+    ('Ping', 64)
+
+    :copyright: Copyright 2011 by the University of Paderborn
+    :license: BSD, see LICENSE for details
+"""
+
+from functools import partial
+
+
+class Dispatcher(object):
+    """
+    Dispatches messages by the field ``key`` of their ``header``, which must
+    be a :py:class:`.Struct` with a static size.
+
+    :param header: the struct preceding every message body
+    :param key: (optional) the name of the number in the header, which
+                identifies the type of the message, defaults to ``'msg_id'``
+    :param length: (optional) the name of the number in the header holding
+                   the length of the body in bytes, defaults to
+                   ``'length'``. Pass ``None`` if the header has no length.
+    """
+
+    def __init__(self, header, key='msg_id', length='length'):
+        plan = header.plan()
+        if plan.size is None:
+            raise ValueError('The header must have a static size')
+        self.header = header
+        self.size = plan.size
+        self.key = key
+        self.length = length
+        self.key_codec, self.key_offset = self.number(plan, key)
+        if length is not None:
+            self.length_codec, self.length_offset = self.number(plan, length)
+        self.routes = dict()
+
+    @staticmethod
+    def number(plan, name):
+        """ The codec and offset of the number ``name`` in the header """
+        if name not in plan or plan[name].codec is None:
+            raise ValueError('The header has no number %r' % name)
+        return plan[name].codec, plan[name].offset
+
+    def register(self, value, struct_token, factory=dict):
+        """
+        Route messages whose ``key`` equals ``value`` to ``struct_token``.
+        Bodies are decoded into a new ``factory()``, which is either a dict
+        or an object, whose attributes are set. ``struct_token`` may also be
+        a :py:class:`.Record` class, whose instances are decoded by its
+        compiled codec.
+        """
+        if value in self.routes:
+            raise LookupError('Message %r already routed to %r'
+                              % (value, self.routes[value][1]))
+        if isinstance(struct_token, type): # a record class
+            self.routes[value] = (struct_token.CODEC,
+                                  partial(struct_token.__new__, struct_token))
+        else:
+            self.routes[value] = (struct_token.plan(), factory)
+
+    def peek(self, payload, pos=0):
+        """
+        Return the key and the length of the body of the message at ``pos``
+        in ``payload``, or ``None`` if the header is incomplete. The length
+        is ``None`` if the header has none.
+        """
+        if len(payload) - pos < self.size:
+            return None
+        key = self.key_codec.unpack_from(payload, pos + self.key_offset)[0]
+        if self.length is None:
+            return key, None
+        return key, self.length_codec.unpack_from(
+            payload, pos + self.length_offset)[0]
+
+    def frame(self, payload, pos=0):
+        """
+        Return the position behind the message at ``pos`` in ``payload``,
+        or ``None`` if the message is incomplete yet. Requires a length in
+        the header, so a stream of messages can be split.
+        """
+        peeked = self.peek(payload, pos)
+        if peeked is None:
+            return None
+        end = pos + self.size + peeked[1]
+        return end if end <= len(payload) else None
+
+    def decode(self, payload, pos=0, end=None):
+        """
+        Decode the message at ``pos`` in ``payload``, which ends at ``end``,
+        by default at the end of ``payload``. Raises a ``ValueError`` for
+        unknown keys or if the length in the header doesn't match.
+        """
+        peeked = self.peek(payload, pos)
+        if peeked is None:
+            raise ValueError('Incomplete header of %d bytes'
+                             % (len(payload) - pos))
+        key, length = peeked
+        try:
+            plan, factory = self.routes[key]
+        except KeyError:
+            raise ValueError('No message registered for %s %r'
+                             % (self.key, key))
+        start = pos + self.size
+        if end is None:
+            end = len(payload)
+        if length is not None and end - start != length:
+            raise ValueError('Message length is %d, %d expected'
+                             % (end - start, length))
+        message = factory()
+        target = message if isinstance(message, dict) else \
+            getattr(message, '__dict__', message) # records have slots
+        plan.decode(payload[start:end], target)
+        return message
+
+    def encode(self, value, message):
+        """
+        Encode ``message``, a dict or an object, as body of the messages
+        routed by ``value`` and prepend the header.
+        """
+        plan = self.routes[value][0]
+        source = message if isinstance(message, dict) else \
+            getattr(message, '__dict__', message)
+        dikt, body = plan.encode(source)
+        header = {self.key: value}
+        if self.length is not None:
+            header[self.length] = len(body)
+        dikt, header = self.header.encode(header)
+        return header + body
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+    striptease.flat
+    ~~~~~~~~~~~~~~~
+
+    Flat en- and decoding of nested structs. Instead of one dictionary per
+    nesting level, all values live in a single dictionary under dotted keys,
+    e.g. ``'baz.moo'`` for the field ``moo`` of the inner struct ``baz``.
+
+    A :py:class:`.FlatPlan` flattens the token tree once, so nesting costs
+    nothing during en- and decoding. Since nested structs disappear, runs of
+    numbers are fused across struct boundaries. Structs within a
+    :py:class:`.Checksum` or an :py:class:`.Optional` are flattened as
+    well, the checksum is computed over the flattened fields.
+
+    :copyright: Copyright 2011 by the University of Paderborn
+    :license: BSD, see LICENSE for details
+"""
+
+import struct
+
+from striptease.base import Padding, Struct, decode_token
+from striptease.checksum import Checksum, ChecksumError
+from striptease.conditional import Optional
+from striptease.plan import fusable
+from striptease.sequences import Dynamic
+
+
+def walk(tokens, sep='.', prefix=''):
+    """
+    Yield ``(kind, key, token)`` for ``tokens`` and all token nested within,
+    where ``key`` is the dotted path of the token. Leaf token are of kind
+    ``'leaf'``. The children of a :py:class:`.Checksum` are enclosed by a
+    ``'begin'`` and a ``'checksum'`` item, an :py:class:`.Optional` struct
+    by an ``'optional'`` and an ``'end'`` item.
+    """
+    for token in tokens:
+        key = prefix + str(token.name)
+        if type(token) == Struct:
+            for item in walk(token.structure, sep, key + sep):
+                yield item
+        elif isinstance(token, Checksum) and token.wrapped is not None:
+            yield 'begin', key, token
+            for item in walk([token.wrapped], sep, prefix):
+                yield item
+            yield 'checksum', key, token
+        elif isinstance(token, Optional) and type(token.wrapped) == Struct:
+            yield 'optional', key, token
+            for item in walk([token.wrapped], sep, prefix):
+                yield item
+            yield 'end', key, token
+        else:
+            yield 'leaf', key, token
+
+
+def flatten(struct_token, sep='.', prefix=''):
+    """
+    Return a list of ``(key, token)`` for all leaf token of ``struct_token``
+    and its nested structs, where ``key`` is the dotted path of the token.
+    Checksums are leaves too, their children are flattened.
+    """
+    return [(key, token) for kind, key, token
+            in walk(struct_token.structure, sep, prefix)
+            if kind in ('leaf', 'checksum')]
+
+
+class FlatPlan(object):
+    """
+    The flattened and compiled token tree of a :py:class:`.Struct`. ``keys``
+    lists the dotted keys of all fields in order of appearance, so a flat
+    dictionary can be turned into a tuple via
+    ``tuple(flat[key] for key in plan.keys)``.
+    """
+
+    def __init__(self, struct_token, sep='.'):
+        self.sep = sep
+        leaves = flatten(struct_token, sep)
+        self.keys = [key for key, token in leaves
+                     if not isinstance(token, Padding)]
+        # length-field key -> (dynamic token, key of the sequence)
+        self.lengths = dict()
+        for key, token in leaves:
+            if isinstance(token, Optional):
+                token = token.wrapped
+            if isinstance(token, Dynamic):
+                prefix = key[:len(key) - len(str(token.name))]
+                self.lengths[prefix + token.len_name] = (token, key)
+        self.steps = list()
+        run = list()
+        optionals = list() # indices of the steps of open optional structs
+        for kind, key, token in walk(struct_token.structure, sep):
+            if run and (kind != 'leaf' or not self.fits(run, token)):
+                self.steps.append(self.fuse(run))
+                run = list()
+            if kind == 'leaf' and fusable(token):
+                run.append((key, token))
+            elif kind == 'leaf':
+                self.steps.append(('token', key, token))
+            elif kind == 'optional':
+                optionals.append(len(self.steps))
+                self.steps.append(None) # set once its end is known
+            elif kind == 'end':
+                # an absent optional struct skips to its end
+                self.steps[optionals.pop()] = ('optional',
+                                               (key, len(self.steps)), token)
+                self.steps.append(('end', key, token))
+            else:
+                self.steps.append((kind, key, token))
+        if run:
+            self.steps.append(self.fuse(run))
+
+    @classmethod
+    def fits(cls, run, token):
+        """ Check whether ``token`` can be fused into ``run`` """
+        if not fusable(token):
+            return False
+        endian = cls.endian(run)
+        return isinstance(token, Padding) or endian in (None, token.endian)
+
+    @staticmethod
+    def endian(run):
+        for key, token in run:
+            if not isinstance(token, Padding):
+                return token.endian
+        return None
+
+    @classmethod
+    def fuse(cls, run):
+        fmt = [cls.endian(run) or '!']
+        for key, token in run:
+            if isinstance(token, Padding):
+                fmt.append('%ds' % len(token.padd))
+            else:
+                fmt.append(token.fmt()[1:])
+        return ('run', struct.Struct("".join(fmt)), run)
+
+    def siblings(self, flat, key, token):
+        """
+        The values of ``flat`` belonging to the struct of ``token`` at
+        ``key``, under their undotted names, as read by the conditions of
+        :py:class:`.Optional` token.
+        """
+        prefix = key[:len(key) - len(str(token.name))]
+        return dict((_key[len(prefix):], value)
+                    for _key, value in flat.items()
+                    if _key.startswith(prefix) and
+                    self.sep not in _key[len(prefix):])
+
+    def decode(self, payload, flat, trusted=False):
+        """
+        Decode ``payload`` into the single dictionary ``flat``, returns the
+        remaining payload and ``flat``. See :py:meth:`.Plan.decode` for
+        ``trusted``.
+        """
+        pos = 0
+        scratch = dict()
+        starts = list() # offsets of the data of open checksums
+        steps = self.steps
+        i = 0
+        while i < len(steps):
+            kind, arg, token = steps[i]
+            i += 1
+            if kind == 'run':
+                values = arg.unpack_from(payload, pos)
+                for (key, _token), value in zip(token, values):
+                    if not isinstance(_token, Padding):
+                        flat[key] = value
+                    elif not trusted:
+                        assert not _token.verify or value == _token.padd
+                pos += arg.size
+                continue
+            elif kind != 'token':
+                if kind == 'begin':
+                    starts.append(pos)
+                elif kind == 'checksum':
+                    start = starts.pop()
+                    value = token.codec.unpack_from(payload, pos)[0]
+                    if not (trusted or token.trusted) and \
+                            value != token.checksum(payload[start:pos]):
+                        raise ChecksumError('Checksum failure for %s'
+                                            % token.name)
+                    flat[arg] = value
+                    pos += token.codec.size
+                elif kind == 'optional':
+                    key, end = arg
+                    if not token.present(self.siblings(flat, key, token)):
+                        i = end
+                continue
+            key = arg
+            if isinstance(token, Dynamic):
+                dynamic_key = key[:len(key) - len(str(token.name))]
+                scratch[token.len_name] = flat[dynamic_key + token.len_name]
+            elif isinstance(token, Optional):
+                scratch.update(self.siblings(flat, key, token))
+            rest, scratch = decode_token(token, payload[pos:], scratch,
+                                         trusted)
+            pos = len(payload) - len(rest)
+            if token.name in scratch:
+                flat[key] = scratch[token.name]
+            scratch.clear()
+        return payload[pos:], flat
+
+    def encode(self, flat, payload=""):
+        """
+        Encode the values of the single dictionary ``flat``, returns
+        ``flat`` and the extended ``payload``. Length fields of
+        :py:class:`.Dynamic` sequences are set in ``flat``.
+        """
+        for key, (dynamic, seqkey) in self.lengths.items():
+            if seqkey in flat or key not in flat:
+                flat[key] = dynamic.comp_len(flat.get(seqkey,
+                                                      dynamic.seqtype.EMPTY))
+        chunks = [payload]
+        scratch = dict()
+        starts = list() # indices of the first chunks of open checksums
+        steps = self.steps
+        i = 0
+        while i < len(steps):
+            kind, arg, token = steps[i]
+            i += 1
+            if kind == 'run':
+                chunks.append(arg.pack(*[
+                    _token.padd if isinstance(_token, Padding) else flat[key]
+                    for key, _token in token]))
+                continue
+            elif kind != 'token':
+                if kind == 'begin':
+                    starts.append(len(chunks))
+                elif kind == 'checksum':
+                    value = token.checksum("".join(chunks[starts.pop():]))
+                    flat[arg] = value
+                    chunks.append(token.codec.pack(value))
+                elif kind == 'optional':
+                    key, end = arg
+                    if not token.present(self.siblings(flat, key, token)):
+                        i = end
+                continue
+            key = arg
+            if isinstance(token, Optional):
+                scratch.update(self.siblings(flat, key, token))
+            scratch[token.name] = flat.get(key)
+            if key in self.lengths:
+                dynamic, seqkey = self.lengths[key]
+                scratch[dynamic.seqtype.name] = flat[seqkey]
+            scratch, chunk = token.encode(scratch, "")
+            chunks.append(chunk)
+            scratch.clear()
+        return flat, "".join(chunks)
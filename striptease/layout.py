@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+    striptease.layout
+    ~~~~~~~~~~~~~~~~~
+
+    Interoperability with the memory layout of C structs. Every token with a
+    static size has a matching :py:mod:`ctypes` type, which determines its
+    natural alignment. Aligned :py:class:`Structs <.Struct>` use it to insert
+    padding like a C compiler and :py:func:`struct_ctype` generates a
+    ``ctypes.Structure`` with exactly the layout of a struct, so encoded
+    buffers can be mapped via ``from_buffer`` without any decoding:
+
+    >>> from striptease import Struct, uint8, uint32
+    >>> struct = Struct(aligned=True).append(uint8('foo', '@'),
+    ...                                      uint32('bar', '@'))
+    >>> struct.static_size()
+    8
+    >>> dikt, payload = struct.encode({'foo': 1, 'bar': 2})
+    >>> struct.ctype().from_buffer_copy(payload).bar == 2
+    True
+
+    :copyright: Copyright 2011 by the University of Paderborn
+    :license: BSD, see LICENSE for details
+"""
+
+import ctypes
+
+from striptease.base import Padding, Alignment, Struct
+from striptease.numbers import Number
+from striptease.sequences import Static, String, Array
+
+
+CTYPES = {
+    'b': ctypes.c_int8,
+    'B': ctypes.c_uint8,
+    'h': ctypes.c_int16,
+    'H': ctypes.c_uint16,
+    'i': ctypes.c_int32,
+    'I': ctypes.c_uint32,
+    'q': ctypes.c_int64,
+    'Q': ctypes.c_uint64,
+    'f': ctypes.c_float,
+    'd': ctypes.c_double,
+}
+
+STRUCTURES = {
+    '<': ctypes.LittleEndianStructure,
+    '>': ctypes.BigEndianStructure,
+    '!': ctypes.BigEndianStructure,
+    '=': ctypes.Structure,
+    '@': ctypes.Structure,
+}
+
+
+def ctype(token):
+    """
+    Return the :py:mod:`ctypes` type matching the memory layout of
+    ``token``. Raises a ``TypeError`` for token without a static size.
+    """
+    if isinstance(token, Number):
+        return CTYPES[token.fmt()[-1]]
+    elif isinstance(token, Padding):
+        return ctypes.c_char * len(token.padd)
+    elif isinstance(token, Struct):
+        return struct_ctype(token)
+    elif isinstance(token, Static):
+        if isinstance(token.seqtype, String):
+            return ctypes.c_char * token.length
+        elif isinstance(token.seqtype, Array):
+            return ctype(token.seqtype.atype) * token.length
+    raise TypeError('%s has no C equivalent' % token.name)
+
+
+def alignment(token):
+    """
+    The natural alignment of ``token`` in bytes. Non-aligned structs are
+    packed, see :py:func:`struct_ctype`, so their alignment is 1.
+    """
+    if isinstance(token, Padding):
+        return 1
+    elif isinstance(token, Struct):
+        if not token.aligned:
+            return 1
+        return max([alignment(t) for t in token.structure] or [1])
+    return ctypes.alignment(ctype(token))
+
+
+def endians(token):
+    """ The set of byte orders used within ``token`` """
+    if isinstance(token, Number):
+        return set([token.endian])
+    elif isinstance(token, Struct):
+        return set().union(*[endians(t) for t in token.structure])
+    elif isinstance(token, Static) and isinstance(token.seqtype, Array):
+        return endians(token.seqtype.atype)
+    return set()
+
+
+def struct_ctype(struct_token, name=None):
+    """
+    Generate a ``ctypes.Structure`` with the memory layout of
+    ``struct_token``. :py:class:`.Alignment` is left to ctypes, explicit
+    :py:class:`.Padding` becomes a ``c_char`` array. Non-aligned structs
+    are packed via ``_pack_ = 1``.
+
+    All numbers must share the same byte order, which determines whether a
+    ``BigEndianStructure``, a ``LittleEndianStructure`` or a native
+    ``Structure`` is generated.
+    """
+    _endians = endians(struct_token)
+    if len(_endians) > 1:
+        raise ValueError('Mixed byte orders %s in %r' % (sorted(_endians),
+                                                         struct_token.name))
+    base = STRUCTURES[_endians.pop() if _endians else '=']
+    fields = [(str(token.name), ctype(token))
+              for token in struct_token.structure
+              if not isinstance(token, Alignment)]
+    attrs = {'_fields_': fields}
+    if not struct_token.aligned:
+        attrs['_pack_'] = 1
+    cls = type(str(name or struct_token.name or 'Struct'), (base,), attrs)
+    if ctypes.sizeof(cls) != struct_token.static_size():
+        raise ValueError('ctypes lays out %r in %d bytes instead of %s' %
+                         (struct_token.name, ctypes.sizeof(cls),
+                          struct_token.static_size()))
+    return cls
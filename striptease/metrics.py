@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+"""
+    striptease.metrics
+    ~~~~~~~~~~~~~~~~~~
+
+    Aggregate metrics of top-level structs, cheap enough to stay enabled in
+    production. :py:meth:`.Struct.instrument` wraps the en- and decoding
+    methods of a struct, which then count messages, bytes, checksum
+    failures and decode errors by token, and record latency histograms:
+
+    >>> from striptease import Struct, uint8, uint16
+    >>> struct = Struct('ping').append(uint8('ttl'), uint16('trans'))
+    >>> metrics = struct.instrument(sample=1.0)
+    >>> payload = struct.encode({'ttl': 64, 'trans': 1})[1]
+    >>> snapshot = metrics.snapshot()
+    >>> snapshot['encoded'], snapshot['bytes_out']
+    (1, 3)
+
+    Every thread counts into its own shard, so counting needs no locks, the
+    shards are merged on reading. Counters are exact, while only a
+    ``sample`` of the calls is timed for the histograms.
+
+    The methods of the struct's :py:class:`.Plan` are wrapped as well, so
+    users of the plan like the :py:class:`.Dispatcher`, :py:func:`.scan` and
+    :py:func:`.decode_columns` are counted, too.
+
+    :py:func:`exposition` renders the metrics of all instrumented structs
+    in the Prometheus text format.
+
+    :copyright: Copyright 2011 by the University of Paderborn
+    :license: BSD, see LICENSE for details
+"""
+
+import sys
+import time
+import bisect
+import weakref
+import threading
+
+from striptease.checksum import ChecksumError
+from striptease.base import Token, COALESCE_THRESHOLD, chunk_size
+
+
+#: Default fraction of calls whose latency is recorded
+SAMPLE = 0.01
+
+#: Upper bounds of the latency buckets in seconds, 1 µs to about 1 s
+BUCKETS = tuple(1e-6 * 2 ** i for i in range(21))
+
+#: The metrics of all instrumented structs, see :py:func:`exposition`. The
+#: metrics are held weakly and drop out with their struct, call
+#: ``REGISTRY.discard(metrics)`` or ``REGISTRY.clear()`` to stop exposing
+#: metrics of structs which are still alive.
+REGISTRY = weakref.WeakSet()
+
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class Histogram(object):
+    """ Counts observations in the buckets of ``bounds`` """
+
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+
+class Shard(object):
+    """
+    The counters of one thread. A call is timed whenever ``countdown``
+    reaches zero, then it restarts at ``every``. ``depth`` is set while an
+    instrumented method runs, so that nested calls aren't counted twice.
+    """
+
+    def __init__(self, every):
+        self.every = every
+        self.depth = 0
+        self.clear()
+
+    def clear(self):
+        self.countdown = self.every or -1 # never reaches zero without every
+        self.encoded = 0
+        self.decoded = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.checksum_failures = 0
+        self.errors = dict()
+        self.encode_latency = Histogram()
+        self.decode_latency = Histogram()
+
+    def timed(self):
+        """ Whether to time the current call """
+        self.countdown -= 1
+        if self.countdown:
+            return False
+        self.countdown = self.every
+        return True
+
+
+COUNTERS = ('encoded', 'decoded', 'bytes_out', 'bytes_in',
+            'checksum_failures')
+
+
+class Metrics(object):
+    """
+    The metrics of the struct ``name``, of which a fraction ``sample`` of
+    all calls is timed.
+    """
+
+    def __init__(self, name, sample=SAMPLE):
+        self.name = name
+        self.every = max(1, int(round(1.0 / sample))) if sample else 0
+        self.local = threading.local()
+        self.shards = list()
+        self.lock = threading.Lock()
+
+    def shard(self):
+        """ Return the shard of the current thread """
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard = Shard(self.every)
+            with self.lock:
+                self.shards.append(shard)
+            self.local.shard = shard
+            return shard
+
+    def add(self, **counts):
+        """
+        Add ``counts`` by counter name to the shard of the current thread,
+        for bulk operations like :py:func:`.decode_columns`.
+        """
+        shard = self.shard()
+        for counter, count in counts.items():
+            setattr(shard, counter, getattr(shard, counter) + count)
+
+    def snapshot(self):
+        """
+        Merge the shards of all threads into a dict of the counters, the
+        ``errors`` by token name and the ``encode_latency`` and
+        ``decode_latency`` :py:class:`Histograms <.Histogram>`.
+        """
+        with self.lock:
+            shards = list(self.shards)
+        snapshot = dict((counter, 0) for counter in COUNTERS)
+        snapshot['errors'] = dict()
+        snapshot['encode_latency'] = Histogram()
+        snapshot['decode_latency'] = Histogram()
+        for shard in shards:
+            for counter in COUNTERS:
+                snapshot[counter] += getattr(shard, counter)
+            for token, count in list(shard.errors.items()):
+                snapshot['errors'][token] = \
+                    snapshot['errors'].get(token, 0) + count
+            snapshot['encode_latency'].merge(shard.encode_latency)
+            snapshot['decode_latency'].merge(shard.decode_latency)
+        return snapshot
+
+    def reset(self):
+        """ Drop all counts """
+        with self.lock:
+            for shard in self.shards:
+                shard.clear()
+
+
+def failed_token(traceback):
+    """
+    Return the name of the innermost named token, whose method raised the
+    exception of ``traceback``.
+    """
+    name = None
+    while traceback is not None:
+        token = traceback.tb_frame.f_locals.get('self')
+        _name = getattr(token, 'name', None)
+        if isinstance(token, Token) and _name and not isinstance(_name, int):
+            name = _name # array elements are named by their index
+        traceback = traceback.tb_next
+    return name or '?'
+
+
+def shard_of(metrics):
+    """ The shard of the current thread, without a call in the common case """
+    try:
+        return metrics.local.shard
+    except AttributeError:
+        return metrics.shard()
+
+
+def counting_encode(metrics, _encode):
+    """ Wrap the ``encode`` method ``_encode`` to count into ``metrics`` """
+
+    def encode(dikt, payload=bytes()):
+        shard = shard_of(metrics)
+        if shard.depth: # called by another instrumented method
+            return _encode(dikt, payload)
+        shard.depth = 1
+        try:
+            if not shard.timed():
+                dikt, data = _encode(dikt, payload)
+            else:
+                start = clock()
+                dikt, data = _encode(dikt, payload)
+                shard.encode_latency.observe(clock() - start)
+        finally:
+            shard.depth = 0
+        shard.encoded += 1
+        shard.bytes_out += len(data) - len(payload)
+        return dikt, data
+    return encode
+
+
+def counting_encode_into(metrics, _encode_into):
+    """ Wrap the ``encode_into`` method ``_encode_into`` likewise """
+
+    def encode_into(dikt, buffer, offset=0):
+        shard = shard_of(metrics)
+        if shard.depth:
+            return _encode_into(dikt, buffer, offset)
+        shard.depth = 1
+        try:
+            if not shard.timed():
+                end = _encode_into(dikt, buffer, offset)
+            else:
+                start = clock()
+                end = _encode_into(dikt, buffer, offset)
+                shard.encode_latency.observe(clock() - start)
+        finally:
+            shard.depth = 0
+        shard.encoded += 1
+        shard.bytes_out += end - offset
+        return end
+    return encode_into
+
+
+def counting_iter_encode(metrics, _iter_encode):
+    """
+    Wrap the ``iter_encode`` method ``_iter_encode`` likewise. The message
+    is counted once all chunks were consumed. It isn't timed, since the
+    time between the chunks is spent by the consumer.
+    """
+
+    def iter_encode(dikt, threshold=COALESCE_THRESHOLD):
+        size = 0
+        for chunk in _iter_encode(dikt, threshold):
+            size += chunk_size(chunk)
+            yield chunk
+        shard = shard_of(metrics)
+        shard.encoded += 1
+        shard.bytes_out += size
+    return iter_encode
+
+
+def counting_decode(metrics, _decode):
+    """ Wrap the ``decode`` method ``_decode`` likewise """
+
+    def decode(payload, dikt, trusted=False):
+        shard = shard_of(metrics)
+        if shard.depth:
+            return _decode(payload, dikt, trusted)
+        shard.depth = 1
+        start = clock() if shard.timed() else None
+        try:
+            rest, dikt = _decode(payload, dikt, trusted)
+        except Exception as error:
+            if isinstance(error, ChecksumError):
+                shard.checksum_failures += 1
+            token = failed_token(sys.exc_info()[2])
+            shard.errors[token] = shard.errors.get(token, 0) + 1
+            raise
+        finally:
+            shard.depth = 0
+        if start is not None:
+            shard.decode_latency.observe(clock() - start)
+        shard.decoded += 1
+        shard.bytes_in += len(payload) - len(rest)
+        return rest, dikt
+    return decode
+
+
+def instrument_plan(plan, metrics):
+    """
+    Wrap the methods of ``plan`` to count into ``metrics``. They are
+    replaced on the plan itself, so users which hold on to the plan, like a
+    :py:class:`.Dispatcher`, are counted as well.
+    """
+    plan.encode = counting_encode(metrics, plan.encode)
+    plan.encode_into = counting_encode_into(metrics, plan.encode_into)
+    plan.decode = counting_decode(metrics, plan.decode)
+
+
+def instrument(struct_token, name=None, sample=None):
+    """
+    Wrap the ``encode``, ``iter_encode`` and ``decode`` methods of the
+    top-level ``struct_token`` and of its :py:class:`.Plan` to collect
+    :py:class:`.Metrics`, which are returned and registered in
+    :py:data:`REGISTRY`. Plans compiled later are instrumented as well, and
+    :py:func:`.decode_columns` counts the records it decodes. Nested calls,
+    like :py:meth:`.Struct.decode` decoding via the plan, are counted once.
+    Instrumenting a struct again returns its metrics.
+
+    :param name: (optional) the name of the schema in the metrics, defaults
+                 to the struct's name
+    :param sample: (optional) the fraction of calls which are timed,
+                   defaults to :py:data:`SAMPLE`
+    """
+    if struct_token.parent is not None:
+        raise ValueError('Only top-level structs can be instrumented')
+    metrics = getattr(struct_token, 'metrics', None)
+    if metrics is not None:
+        return metrics
+    if sample is None:
+        sample = SAMPLE
+    metrics = Metrics(name or struct_token.name or 'struct', sample)
+    struct_token.encode = counting_encode(metrics, struct_token.encode)
+    struct_token.iter_encode = counting_iter_encode(metrics,
+                                                    struct_token.iter_encode)
+    struct_token.decode = counting_decode(metrics, struct_token.decode)
+    struct_token.metrics = metrics
+    if struct_token._plan is not None:
+        instrument_plan(struct_token._plan, metrics)
+    REGISTRY.add(metrics)
+    return metrics
+
+
+FAMILIES = [
+    ('encoded', 'striptease_messages_encoded_total', 'counter',
+     'Messages encoded'),
+    ('decoded', 'striptease_messages_decoded_total', 'counter',
+     'Messages decoded'),
+    ('bytes_out', 'striptease_bytes_encoded_total', 'counter',
+     'Bytes encoded'),
+    ('bytes_in', 'striptease_bytes_decoded_total', 'counter',
+     'Bytes decoded'),
+    ('checksum_failures', 'striptease_checksum_failures_total', 'counter',
+     'Checksum failures while decoding'),
+    ('errors', 'striptease_decode_errors_total', 'counter',
+     'Decode errors by token'),
+    ('encode_latency', 'striptease_encode_seconds', 'histogram',
+     'Sampled encode latency'),
+    ('decode_latency', 'striptease_decode_seconds', 'histogram',
+     'Sampled decode latency'),
+]
+
+
+def escape(value):
+    """ Escape ``value`` for a label of the Prometheus text format """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+                     .replace('\n', '\\n')
+
+
+def exposition(registry=None):
+    """
+    Render the metrics of ``registry``, by default all instrumented structs,
+    in the Prometheus text exposition format.
+    """
+    registry = REGISTRY if registry is None else registry
+    snapshots = [(escape(metrics.name), metrics.snapshot())
+                 for metrics in sorted(registry, key=lambda m: m.name)]
+    lines = list()
+    for key, family, kind, help in FAMILIES:
+        lines.append('# HELP %s %s' % (family, help))
+        lines.append('# TYPE %s %s' % (family, kind))
+        for schema, snapshot in snapshots:
+            value = snapshot[key]
+            if kind == 'histogram':
+                cumulative = 0
+                for bound, count in zip(value.bounds + (float('inf'),),
+                                        value.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append('%s_bucket{schema="%s",le="%s"} %d'
+                                 % (family, schema, le, cumulative))
+                lines.append('%s_sum{schema="%s"} %r'
+                             % (family, schema, value.sum))
+                lines.append('%s_count{schema="%s"} %d'
+                             % (family, schema, cumulative))
+            elif key == 'errors':
+                for token, count in sorted(value.items()):
+                    lines.append('%s{schema="%s",token="%s"} %d'
+                                 % (family, schema, escape(token), count))
+            else:
+                lines.append('%s{schema="%s"} %d' % (family, schema, value))
+    return '\n'.join(lines) + '\n'
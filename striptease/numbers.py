@@ -44,6 +44,7 @@ class Number(Token):
         self.sign = sign
         self.__length = length
         self.endian = endian
+        self.codec = struct.Struct(self.fmt())
 
     def fmt(self):
         """
@@ -59,17 +60,15 @@ class Number(Token):
         Lookup the value to be encoded via `self.name` from dikt, encode to
         binary and append to payload.
         """
-        return dikt, payload + struct.pack(self.fmt(), dikt[self.name])
+        return dikt, payload + self.codec.pack(dikt[self.name])
 
     def decode(self, payload, dikt):
         """
         Slices self.__length bytes from front of payload, decodes the data and
         stores it in dikt. Then returns the shortened payload and the dikt
         """
-        data, payload = payload[:self.__length],payload[self.__length:]
-        values = struct.unpack(self.fmt(), data)
-        dikt[self.name] = values[0]
-        return payload, dikt
+        dikt[self.name] = self.codec.unpack(payload[:self.__length])[0]
+        return payload[self.__length:], dikt
 
     def encode_len(self, dikt):
         return self.__length, dikt
@@ -77,6 +76,9 @@ class Number(Token):
     def decode_len(self, payload):
         return self.__length, payload[self.__length:]
 
+    def static_size(self):
+        return self.__length
+
 
 class Integer(Number):
     """
@@ -139,3 +141,12 @@ class Float(Number):
         Number.__init__(self, name, True, length, endian)
 
 
+
+
+def plain_number(token):
+    """
+    Whether ``token`` is an :py:class:`.Integer` or :py:class:`.Float`
+    itself. Subclasses like :py:class:`.Checksum` wrap other token, so they
+    can't be unpacked with the format of their own value alone.
+    """
+    return type(token) in (Integer, Float)
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+    striptease.patch
+    ~~~~~~~~~~~~~~~~
+
+    In-place patching of encoded records. Instead of decoding a record,
+    changing some values and encoding it again, the new values are written
+    directly at the offsets of their fields in a writable buffer, e.g. a
+    ``bytearray``:
+
+    >>> from striptease import Struct, uint8, uint16
+    >>> struct = Struct().append(uint8('ttl'), uint16('trans'))
+    >>> buffer = bytearray(struct.encode({'ttl': 64, 'trans': 1})[1])
+    >>> struct.patch(buffer, {'trans': 7})
+    >>> struct.decode(str(buffer), dict())[1]['trans']
+    7
+
+    Checksums wrapping a patched field are recomputed, incrementally if the
+    algorithm supports it, see :py:meth:`.Checksum.update`.
+
+    :copyright: Copyright 2011 by the University of Paderborn
+    :license: BSD, see LICENSE for details
+"""
+
+from striptease.base import Struct, as_bytes
+from striptease.numbers import Number, Integer
+from striptease.checksum import Checksum
+from striptease.sequences import Consumer
+from striptease.util import window
+
+
+def lookup(plan, name):
+    """
+    Return the index of the field ``name`` in ``plan``. The child of a
+    :py:class:`.Checksum` is looked up by its own name.
+    """
+    if name in plan.index:
+        return plan.order[name]
+    for i, field in enumerate(plan.fields):
+        if isinstance(field.token, Checksum) and \
+                field.token.wrapped.name == name:
+            return i
+    raise KeyError('%s has no field %r' % (plan.struct.name, name))
+
+
+def write(token, buffer, pos, name, value):
+    """
+    Encode ``value`` of ``token`` at ``pos`` into ``buffer``. Returns
+    ``(pos, old)`` with the overwritten bytes.
+    """
+    size = token.static_size()
+    if size is None:
+        raise ValueError('Cannot patch %r in place, it has no static size'
+                         % name)
+    if isinstance(token, Number):
+        data = token.codec.pack(value)
+    else:
+        data = token.encode({name: value}, "")[1]
+    old = as_bytes(buffer[pos:pos + size])
+    buffer[pos:pos + size] = data
+    return pos, old
+
+
+def patch_checksum(token, buffer, pos, name, value):
+    """
+    Patch the child of the checksum ``token`` at ``pos`` and fix up the
+    checksum behind it. Returns the list of changes.
+    """
+    child = token.wrapped
+    size = Integer.static_size(token)
+    if isinstance(child, Struct):
+        plan = child.plan()
+        changes, end = patch_plan(plan, buffer, value, pos)
+        if any(isinstance(field.token, Consumer) for field in plan.fields):
+            end = len(buffer) - size
+    else:
+        changes = [write(child, buffer, pos, name, value)]
+        end = pos + child.static_size()
+    old = as_bytes(buffer[end:end + size])
+    checksum = token.codec.unpack(old)[0]
+    data = window(buffer, pos, end)
+    checksum = token.update(checksum, data,
+                            [(offset - pos, _old) for offset, _old in changes])
+    if checksum is None:
+        checksum = token.checksum(data)
+    buffer[end:end + size] = token.codec.pack(checksum)
+    changes.append((end, old))
+    return changes
+
+
+def patch_plan(plan, buffer, values, offset=0):
+    """
+    Patch the record of ``plan`` at ``offset`` in ``buffer`` with
+    ``values``. Returns the list of ``(pos, old)`` of all overwritten bytes,
+    so enclosing checksums can be updated, and the end of the record.
+    """
+    positions, end, decoded = plan.locate(buffer, offset)
+    changes = list()
+    for name, value in values.items():
+        if name in plan.length_fields:
+            raise ValueError('Cannot patch the length field %r' % name)
+        i = lookup(plan, name)
+        token, pos = plan.fields[i].token, positions[i]
+        if isinstance(token, Checksum):
+            if token.name == name:
+                raise ValueError('Cannot patch the checksum %r, it is '
+                                 'computed from its child' % name)
+            changes.extend(patch_checksum(token, buffer, pos, name, value))
+        elif type(token) == Struct:
+            changes.extend(patch_plan(token.plan(), buffer, value, pos)[0])
+        else:
+            changes.append(write(token, buffer, pos, name, value))
+    return changes, end
+
+
+def patch(struct_token, buffer, values, offset=0):
+    """
+    Overwrite the fields named in ``values`` of the record of
+    ``struct_token`` at ``offset`` in the writable ``buffer``. Values of
+    nested structs are given as nested dictionaries. Patched fields must
+    have a static size, length fields can't be patched.
+    """
+    patch_plan(struct_token.plan(), buffer, values, offset)
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+    striptease.plan
+    ~~~~~~~~~~~~~~~
+
+    Static analysis of token trees. A :py:class:`.Plan` walks the structure of
+    a :py:class:`.Struct` once and records for every sub-token its size and,
+    as long as all preceding token have a static size, its byte offset from
+    the start of the struct. With a plan, single fields can be located within
+    an encoded record without decoding the whole record.
+
+    :copyright: Copyright 2011 by the University of Paderborn
+    :license: BSD, see LICENSE for details
+"""
+
+import struct
+
+from striptease.base import Padding, Alignment, Struct, decode_token
+from striptease.checksum import Checksum
+from striptease.conditional import Optional
+from striptease.numbers import Integer, Float, plain_number
+from striptease.sequences import Static, Dynamic, Consumer, String, Array
+
+# token which may be fused into a single struct-format with their neighbours
+FUSABLE = (Integer, Float, Padding, Alignment)
+
+
+class Field(object):
+    """
+    Describes the position of one sub-token of a :py:class:`.Struct`.
+
+    :param token: the sub-token described by this field
+    :param offset: the byte offset of the field from the start of the
+                   struct, or ``None`` if it depends on preceding data
+    :param size: the static size of the field in bytes, or ``None`` if it
+                 depends on the data
+    """
+
+    def __init__(self, token, offset, size, fmt=None):
+        self.token = token
+        self.name = token.name
+        self.offset = offset
+        self.size = size
+        self.codec = None
+        if fmt is None and plain_number(token):
+            fmt = token.fmt()
+        if fmt is not None:
+            self.codec = struct.Struct(fmt)
+
+    @property
+    def sequence(self):
+        """ The wrapped :py:class:`.Sequence` if this is a sequence field """
+        return getattr(self.token, 'seqtype', None)
+
+    def __repr__(self):
+        return '<Field %s offset=%s size=%s>' % (self.name, self.offset,
+                                                 self.size)
+
+
+def fusable(token):
+    return type(token) in FUSABLE and getattr(token, 'endian', '!') != '@'
+
+
+def analyze(struct_token):
+    """
+    Analyze the structure of ``struct_token`` and return its fields, its
+    static size and the steps to en- and decode it, see :py:class:`.Plan`.
+    """
+    fields = list()
+    offset = 0
+    for token in struct_token.structure:
+        size = token.static_size()
+        fmt = token.fmt() if plain_number(token) else None
+        fields.append((token.name, offset, size, fmt))
+        if offset is not None and size is not None:
+            offset += size
+        else:
+            offset = None
+
+    # fuse runs of adjacent numbers and paddings of the same byte order
+    steps = list()
+    run, endian = list(), None
+    for i, token in enumerate(struct_token.structure):
+        _endian = getattr(token, 'endian', None)
+        if run and (not fusable(token) or
+                    None not in (endian, _endian) and _endian != endian):
+            steps.append(fuse(struct_token, run, endian))
+            run, endian = list(), None
+        if fusable(token):
+            run.append(i)
+            endian = endian or _endian
+        else:
+            steps.append(('token', i))
+    if run:
+        steps.append(fuse(struct_token, run, endian))
+    return tuple(fields), offset, tuple(steps)
+
+
+def fuse(struct_token, indices, endian):
+    """ Build the step decoding the tokens at ``indices`` at once """
+    fmt = [endian or '!']
+    for i in indices:
+        token = struct_token.structure[i]
+        if isinstance(token, Padding):
+            fmt.append('%ds' % len(token.padd))
+        else:
+            fmt.append(token.fmt()[1:])
+    return ('run', "".join(fmt), tuple(indices))
+
+
+class Plan(object):
+    """
+    The precomputed layout of a :py:class:`.Struct`. Usually you do not
+    create a plan yourself but call :py:meth:`.Struct.plan`, which caches it.
+
+    ``fields`` lists a :py:class:`.Field` per sub-token in order of
+    appearance, ``order`` maps their names to their position in ``fields``
+    and ``size`` is the static size of a whole record or ``None``.
+    ``length_fields`` maps the names of all fields, which carry the length of
+    a :py:class:`.Dynamic` sequence, to that sequence. ``dependencies`` are
+    the names of all fields, which must be decoded to skip the rest of a
+    record: the length fields and the fields read by the conditions of
+    :py:class:`.Optional` token.
+
+    In addition, a plan is compiled into ``steps``: runs of adjacent numbers
+    and paddings are fused into a single ``struct.Struct``, which en- and
+    decodes them at once, see :py:meth:`.encode` and :py:meth:`.decode`.
+    """
+
+    def __init__(self, struct_token):
+        self.struct = struct_token
+        self.fields = list()
+        self.index = dict()
+        self.order = dict()
+        self.length_fields = dict()
+        self.dependencies = set()
+        fields, self.size, steps = analyze(struct_token)
+        for token, (name, offset, size, fmt) in zip(struct_token.structure,
+                                                    fields):
+            field = Field(token, offset, size, fmt)
+            if isinstance(token, Optional):
+                self.dependencies.update(token.fields or self.index)
+                token = token.wrapped
+            if isinstance(token, Dynamic):
+                self.length_fields[token.len_name] = token
+                self.dependencies.add(token.len_name)
+            self.order[field.name] = len(self.fields)
+            self.fields.append(field)
+            self.index[field.name] = field
+        self.steps = list()
+        for step in steps:
+            if step[0] == 'run':
+                kind, fmt, indices = step
+                tokens = [struct_token.structure[i] for i in indices]
+                self.steps.append((kind, struct.Struct(fmt), tokens))
+            else:
+                kind, i = step
+                self.steps.append((kind, None, struct_token.structure[i]))
+
+    def __getitem__(self, name):
+        return self.index[name]
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def skip(self, field, payload, pos, values):
+        """
+        Return the position behind ``field`` in ``payload``, if ``field``
+        starts at ``pos``. The ``dependencies`` are decoded on the way and
+        stored in ``values``, so subsequent :py:class:`.Dynamic` sequences
+        and :py:class:`.Optional` token can be skipped without decoding
+        them. Token whose size can't be determined otherwise are decoded
+        into ``values``.
+        """
+        if field.size is not None:
+            if field.name in self.dependencies:
+                if field.codec is not None:
+                    values[field.name] = field.codec.unpack_from(payload,
+                                                                 pos)[0]
+                else:
+                    field.token.decode(payload[pos:pos + field.size], values)
+            return pos + field.size
+        token = field.token
+        if isinstance(token, Consumer):
+            return len(payload)
+        if isinstance(token, Dynamic):
+            size = token.seqtype.static_size(values[token.len_name])
+            if size is not None:
+                return pos + size
+        if isinstance(token, Optional):
+            size = token.size(values)
+            if size is not None:
+                return pos + size
+        if self.framed(token):
+            if isinstance(token, Checksum):
+                end = token.wrapped.plan().locate(payload, pos)[1]
+                return end + Integer.static_size(token)
+            return token.plan().locate(payload, pos)[1]
+        data = payload[pos:]
+        rest, values = token.decode(data, values)
+        return pos + len(data) - len(rest)
+
+    def framed(self, token):
+        """
+        Whether the nested struct ``token``, or the checksum of a struct, can
+        be skipped via its own plan, without decoding or verifying it. Its
+        values must not be needed by later fields and a struct ending with a
+        :py:class:`.Consumer` is only delimited by the checksum behind it.
+        """
+        if isinstance(token, Checksum):
+            if token.name in self.dependencies:
+                return False
+            token = token.wrapped
+        if type(token) != Struct or token.name in self.dependencies:
+            return False
+        return not any(isinstance(field.token, Consumer)
+                       for field in token.plan().fields)
+
+    def locate(self, payload, pos=0):
+        """
+        Determine the start position of every field of the record starting
+        at ``pos`` in ``payload``. Returns the list of positions, the position
+        behind the record and a dict with the values decoded on the way.
+        """
+        positions = list()
+        values = dict()
+        if self.size is not None:
+            for field in self.fields:
+                positions.append(pos + field.offset)
+            return positions, pos + self.size, values
+        for field in self.fields:
+            positions.append(pos)
+            pos = self.skip(field, payload, pos, values)
+        return positions, pos, values
+
+    def decode(self, payload, dikt, trusted=False):
+        """
+        Decode ``payload`` into ``dikt`` like :py:meth:`.Struct.decode`, but
+        decode fused runs of numbers with a single ``struct.unpack_from``.
+
+        If ``trusted`` is ``True``, paddings are not compared and checksums
+        are not verified, also within nested token like structs, arrays,
+        optional and compressed token, see :py:func:`.decode_token`.
+        """
+        pos = 0
+        for kind, codec, token in self.steps:
+            if kind == 'run':
+                values = codec.unpack_from(payload, pos)
+                for _token, value in zip(token, values):
+                    if not isinstance(_token, Padding):
+                        dikt[_token.name] = value
+                    elif not trusted:
+                        assert not _token.verify or value == _token.padd
+                pos += codec.size
+            else:
+                payload, dikt = decode_token(token, payload[pos:], dikt,
+                                             trusted)
+                pos = 0
+        return payload[pos:], dikt
+
+    def run_values(self, tokens, dikt):
+        """
+        The values of the fused run of ``tokens``, lengths of
+        :py:class:`.Dynamic` sequences are computed and set in ``dikt``.
+        """
+        values = list()
+        for _token in tokens:
+            if isinstance(_token, Padding):
+                values.append(_token.padd)
+                continue
+            dynamic = self.length_fields.get(_token.name)
+            if dynamic is not None and (dynamic.seqtype.name in dikt
+                                        or _token.name not in dikt):
+                value = dynamic.sequence_length(dikt)
+                dikt[_token.name] = value
+            values.append(dikt[_token.name])
+        return values
+
+    def encode(self, dikt, payload=bytes()):
+        """
+        Encode ``dikt`` like :py:meth:`.Struct.encode`, but encode fused runs
+        of numbers with a single ``struct.pack``.
+        """
+        chunks = [payload]
+        for kind, codec, token in self.steps:
+            if kind == 'run':
+                chunks.append(codec.pack(*self.run_values(token, dikt)))
+            else:
+                dikt, chunk = token.encode(dikt, bytes())
+                chunks.append(chunk)
+        return dikt, bytes().join(chunks)
+
+    def encode_into(self, dikt, buffer, offset=0):
+        """
+        Encode ``dikt`` directly into the writable ``buffer`` at ``offset``,
+        e.g. a ``bytearray``, an ``mmap`` or shared memory. Fused runs are
+        packed in place via ``struct.pack_into``. Returns the offset behind
+        the encoded record. The buffer must be large enough, which is only
+        known in advance for records with a static ``size``.
+        """
+        for kind, codec, token in self.steps:
+            if kind == 'run':
+                codec.pack_into(buffer, offset, *self.run_values(token, dikt))
+                offset += codec.size
+            else:
+                dikt, chunk = token.encode(dikt, bytes())
+                buffer[offset:offset + len(chunk)] = chunk
+                offset += len(chunk)
+        return offset
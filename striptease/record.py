@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+    striptease.record
+    ~~~~~~~~~~~~~~~~~
+
+    Declarative schemas. The fields of a :py:class:`.Record` are token
+    assigned to class attributes, in the order they are encoded. Their names
+    are taken from the attributes, so they may be omitted:
+
+    >>> from striptease import Record, String, uint8
+    >>> class StoreRequest(Record):
+    ...     trans = uint8()
+    ...     nlen = uint8()
+    ...     name = String()['nlen']
+    >>> payload = StoreRequest(trans=1, name='foo').encode()
+    >>> payload
+    '\\x01\\x03foo'
+    >>> StoreRequest.decode(payload)[1]
+    StoreRequest(trans=1, nlen=3, name='foo')
+
+    The fields become the ``__slots__`` of the class, so records are
+    smaller than dicts or objects with a ``__dict__``. A :py:class:`.Codec`
+    compiled from the :py:class:`.Plan` of the fields reads and writes the
+    attributes directly, without an intermediate dict.
+
+    :copyright: Copyright 2011 by the University of Paderborn
+    :license: BSD, see LICENSE for details
+"""
+
+import struct
+
+from striptease.base import Token, Padding, Struct, as_bytes, decode_token
+from striptease.sequences import Static, Dynamic, Consumer, String
+
+
+def rename(token, name):
+    """
+    Name ``token`` after its attribute. Length-specifiers and other
+    wrappers take the name of the token they wrap.
+    """
+    try:
+        token.name = name
+    except AttributeError: # read-only name of a wrapper
+        rename(token.children()[0], name)
+
+
+def plain_string(token):
+    """
+    Whether ``token`` wraps a :py:class:`.String`, which the codec slices
+    itself, instead of calling the token.
+    """
+    if type(token) not in (Static, Dynamic, Consumer):
+        return False
+    seqtype = token.seqtype
+    if type(seqtype) is not String or seqtype.reverse or seqtype.view:
+        return False
+    return type(token) is not Dynamic or token.comp_len is len
+
+
+class Fields(object):
+    """
+    The attributes of ``record`` as a mapping, for the token the codec
+    can't compile.
+    """
+
+    __slots__ = ('record',)
+
+    def __init__(self, record):
+        self.record = record
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self.record, name)
+        except AttributeError:
+            raise KeyError(name)
+
+    def __setitem__(self, name, value):
+        setattr(self.record, name, value)
+
+    def __contains__(self, name):
+        return hasattr(self.record, name)
+
+    def get(self, name, default=None):
+        return getattr(self.record, name, default)
+
+
+class Codec(object):
+    """
+    En- and decodes the attributes of objects with the fields of
+    ``struct_token``. The steps of its :py:class:`.Plan` are reused: fused
+    runs of numbers are unpacked straight into attributes and strings are
+    sliced from the payload, all other token are en- and decoded via a
+    :py:class:`Fields` mapping of the attributes.
+    """
+
+    def __init__(self, struct_token):
+        plan = struct_token.plan()
+        self.struct = struct_token
+        self.size = plan.size
+        self.steps = list()
+        for kind, codec, token in plan.steps:
+            if kind == 'run':
+                names = tuple(None if isinstance(_token, Padding)
+                              else _token.name for _token in token)
+                lengths = tuple(plan.length_fields.get(name)
+                                for name in names)
+                self.steps.append((kind, codec, (token, names, lengths)))
+            elif plain_string(token):
+                self.steps.append(('string', None, token))
+            else:
+                self.steps.append((kind, None, token))
+
+    def decode(self, payload, record, trusted=False):
+        """
+        Decode ``payload`` into the attributes of ``record`` like
+        :py:meth:`.Plan.decode`, returns the rest of the payload and
+        ``record``.
+        """
+        pos = 0
+        for kind, codec, token in self.steps:
+            if kind == 'run':
+                tokens, names, lengths = token
+                values = codec.unpack_from(payload, pos)
+                for _token, name, value in zip(tokens, names, values):
+                    if name is not None:
+                        setattr(record, name, value)
+                    elif not trusted:
+                        assert not _token.verify or value == _token.padd
+                pos += codec.size
+            elif kind == 'string':
+                seqtype = token.seqtype
+                if type(token) is Consumer:
+                    setattr(record, seqtype.name, payload[pos:])
+                    pos = len(payload)
+                    continue
+                if type(token) is Static:
+                    length = token.length
+                else:
+                    length = getattr(record, token.len_name)
+                value = struct.unpack_from('%ds' % length, payload, pos)[0]
+                setattr(record, seqtype.name, seqtype.unpad(value))
+                pos += length
+            else:
+                payload, _ = decode_token(token, payload[pos:],
+                                          Fields(record), trusted)
+                pos = 0
+        return payload[pos:], record
+
+    def run_values(self, step, record):
+        """
+        The values of the fused run ``step``, lengths of :py:class:`.Dynamic`
+        sequences are computed and set on ``record``.
+        """
+        tokens, names, lengths = step
+        values = list()
+        for _token, name, dynamic in zip(tokens, names, lengths):
+            if name is None:
+                values.append(_token.padd)
+                continue
+            if dynamic is not None:
+                try:
+                    value = dynamic.comp_len(getattr(record,
+                                                     dynamic.seqtype.name))
+                except AttributeError: # an absent optional sequence
+                    value = getattr(record, name, None)
+                    if value is None:
+                        value = dynamic.comp_len(dynamic.seqtype.EMPTY)
+                        setattr(record, name, value)
+                else:
+                    setattr(record, name, value)
+                values.append(value)
+            else:
+                values.append(getattr(record, name))
+        return values
+
+    def encode(self, record, payload=bytes()):
+        """
+        Encode the attributes of ``record`` like :py:meth:`.Plan.encode`,
+        returns ``record`` and the payload.
+        """
+        chunks = [payload]
+        for kind, codec, token in self.steps:
+            if kind == 'run':
+                chunks.append(codec.pack(*self.run_values(token, record)))
+            elif kind == 'string':
+                value = getattr(record, token.seqtype.name)
+                if not isinstance(value, bytes):
+                    value = as_bytes(value)
+                if type(token) is Static:
+                    value = struct.pack('%ds' % token.length, value)
+                chunks.append(value)
+            else:
+                _, chunk = token.encode(Fields(record), bytes())
+                chunks.append(chunk)
+        return record, bytes().join(chunks)
+
+
+class RecordType(type):
+    """
+    Metaclass of :py:class:`.Record`, which turns the token among the class
+    attributes into the fields of the record.
+    """
+
+    def __new__(mcs, name, bases, namespace):
+        tokens = sorted(((attr, value) for attr, value in namespace.items()
+                         if isinstance(value, Token)),
+                        key=lambda item: item[1].created)
+        namespace = dict(namespace)
+        if not tokens:
+            namespace.setdefault('__slots__', ())
+            return type.__new__(mcs, name, bases, namespace)
+        for base in bases:
+            if getattr(base, 'FIELDS', ()):
+                raise TypeError('%s cannot add fields to the record %s'
+                                % (name, base.__name__))
+        structure = Struct(name)
+        for attr, token in tokens:
+            del namespace[attr]
+            rename(token, attr)
+            structure.append(token)
+        namespace['__slots__'] = tuple(attr for attr, token in tokens
+                                       if not isinstance(token, Padding))
+        namespace['FIELDS'] = namespace['__slots__']
+        namespace['STRUCTURE'] = structure
+        namespace['CODEC'] = Codec(structure)
+        return type.__new__(mcs, name, bases, namespace)
+
+
+class Record(RecordType('RecordBase', (object,), {})):
+    """
+    Base class of declarative schemas, see :py:mod:`striptease.record`.
+    Fields are passed to the constructor in order or by name, fields which
+    aren't passed stay unset. Lengths of :py:class:`.Dynamic` sequences are
+    computed while encoding.
+
+    ``FIELDS`` are the names of the fields, ``STRUCTURE`` is the equivalent
+    :py:class:`.Struct` and ``CODEC`` its :py:class:`.Codec`. Paddings are
+    only part of the ``STRUCTURE``, they are no fields. Records can be
+    registered with a :py:class:`.Dispatcher` instead of a struct.
+    """
+
+    FIELDS = ()
+
+    __hash__ = None
+
+    def __init__(self, *args, **kwargs):
+        if len(args) > len(self.FIELDS):
+            raise TypeError('%s takes at most %d fields (%d given)'
+                            % (type(self).__name__, len(self.FIELDS),
+                               len(args)))
+        for name, value in zip(self.FIELDS, args):
+            setattr(self, name, value)
+        for name, value in kwargs.items():
+            if name not in self.FIELDS:
+                raise TypeError('%s has no field %r'
+                                % (type(self).__name__, name))
+            setattr(self, name, value)
+
+    @classmethod
+    def decode(cls, payload, trusted=False):
+        """
+        Decode a record from ``payload``, returns the rest of the payload
+        and the record. See :py:meth:`.Plan.decode` for ``trusted``.
+        """
+        return cls.CODEC.decode(payload, cls.__new__(cls), trusted)
+
+    def encode(self, payload=bytes()):
+        """ Encode the record and append it to ``payload`` """
+        return self.CODEC.encode(self, payload)[1]
+
+    def asdict(self):
+        """ The values of all fields, which are set """
+        return dict((name, getattr(self, name)) for name in self.FIELDS
+                    if hasattr(self, name))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.asdict() == other.asdict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join(
+            '%s=%r' % (name, getattr(self, name)) for name in self.FIELDS
+            if hasattr(self, name)))
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+    striptease.scan
+    ~~~~~~~~~~~~~~~
+
+    Selective decoding of a buffer of back-to-back encoded records. Instead of
+    decoding every record and testing the resulting dictionary, predicates
+    are evaluated on the raw bytes at the offsets of the :py:class:`.Plan`:
+    the expected values of a ``where`` dictionary are encoded once and
+    compared with the bytes of every record. Only matching records are
+    decoded. Fields containing floats are compared by value instead, since
+    equal floats like ``0.0`` and ``-0.0`` differ in their bytes, while a
+    ``NaN`` never equals itself.
+
+    >>> from striptease import Struct, uint8, uint16
+    >>> struct = Struct().append(uint8('msg_id'), uint16('trans'))
+    >>> buffer = "".join(struct.encode(dict(msg_id=i % 4, trans=i))[1]
+    ...                  for i in range(10))
+    >>> [r['trans'] for r in struct.scan(buffer, where={'msg_id': 3})]
+    [3, 7]
+    >>> where = lambda view: view['msg_id'] == 3 and view['trans'] > 5
+    >>> [r['trans'] for r in struct.scan(buffer, where)]
+    [7]
+
+    :copyright: Copyright 2011 by the University of Paderborn
+    :license: BSD, see LICENSE for details
+"""
+
+from striptease.checksum import Checksum
+from striptease.conditional import Optional
+from striptease.numbers import Float
+
+
+class RecordView(object):
+    """
+    A lazy, read-only view of the record starting at ``pos`` in ``buffer``.
+    Fields are decoded on access, numbers are unpacked directly from the
+    buffer. ``values`` holds the :py:attr:`dependencies <.Plan>` decoded by
+    :py:meth:`.Plan.locate`, which other fields are decoded with. Like the
+    decoded dictionary, absent :py:class:`.Optional` fields are not
+    contained in the view. Views are handed to the callable predicates of
+    :py:func:`scan`.
+    """
+
+    def __init__(self, plan, buffer, pos, positions, end, values):
+        self.plan = plan
+        self.buffer = buffer
+        self.pos = pos
+        self.positions = positions
+        self.end = end
+        self.values = values
+
+    def __getitem__(self, name):
+        field = self.plan[name]
+        start = self.positions[self.plan.order[name]]
+        if field.codec is not None:
+            return field.codec.unpack_from(self.buffer, start)[0]
+        rest, values = field.token.decode(self.buffer[start:self.end],
+                                          dict(self.values))
+        if name not in values: # an absent optional field
+            raise KeyError(name)
+        return values[name]
+
+    def __contains__(self, name):
+        if name not in self.plan:
+            return False
+        token = self.plan[name].token
+        return not isinstance(token, Optional) or \
+            token.present(dict(self.values))
+
+    def get(self, name, default=None):
+        """ The value of the field ``name``, or ``default`` if absent """
+        return self[name] if name in self else default
+
+    def decode(self):
+        """ Decode the whole record into a dictionary """
+        rest, dikt = self.plan.decode(self.buffer[self.pos:self.end], dict())
+        return dikt
+
+
+def has_float(token):
+    """ Whether ``token`` is or contains a :py:class:`.Float` """
+    return isinstance(token, Float) or \
+        any(has_float(child) for child in token.children())
+
+
+def value_decoder(field):
+    """
+    Compile a function returning the value of the static-sized ``field``
+    from a buffer and the position of the field.
+    """
+    if field.codec is not None:
+        unpack_from = field.codec.unpack_from
+        return lambda buffer, start: unpack_from(buffer, start)[0]
+    token, name, size = field.token, field.name, field.size
+    if isinstance(token, Checksum): # the value follows the checksummed data
+        unpack_from, skip = token.codec.unpack_from, size - token.codec.size
+        return lambda buffer, start: unpack_from(buffer, start + skip)[0]
+    return lambda buffer, start: token.decode(buffer[start:start + size],
+                                              dict())[1][name]
+
+
+def compile_where(plan, where):
+    """
+    Encode the values of the ``where`` dictionary once. Returns a list of
+    ``(index, offset, size, expected, decode)``, where ``index`` is the
+    position of the field in the plan and ``offset`` its static offset or
+    ``None``. ``expected`` are the expected bytes, or the expected value if
+    the field contains floats or is a checksum. Then ``decode`` is its
+    :py:func:`value_decoder`, otherwise ``None``.
+    """
+    tests = list()
+    for name, value in where.items():
+        if name not in plan:
+            raise KeyError('%s has no field %r' % (plan.struct.name, name))
+        field = plan[name]
+        if field.size is None:
+            raise ValueError('Cannot compare %r, it has no static size'
+                             % name)
+        if has_float(field.token) or isinstance(field.token, Checksum):
+            expected, decode = value, value_decoder(field)
+        elif field.codec is not None:
+            expected, decode = field.codec.pack(value), None
+        else:
+            expected, decode = field.token.encode({name: value}, "")[1], None
+        tests.append((plan.order[name], field.offset, field.size, expected,
+                      decode))
+    # compare fields with static offsets first, they need no locating
+    tests.sort(key=lambda test: test[1] is None)
+    return tests
+
+
+def scan(struct_token, buffer, where=None):
+    """
+    Generator yielding the decoded records of ``struct_token`` in
+    ``buffer``, which match ``where``.
+
+    ``where`` is either a dictionary of field names and values, which are
+    compared with the raw bytes of every record, or a callable, which gets a
+    :py:class:`.RecordView` of every record and returns whether the record
+    matches. Without ``where``, all records are decoded.
+    """
+    plan = struct_token.plan()
+    if where is None:
+        where = dict()
+    tests = None if callable(where) else compile_where(plan, where)
+    size = plan.size
+    pos, end = 0, len(buffer)
+    while pos < end:
+        if tests is not None and size is not None:
+            # fixed-size records: compare right at the static offsets
+            for index, offset, length, expected, decode in tests:
+                start = pos + offset
+                if decode is None:
+                    if buffer[start:start + length] != expected:
+                        break
+                elif decode(buffer, start) != expected:
+                    break
+            else:
+                yield plan.decode(buffer[pos:pos + size], dict())[1]
+            pos += size
+            continue
+        positions, record_end, values = plan.locate(buffer, pos)
+        if tests is not None:
+            match = True
+            for index, offset, length, expected, decode in tests:
+                start = positions[index]
+                if decode is None:
+                    match = buffer[start:start + length] == expected
+                else:
+                    match = decode(buffer, start) == expected
+                if not match:
+                    break
+        else:
+            match = where(RecordView(plan, buffer, pos, positions,
+                                     record_end, values))
+        if match:
+            yield plan.decode(buffer[pos:record_end], dict())[1]
+        if record_end <= pos:
+            break
+        pos = record_end
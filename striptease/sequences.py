@@ -11,12 +11,24 @@
     :license: BSD, see LICENSE for details
 """
 
+import sys
+import array
 import struct
 
-from striptease.base import Token, Struct
+from striptease.base import Token, Struct, Padding, as_bytes, decode_token
+from striptease.numbers import Number
 from striptease.util import logged
 
 
+BYTEORDER = {
+    '@': sys.byteorder,
+    '=': sys.byteorder,
+    '<': 'little',
+    '>': 'big',
+    '!': 'big',
+}
+
+
 class LengthSpecifier(Token):
     """
     Abstract base class of all LengthSpecifier token.
@@ -36,6 +48,8 @@ class LengthSpecifier(Token):
 
     """
 
+    takes_trusted = True
+
     def __init__(self, seqtype):
         Token.__init__(self)
         self.seqtype = seqtype
@@ -44,6 +58,19 @@ class LengthSpecifier(Token):
     def name(self):
         return self.seqtype.name
 
+    def children(self):
+        return [self.seqtype]
+
+    def decode_sequence(self, length, payload, dikt, trusted=False):
+        """
+        Decode ``length`` elements of the sequence, like
+        :py:func:`.decode_token` passes ``trusted`` on if the sequence takes
+        it.
+        """
+        if trusted and self.seqtype.takes_trusted:
+            return self.seqtype.decode(length, payload, dikt, trusted)
+        return self.seqtype.decode(length, payload, dikt)
+
 
 class Static(LengthSpecifier):
     """
@@ -64,17 +91,23 @@ class Static(LengthSpecifier):
         """
         return self.seqtype.encode(self.length, dikt, payload)
 
-    def decode(self, payload, dikt):
+    def iter_encode(self, dikt):
+        return self.seqtype.iter_encode(self.length, dikt)
+
+    def decode(self, payload, dikt, trusted=False):
         """
         Slice self.length * self.atype.length bytes from front of payload,
         decodes the data and stores it as a tuple in dikt. Then returns the
         shortened payload and the dikt
         """
-        return self.seqtype.decode(self.length, payload, dikt)
+        return self.decode_sequence(self.length, payload, dikt, trusted)
 
     def lenght(self, parm):
         return self.seqtype.length(self.length, parm)
 
+    def static_size(self):
+        return self.seqtype.static_size(self.length)
+
 
 class Dynamic(LengthSpecifier):
     """
@@ -132,9 +165,17 @@ class Dynamic(LengthSpecifier):
             pass # TODO: raise Exception
 
 
+    def sequence_length(self, dikt):
+        """
+        The length of the sequence in ``dikt``. A missing sequence, e.g. an
+        absent :py:class:`.Optional` one, has the length of an empty one.
+        """
+        return self.comp_len(dikt.get(self.seqtype.name, self.seqtype.EMPTY))
+
     def length_token__encode(self, dikt, payload=""):
         """ This is for patching the length-token's encode method """
-        dikt[self.len_name] = self.comp_len(dikt[self.seqtype.name])
+        if self.seqtype.name in dikt or self.len_name not in dikt:
+            dikt[self.len_name] = self.sequence_length(dikt)
         return self.sub_encode(dikt, payload)
 
     def length_token__decode_len(self, payload):
@@ -150,10 +191,14 @@ class Dynamic(LengthSpecifier):
         length = self.comp_len(dikt[self.seqtype.name])
         return self.seqtype.encode(length, dikt, payload)
 
-    def decode(self, payload, dikt):
+    def iter_encode(self, dikt):
+        length = self.comp_len(dikt[self.seqtype.name])
+        return self.seqtype.iter_encode(length, dikt)
+
+    def decode(self, payload, dikt, trusted=False):
         """ look up length and dispatch to sequence token """
         length = dikt[self.len_name]
-        return self.seqtype.decode(length, payload, dikt)
+        return self.decode_sequence(length, payload, dikt, trusted)
 
     def encode_len(self, dikt):
         """ compute length and dispatch to sequence token """
@@ -193,8 +238,11 @@ class Consumer(LengthSpecifier):
     def encode(self, dikt, payload=""):
         return self.seqtype.encode(-1, dikt, payload)
 
-    def decode(self, payload, dikt):
-        return self.seqtype.decode(-1, payload, dikt)
+    def iter_encode(self, dikt):
+        return self.seqtype.iter_encode(-1, dikt)
+
+    def decode(self, payload, dikt, trusted=False):
+        return self.decode_sequence(-1, payload, dikt, trusted)
 
     def encode_len(self, dikt):
         return self.seqtype.length(-1, dikt)
@@ -210,6 +258,9 @@ class Sequence(Token):
     :py:meth:`.Token.decode_len`.
     """
 
+    #: the value of an empty sequence
+    EMPTY = ()
+
     def __init__(self):
         Token.__init__(self)
 
@@ -230,6 +281,15 @@ class Sequence(Token):
         """
         raise AttributeError("Not implemented")
 
+    def iter_encode(self, length, dikt):
+        """
+        Extends :py:meth:`.Token.iter_encode` by requiring ``length`` as a
+        parameter. Yields the result of :py:meth:`encode <.Sequence.encode>`
+        by default.
+        """
+        dikt, payload = self.encode(length, dikt, "")
+        yield payload
+
     def decode(self, length, dikt, payload=""):
         """
         Extends :py:meth:`.Token.decode` by requiring ``length`` as a
@@ -284,6 +344,14 @@ class Sequence(Token):
         else:
             raise TypeError('parm must be of str or dict')
 
+    def static_size(self, length=1):
+        """
+        Extends :py:meth:`.Token.static_size` by requiring ``length`` as a
+        parameter. Returns the length in bytes of ``length`` elements, or
+        ``None`` if the size of an element is data-dependent.
+        """
+        return None
+
 
 @logged()
 class Array(Sequence):
@@ -294,13 +362,22 @@ class Array(Sequence):
     instantiation and array-type specification in one line.
 
     .. todo:: example for `of`
+
+    Arrays of ``uint8`` may be decoded into a ``memoryview`` of the payload
+    instead of a list by passing ``view=True``, see :ref:`views`.
     """
 
-    def __init__(self, name, reverse=False):
+    takes_trusted = True
+
+    def __init__(self, name='', reverse=False, view=False):
         Sequence.__init__(self)
+        if view and reverse:
+            raise ValueError('Reversed arrays cannot be decoded as views')
         self.name = name
         self.reverse = reverse
+        self.view = view
         self.atype = None
+        self._decoder = None
 
     def of(self, atype):
         """
@@ -311,55 +388,203 @@ class Array(Sequence):
         :returns: ``self`` i.e.: the instance of :py:class:`.Array` on which
                   this method was called
         """
+        if self.view and not (isinstance(atype, Number) and
+                              atype.fmt()[-1] == 'B'):
+            raise ValueError('Only arrays of uint8 can be decoded as views')
         self.atype = atype
         self.atype.parent = self
+        self._decoder = None
         return self
 
+    def children(self):
+        return [self.atype] if self.atype else []
+
     def encode(self, length, dikt, payload=""):
         """
         Extract data by name from dikt, encode and append to payload.
         """
         data = dikt[self.name]
+        if not self.reverse and self.passthrough(data):
+            if length != -1 and not self.trusted:
+                assert len(data) == length
+            return dikt, payload + as_bytes(data)
         if self.reverse:
             data = tuple(reversed(data))
-        if length != -1:
+        if length != -1 and not self.trusted:
             assert len(data) == length
         for i, d in enumerate(data):
             self.atype.name = i
             data, payload = self.atype.encode(data, payload)
         return dikt, payload
 
-    def consume(self, payload, dikt):
+    def iter_encode(self, length, dikt):
+        """
+        Yield the chunks of all array elements one after another. If the
+        value already is an ``array.array`` or ``bytearray`` with the binary
+        layout of the encoded array, it is handed out as it is.
+        """
+        data = dikt[self.name]
+        if not self.reverse and self.passthrough(data):
+            if length != -1 and not self.trusted:
+                assert len(data) == length
+            yield data
+            return
+        if self.reverse:
+            data = tuple(reversed(data))
+        if length != -1 and not self.trusted:
+            assert len(data) == length
+        for i in range(len(data)):
+            self.atype.name = i
+            for chunk in self.atype.iter_encode(data):
+                yield chunk
+
+    def passthrough(self, data):
+        """
+        Check whether ``data`` is an ``array.array``, a ``bytearray`` or a
+        ``memoryview``, whose memory representation is exactly the encoding
+        of this array.
+        """
+        atype = self.atype
+        fmt = getattr(atype, 'fmt', None)
+        if fmt is None or not hasattr(atype, 'endian'):
+            return False
+        code = fmt()[-1]
+        if isinstance(data, (bytearray, memoryview)):
+            return code == 'B' and getattr(data, 'itemsize', 1) == 1
+        if not isinstance(data, array.array) or data.typecode == 'u':
+            return False
+        if data.itemsize != atype.static_size():
+            return False
+        if data.itemsize > 1 and BYTEORDER[atype.endian] != sys.byteorder:
+            return False
+        if code in 'fd':
+            return data.typecode in 'fd'
+        return (data.typecode in 'bhilq') == (code in 'bhilq')
+
+    def consume(self, payload, dikt, trusted=False):
         """
         Try and decode all of the remaining payload. This method is used in
         the case an Array is with a :py:class:`.Consumer` length-specifier.
         """
+        if self.view:
+            return self.extract(len(payload), payload, dikt)
+        decoder = self.element_decoder()
+        if decoder is not None and decoder[0] and not self.reverse \
+                and not len(payload) % decoder[0]:
+            return self.extract(len(payload) // decoder[0], payload, dikt,
+                                trusted)
         array = []
         buf = dict()
         self.atype.name = self.name + '__buf'
         while payload:
-            payload, buf = self.atype.decode(payload, buf)
+            payload, buf = decode_token(self.atype, payload, buf, trusted)
             array.extend(buf.values())
         dikt[self.name] = array
         return payload, dikt
 
-    def extract(self, length, payload, dikt):
+    def element_decoder(self):
+        """
+        Compile the decoding of a single element, if the array is an array
+        of :py:class:`Structs <.Struct>`. Returns ``(size, decode)`` or
+        ``None`` for other element types.
+
+        If the elements have a static ``size``, ``decode(payload, pos,
+        trusted)`` returns the element at ``pos`` in ``payload``. Elements
+        consisting only of numbers and paddings are unpacked with a single
+        precompiled ``struct.Struct`` into a new dict, other elements are
+        decoded via the :py:meth:`.Struct.plan` of the element.
+
+        Otherwise ``size`` is ``None`` and ``decode(payload, trusted)``
+        returns the element at the front of ``payload`` and the remaining
+        payload.
+        """
+        atype = self.atype
+        if type(atype) != Struct:
+            return None
+        plan = atype.plan()
+        if self._decoder is None or self._decoder[0] is not plan:
+            self._decoder = plan, self.compile_element(plan)
+        return self._decoder[1]
+
+    @staticmethod
+    def compile_element(plan):
+        size = plan.size
+        if size is None:
+            def decode(payload, trusted):
+                payload, element = plan.decode(payload, dict(), trusted)
+                return element, payload
+            return size, decode
+        if len(plan.steps) != 1 or plan.steps[0][0] != 'run':
+            def decode(payload, pos, trusted):
+                return plan.decode(payload[pos:pos + size], dict(), trusted)[1]
+            return size, decode
+
+        kind, codec, tokens = plan.steps[0]
+        unpack_from = codec.unpack_from
+        fields = [(i, token.name) for i, token in enumerate(tokens)
+                  if not isinstance(token, Padding)]
+        paddings = [(i, token.padd) for i, token in enumerate(tokens)
+                    if isinstance(token, Padding) and token.verify]
+        if len(fields) == len(tokens):
+            names = [name for i, name in fields]
+            def decode(payload, pos, trusted):
+                return dict(zip(names, unpack_from(payload, pos)))
+        else:
+            def decode(payload, pos, trusted):
+                values = unpack_from(payload, pos)
+                if not trusted:
+                    for i, padd in paddings:
+                        assert values[i] == padd
+                return dict([(name, values[i]) for i, name in fields])
+        return size, decode
+
+    def extract(self, length, payload, dikt, trusted=False):
         """
         Slice ``length * self.atype.length`` bytes from front of payload,
         decodes the data and stores it as a tuple in dikt. Then returns the
         shortened payload and the dikt
-        """
-        array = [None] * length
-        for i in range(length):
-            self.atype.name = i
-            self.logger.debug("Array type: %s, Name: %s" % (self.atype, self.atype.name))
-            payload, array = self.atype.decode(payload, array)
+
+        Arrays of numbers are unpacked at once, arrays of structs use the
+        precompiled :py:meth:`element_decoder`. With ``view``, the array is
+        a ``memoryview`` into ``payload``. If ``trusted`` is ``True``, the
+        elements are not validated, see :py:meth:`.Plan.decode`.
+        """
+        if self.view:
+            if len(payload) < length:
+                raise struct.error('%s needs %d bytes, %d left'
+                                   % (self.name, length, len(payload)))
+            dikt[self.name] = memoryview(payload)[:length]
+            return payload[length:], dikt
+        atype = self.atype
+        decoder = self.element_decoder()
+        if isinstance(atype, Number):
+            codec = struct.Struct(atype.endian + '%d%s' % (length,
+                                                           atype.fmt()[-1]))
+            array = list(codec.unpack_from(payload))
+            payload = payload[codec.size:]
+        elif decoder is not None and decoder[0] is not None:
+            size, decode = decoder
+            trusted = trusted or self.trusted or atype.trusted
+            array = [decode(payload, pos, trusted)
+                     for pos in range(0, length * size, size)]
+            payload = payload[length * size:]
+        elif decoder is not None:
+            decode = decoder[1]
+            trusted = trusted or self.trusted or atype.trusted
+            array = [None] * length
+            for i in range(length):
+                array[i], payload = decode(payload, trusted)
+        else:
+            array = [None] * length
+            for i in range(length):
+                atype.name = i
+                payload, array = decode_token(atype, payload, array, trusted)
         if self.reverse:
             array = list(reversed(array))
         dikt[self.name] = array
         return payload, dikt
 
-    def decode(self, length, payload, dikt):
+    def decode(self, length, payload, dikt, trusted=False):
         """
         For readability reaseons this method dispatches to two other methods,
         based on the wrapping :py:class:`.LengthSpecifier`
@@ -373,9 +598,9 @@ class Array(Sequence):
                 length.
         """
         if length == -1:
-            return self.consume(payload, dikt)
+            return self.consume(payload, dikt, trusted)
         else:
-            return self.extract(length, payload, dikt)
+            return self.extract(length, payload, dikt, trusted)
 
     def atype_length(self, parm):
         """
@@ -400,6 +625,12 @@ class Array(Sequence):
             _length = length * _length
             return _lenght, payload[_length:]
 
+    def static_size(self, length=1):
+        size = self.atype.static_size()
+        if size is None:
+            return None
+        return length * size
+
 
 @logged()
 class String(Sequence):
@@ -413,37 +644,72 @@ class String(Sequence):
                     have sequences whose direction have a semantic but, for
                     mysterious reasons, are encoded reverse to that semantic
                     direction. defaults to ``False``
+    :param view: (optional) decode into a ``memoryview`` of the payload
+                 instead of a copy, see :ref:`views`. Padding is not
+                 stripped from views. Defaults to ``False``
     """
 
-    def __init__(self, name, endian='!', reverse=False):
+    EMPTY = ""
+
+    def __init__(self, name='', endian='!', reverse=False, view=False):
         Sequence.__init__(self)
+        if view and reverse:
+            raise ValueError('Reversed strings cannot be decoded as views')
         self.name = name
         self.endian = endian
         self.reverse = reverse
+        self.view = view
 
     def encode(self, length, dikt, payload=""):
         """
         Extract data by name from dikt, encode and append to payload
         """
         value = dikt[self.name]
+        if not isinstance(value, bytes):
+            value = as_bytes(value)
         if length == -1: # consumer case
             length = len(value)
         else:
             value = value[:length]
         if self.reverse:
-            value = "".join(reversed(value))
+            value = value[::-1]
         payload += struct.pack('%ds' % length, value)
         return dikt, payload
 
+    def iter_encode(self, length, dikt):
+        """
+        Yield the value as it is, if it needs neither padding nor reversal,
+        truncated values are handed out as a ``memoryview``. Otherwise fall
+        back to :py:meth:`.encode`.
+        """
+        value = dikt[self.name]
+        if not self.reverse and length in (-1, len(value)):
+            yield value
+        elif not self.reverse and length < len(value):
+            yield memoryview(value)[:length]
+        else:
+            dikt, payload = self.encode(length, dikt, "")
+            yield payload
+
     def decode(self, length, payload, dikt):
         """
         Cuts off ``length`` bytes from payload, converts to a string and puts
         the result into ``dikt``. If ``length == -1``, the remaining payload
         is 'consumed' and decoded.
+
+        With ``view``, the value is a ``memoryview`` into ``payload``.
         """
+        if self.view:
+            if length == -1:
+                length = len(payload)
+            elif len(payload) < length:
+                raise struct.error('%s needs %d bytes, %d left'
+                                   % (self.name, length, len(payload)))
+            dikt[self.name] = memoryview(payload)[:length]
+            return payload[length:], dikt
         if length == -1: # consumer case
             if self.reverse:
-                value = "".join(reversed(payload))
+                value = payload[::-1]
             else:
                 value = payload
             dikt[self.name] = value
@@ -452,12 +718,19 @@ class String(Sequence):
             data, payload = payload[:length], payload[length:]
             self.logger.debug("payload: %r, length: %d", payload, len(payload))
             value = struct.unpack('%ds' % length, data)
-            value = value[0].strip('\x00')
-            if self.reverse:
-                value = "".join(reversed(value))
-            dikt[self.name] = value
+            dikt[self.name] = self.unpad(value[0])
         return payload, dikt
 
+    def unpad(self, value):
+        """
+        Strip the padding NUL-bytes from a decoded ``value`` and reverse it,
+        if necessary.
+        """
+        value = value.strip(b'\x00')
+        if self.reverse:
+            value = value[::-1]
+        return value
+
     def encode_len(self, length, dikt):
         if length == -1: # consumer case
             data = dikt[self.name]
@@ -471,6 +744,9 @@ class String(Sequence):
         else:
             return length, payload[length:]
 
+    def static_size(self, length=1):
+        return length
+
     def __getitem__(self, key):
         """
         This method provides a convenient shorthand notation for specifying
@@ -506,6 +782,109 @@ class String(Sequence):
                 pass # TODO: raise Error
 
 
+@logged()
+class PaddedString(String):
+    """
+    A :py:class:`.String` of fixed width, which is padded with ``pad`` bytes
+    on the right. Unlike :py:class:`.String`, decoding only strips padding
+    from the right, so leading NUL-bytes are preserved.
+
+    :param encoding: (optional) if given, values are text, which is encoded
+                     and decoded with this codec
+    :param pad: (optional) the padding byte, defaults to ``'\\x00'``
+
+    >>> from striptease import PaddedString
+    >>> token = PaddedString('foo')[6]
+    >>> token.encode({'foo': '\\x00bar'})[1]
+    '\\x00bar\\x00\\x00'
+    """
+
+    def __init__(self, name='', encoding=None, pad='\x00', reverse=False):
+        String.__init__(self, name, reverse=reverse)
+        self.encoding = encoding
+        self.pad = pad
+
+    def encode(self, length, dikt, payload=""):
+        value = dikt[self.name]
+        if self.encoding and not isinstance(value, bytes):
+            value = value.encode(self.encoding)
+        if length != -1:
+            value = value[:length]
+        if self.reverse:
+            value = value[::-1]
+        if length != -1:
+            value = value.ljust(length, self.pad)
+        return dikt, payload + value
+
+    def iter_encode(self, length, dikt):
+        dikt, payload = self.encode(length, dikt, "")
+        yield payload
+
+    def decode(self, length, payload, dikt):
+        if length == -1: # consumer case
+            data, payload = payload, payload[:0]
+        else:
+            data, payload = payload[:length], payload[length:]
+        dikt[self.name] = self.unpad(data)
+        return payload, dikt
+
+    def unpad(self, value):
+        value = value.rstrip(self.pad)
+        if self.reverse:
+            value = value[::-1]
+        if self.encoding:
+            value = value.decode(self.encoding)
+        return value
+
+
+class CString(Token):
+    """
+    A NUL-terminated string of variable length, like a ``char *`` in C. The
+    token needs no :py:class:`.LengthSpecifier`, decoding scans for the
+    terminating NUL-byte.
+
+    :param encoding: (optional) if given, values are text, which is encoded
+                     and decoded with this codec
+
+    >>> from striptease import CString
+    >>> CString('foo').decode('bar\\x00moo', dict())
+    ('moo', {'foo': 'bar'})
+    """
+
+    def __init__(self, name='', encoding=None):
+        Token.__init__(self)
+        self.name = name
+        self.encoding = encoding
+
+    def encode(self, dikt, payload=""):
+        value = dikt[self.name]
+        if self.encoding and not isinstance(value, bytes):
+            value = value.encode(self.encoding)
+        if '\x00' in value:
+            raise ValueError('%s must not contain NUL-bytes' % self.name)
+        return dikt, payload + value + '\x00'
+
+    def decode(self, payload, dikt):
+        end = payload.find('\x00')
+        if end == -1:
+            raise ValueError('Missing NUL-terminator for %s' % self.name)
+        value = payload[:end]
+        if self.encoding:
+            value = value.decode(self.encoding)
+        dikt[self.name] = value
+        return payload[end + 1:], dikt
+
+    def encode_len(self, dikt):
+        value = dikt[self.name]
+        if self.encoding and not isinstance(value, bytes):
+            value = value.encode(self.encoding)
+        return len(value) + 1, dikt
+
+    def decode_len(self, payload):
+        end = payload.find('\x00')
+        return end + 1, payload[end + 1:]
+
+
 def construct_array(token, len):
     """
     Convenience function to create an array from a given token-instance.
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+    striptease.shm
+    ~~~~~~~~~~~~~~
+
+    A ring buffer of encoded records in shared memory, which passes records
+    between processes without pickling. The producer encodes records
+    directly into the ring, the consumer decodes them or inspects them in
+    place via a lazy :py:class:`.RecordView`.
+
+    The ring is lock-free for exactly one producer and one consumer process:
+    both sides coordinate via two counters at the start of the shared block,
+    the total number of bytes written (``head``) and read (``tail``). Records
+    of structs with a static size are stored back-to-back, all other records
+    are prefixed with their length.
+
+    With Python 3.8 and later, the ring lives in a named
+    ``multiprocessing.shared_memory`` block, which other processes attach to
+    by its ``name``. Otherwise, an anonymous ``mmap`` is used, which is only
+    shared with child processes forked after creating the ring.
+
+    :copyright: Copyright 2011 by the University of Paderborn
+    :license: BSD, see LICENSE for details
+"""
+
+import time
+import struct
+
+from striptease.scan import RecordView
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
+#: Default capacity of a ring in bytes
+CAPACITY = 1 << 20
+
+# head, tail and capacity at the start of the shared block
+COUNTER = struct.Struct('@Q')
+HEAD, TAIL, SIZE = 0, 8, 16
+#: Offset of the record data within the shared block
+DATA = 64
+
+LENGTH = struct.Struct('=I')
+#: Length marking the end of the data, the next record starts at the front
+WRAP = 0xffffffff
+
+
+def allocate(size, name=None, create=True):
+    """
+    Allocate a shared block of ``size`` bytes, or attach to the block
+    ``name`` if ``create`` is ``False``. Returns the ``SharedMemory``
+    object, or ``None`` for an anonymous ``mmap``, and the writable buffer.
+    """
+    if shared_memory is not None:
+        shm = shared_memory.SharedMemory(name, create, size if create else 0)
+        return shm, shm.buf
+    if name is not None or not create:
+        raise ValueError('Named rings require multiprocessing.shared_memory '
+                         'of Python 3.8')
+    import mmap
+    return None, mmap.mmap(-1, size)
+
+
+class RecordRing(object):
+    """
+    A ring of records of ``struct_token`` with ``capacity`` bytes of shared
+    memory, a single record may take up to half of it. To attach to an
+    existing ring in another process, pass its ``name`` and
+    ``create=False``, the struct must be the same.
+
+    The producer calls :py:meth:`put`, the consumer :py:meth:`get` or
+    :py:meth:`peek` and :py:meth:`release`. All of them block while the
+    ring is full respectively empty, up to ``timeout`` seconds if given.
+    """
+
+    def __init__(self, struct_token, capacity=CAPACITY, name=None,
+                 create=True):
+        self.struct = struct_token
+        self.plan = struct_token.plan()
+        self.record_size = self.plan.size
+        self.prefix = 0 if self.record_size is not None else LENGTH.size
+        self.shm, self.buffer = allocate(DATA + capacity, name, create)
+        if create:
+            for offset, value in [(HEAD, 0), (TAIL, 0), (SIZE, capacity)]:
+                self.publish(offset, value)
+        self.capacity = COUNTER.unpack_from(self.buffer, SIZE)[0]
+        self.peeked = None
+
+    @property
+    def name(self):
+        """ The name of the shared memory block, ``None`` for an ``mmap`` """
+        return self.shm.name if self.shm is not None else None
+
+    def counter(self, offset):
+        return COUNTER.unpack_from(self.buffer, offset)[0]
+
+    def publish(self, offset, value):
+        """
+        Set the counter at ``offset``. ``pack_into`` zero-fills its target
+        before packing, so the other side could read a zero counter in
+        between. Hence the counter is packed first and copied at once.
+        """
+        self.buffer[offset:offset + COUNTER.size] = COUNTER.pack(value)
+
+    def wait(self, ready, timeout):
+        """
+        Wait until ``ready()`` returns a true value and return it, or
+        ``None`` after ``timeout`` seconds.
+        """
+        result = ready()
+        if result or timeout == 0:
+            return result
+        deadline = None if timeout is None else time.time() + timeout
+        delay = 0.00001
+        while not result:
+            if deadline is not None and time.time() >= deadline:
+                return None
+            time.sleep(delay)
+            delay = min(delay * 2, 0.001)
+            result = ready()
+        return result
+
+    def put(self, dikt, timeout=None):
+        """
+        Encode ``dikt`` into the ring. Records with a static size are packed
+        in place, all others are encoded and copied. Returns ``False`` if
+        the ring stayed full for ``timeout`` seconds.
+        """
+        data = None
+        size = self.record_size
+        if size is None:
+            dikt, data = self.plan.encode(dikt)
+            size = len(data)
+        need = self.prefix + size
+        if 2 * need > self.capacity:
+            # otherwise, the record may never fit behind the end of the data
+            raise ValueError('Record of %d bytes exceeds half the capacity '
+                             'of %d bytes' % (need, self.capacity))
+        head = self.counter(HEAD)
+        pos = head % self.capacity
+        skip = self.capacity - pos if self.capacity - pos < need else 0
+
+        def space():
+            return head + skip + need - self.counter(TAIL) <= self.capacity
+        if not self.wait(space, timeout):
+            return False
+
+        if skip:
+            if self.prefix and skip >= LENGTH.size:
+                LENGTH.pack_into(self.buffer, DATA + pos, WRAP)
+            head, pos = head + skip, 0
+        offset = DATA + pos
+        if self.prefix:
+            LENGTH.pack_into(self.buffer, offset, size)
+            offset += self.prefix
+        if data is None:
+            self.plan.encode_into(dikt, self.buffer, offset)
+        else:
+            self.buffer[offset:offset + size] = data
+        # publish the record only after it is written completely
+        self.publish(HEAD, head + need)
+        return True
+
+    def locate(self, timeout=None):
+        """
+        Return the offset and size of the next record in the shared block
+        and the ``tail`` behind it, or ``None`` if the ring stayed empty for
+        ``timeout`` seconds.
+        """
+        tail = self.counter(TAIL)
+        while True:
+            if not self.wait(lambda: self.counter(HEAD) != tail, timeout):
+                return None
+            pos = tail % self.capacity
+            left = self.capacity - pos
+            if self.prefix == 0:
+                if left < self.record_size:
+                    tail += left
+                    continue
+                return DATA + pos, self.record_size, tail + self.record_size
+            if left < LENGTH.size:
+                tail += left
+                continue
+            size = LENGTH.unpack_from(self.buffer, DATA + pos)[0]
+            if size == WRAP:
+                tail += left
+                continue
+            return DATA + pos + self.prefix, size, tail + self.prefix + size
+
+    def get(self, timeout=None):
+        """
+        Decode and remove the next record. Returns ``None`` if the ring
+        stayed empty for ``timeout`` seconds.
+        """
+        location = self.locate(timeout)
+        if location is None:
+            return None
+        offset, size, tail = location
+        data = bytes(self.buffer[offset:offset + size])
+        self.publish(TAIL, tail)
+        return self.plan.decode(data, dict())[1]
+
+    def peek(self, timeout=None):
+        """
+        Return a :py:class:`.RecordView` of the next record in place,
+        without copying or decoding it, or ``None`` if the ring stayed empty
+        for ``timeout`` seconds. The view is valid until :py:meth:`release`
+        is called, which removes the record.
+        """
+        location = self.locate(timeout)
+        if location is None:
+            return None
+        offset, size, tail = location
+        self.peeked = tail
+        positions, end, values = self.plan.locate(self.buffer, offset)
+        return RecordView(self.plan, self.buffer, offset, positions,
+                          offset + size, values)
+
+    def release(self):
+        """ Remove the record returned by the last :py:meth:`peek` """
+        if self.peeked is None:
+            raise ValueError('No record to release')
+        self.publish(TAIL, self.peeked)
+        self.peeked = None
+
+    def empty(self):
+        return self.counter(HEAD) == self.counter(TAIL)
+
+    def close(self):
+        """ Detach from the shared memory """
+        if self.shm is not None:
+            self.buffer = None
+            self.shm.close()
+        else:
+            self.buffer.close()
+
+    def unlink(self):
+        """ Free the shared memory block, call this once in the creator """
+        if self.shm is not None:
+            self.shm.unlink()
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+    striptease.stream
+    ~~~~~~~~~~~~~~~~~
+
+    Decoding from file-like objects. The fields of a struct are read from the
+    stream one by one, exactly as many bytes as they need. A trailing
+    :py:class:`.Consumer` is not read at all but decoded lazily: a
+    :py:class:`.String` becomes a :py:class:`.FileSlice` and an
+    :py:class:`.Array` becomes a generator over its elements, so arbitrarily
+    large blobs are processed with bounded memory.
+
+    Any object with a ``read`` method works as a stream, including ``mmap``
+    objects. Lazy strings additionally need ``seek`` and ``tell``.
+
+    :copyright: Copyright 2011 by the University of Paderborn
+    :license: BSD, see LICENSE for details
+"""
+
+import struct
+
+from striptease.base import decode_token
+from striptease.numbers import Number
+from striptease.conditional import Optional
+from striptease.sequences import Consumer, Dynamic, String, Array
+
+
+#: Number of bytes read at once when iterating over lazily decoded data
+CHUNK_SIZE = 64 * 1024
+
+
+def read_exactly(fileobj, size):
+    """
+    Read exactly ``size`` bytes from ``fileobj``. Raises an ``EOFError`` if
+    the stream ends before.
+    """
+    chunks = list()
+    while size > 0:
+        chunk = fileobj.read(size)
+        if not chunk:
+            raise EOFError('Stream ended %d bytes too early' % size)
+        chunks.append(chunk)
+        size -= len(chunk)
+    return chunks[0] if len(chunks) == 1 else "".join(chunks)
+
+
+def remaining(fileobj):
+    """
+    Return the number of bytes left in ``fileobj``, or ``None`` if the
+    stream is not seekable.
+    """
+    try:
+        pos = fileobj.tell()
+        fileobj.seek(0, 2)
+        end = fileobj.tell()
+        fileobj.seek(pos)
+    except (AttributeError, IOError, OSError, ValueError):
+        return None
+    return end - pos
+
+
+class FileSlice(object):
+    """
+    A lazy, read-only slice of ``length`` bytes of ``fileobj``, starting at
+    ``offset``. Data is only read on request, via :py:meth:`read`, by
+    iterating over the slice in chunks or via :py:meth:`tobytes`.
+
+    The slice keeps its own position, but shares ``fileobj`` with its
+    creator: it stays valid as long as ``fileobj`` is open.
+    """
+
+    def __init__(self, fileobj, offset, length):
+        self.fileobj = fileobj
+        self.offset = offset
+        self.length = length
+        self.pos = 0
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        left = self.length - self.pos
+        if size < 0 or size > left:
+            size = left
+        if not size:
+            return ""
+        self.fileobj.seek(self.offset + self.pos)
+        data = read_exactly(self.fileobj, size)
+        self.pos += size
+        return data
+
+    def seek(self, pos, whence=0):
+        if whence == 1:
+            pos += self.pos
+        elif whence == 2:
+            pos += self.length
+        self.pos = min(max(pos, 0), self.length)
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def iter_chunks(self, size=CHUNK_SIZE):
+        """ Iterate over the whole slice in chunks of ``size`` bytes """
+        pos = 0
+        while pos < self.length:
+            self.fileobj.seek(self.offset + pos)
+            chunk = read_exactly(self.fileobj, min(size, self.length - pos))
+            pos += len(chunk)
+            yield chunk
+
+    __iter__ = iter_chunks
+
+    def tobytes(self):
+        """ Read the whole slice into memory """
+        return "".join(self.iter_chunks())
+
+    def __repr__(self):
+        return '<FileSlice offset=%d length=%d>' % (self.offset, self.length)
+
+
+def iter_stream(fileobj, size=CHUNK_SIZE):
+    """ Iterate over the rest of a non-seekable stream in chunks """
+    while True:
+        chunk = fileobj.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_array(array, fileobj, chunk_size=CHUNK_SIZE):
+    """
+    Generator decoding the elements of ``array`` from the rest of
+    ``fileobj``, reading about ``chunk_size`` bytes at once. The elements of
+    the array must have a static size.
+    """
+    atype = array.atype
+    size = atype.static_size()
+    count = max(1, chunk_size // size)
+    codec = struct.Struct(atype.fmt()) if isinstance(atype, Number) else None
+    while True:
+        data = fileobj.read(count * size)
+        if not data:
+            return
+        if len(data) % size:
+            data += read_exactly(fileobj, size - len(data) % size)
+        if codec is not None:
+            for pos in range(0, len(data), size):
+                yield codec.unpack_from(data, pos)[0]
+        else:
+            values = [None] * (len(data) // size)
+            for i in range(len(values)):
+                atype.name = i
+                data, values = atype.decode(data, values)
+            for value in values:
+                yield value
+
+
+def consume(seqtype, fileobj):
+    """
+    Lazily decode the rest of ``fileobj`` with the sequence ``seqtype`` of a
+    :py:class:`.Consumer`.
+    """
+    if getattr(seqtype, 'reverse', False):
+        raise ValueError('Cannot lazily decode the reversed sequence %s'
+                         % seqtype.name)
+    if isinstance(seqtype, String):
+        length = remaining(fileobj)
+        if length is None:
+            return iter_stream(fileobj)
+        return FileSlice(fileobj, fileobj.tell(), length)
+    elif isinstance(seqtype, Array):
+        if seqtype.atype.static_size() is None:
+            raise ValueError('Cannot lazily decode %s, its elements have no '
+                             'static size' % seqtype.name)
+        return iter_array(seqtype, fileobj)
+    raise TypeError('Cannot lazily decode sequences of type %s'
+                    % type(seqtype))
+
+
+def decode_stream(struct_token, fileobj, dikt=None, trusted=False):
+    """
+    Decode one record of ``struct_token`` from ``fileobj`` into ``dikt`` and
+    return ``dikt``. Every field is read separately from the stream, a
+    trailing :py:class:`.Consumer` is decoded lazily, see :py:func:`consume`.
+    All other fields must either have a static size or be
+    :py:class:`.Dynamic` sequences of elements or :py:class:`.Optional`
+    token with static size. See :py:meth:`.Plan.decode` for ``trusted``.
+    """
+    if dikt is None:
+        dikt = dict()
+    for field in struct_token.plan().fields:
+        token = field.token
+        if isinstance(token, Consumer):
+            dikt[field.name] = consume(token.seqtype, fileobj)
+            continue
+        size = field.size
+        if size is None and isinstance(token, Dynamic):
+            size = token.seqtype.static_size(dikt[token.len_name])
+        elif size is None and isinstance(token, Optional):
+            size = token.size(dikt)
+        if size is None:
+            raise ValueError('Cannot determine the size of %s before '
+                             'reading it' % field.name)
+        decode_token(token, read_exactly(fileobj, size), dikt, trusted)
+    return dikt
@@ -6,28 +6,119 @@
     Utility module for striptease.
 """
 
-try:
-    import logbook as logging
-    Logger = logging.Logger
-except ImportError:
-    import logging
-    def Logger(name, level=None):
-        """
-        This is a function that emulates the logbook Logger constructor
-        """
+import os
+import sys
+import types
+
+#: Log levels, numerically compatible with the std-lib :py:mod:`logging`
+DEBUG, INFO, WARNING, ERROR, CRITICAL = 10, 20, 30, 40, 50
+LEVEL_NAMES = {
+    DEBUG: 'DEBUG',
+    INFO: 'INFO',
+    WARNING: 'WARNING',
+    ERROR: 'ERROR',
+    CRITICAL: 'CRITICAL',
+}
+
+
+def Logger(name, level=None):
+    """
+    Create a logbook Logger if logbook is installed, otherwise emulate the
+    logbook Logger constructor with the std-lib :py:mod:`logging`. ``level``
+    is one of the levels defined in this module.
+    """
+    try:
+        import logbook
+        if level:
+            return logbook.Logger(name, getattr(logbook, LEVEL_NAMES[level]))
+        return logbook.Logger(name)
+    except ImportError:
+        import logging
         logger = logging.getLogger(name)
         if level:
             logger.setLevel(level)
         return logger
 
 
+class LazyLogger(object):
+    """
+    A proxy which creates the actual logger on first use, so the logging
+    library is only imported once something is logged. The logger decides
+    which messages are logged by its own level and the configuration of its
+    parents, see :py:meth:`isEnabledFor`. Once it exists, the logging
+    methods of the proxy are replaced by those of the logger.
+    """
+
+    #: logging methods of the proxy and the methods of the logger they call
+    METHODS = {
+        'debug': 'debug',
+        'info': 'info',
+        'notice': 'info',
+        'warn': 'warning',
+        'warning': 'warning',
+        'error': 'error',
+        'exception': 'exception',
+        'critical': 'critical',
+        'log': 'log',
+    }
+
+    def __init__(self, name, level=None):
+        self.name = name
+        self.level = level
+        self._logger = None
+
+    @property
+    def logger(self):
+        if self._logger is None:
+            logger = Logger(self.name, level=self.level)
+            for method, target in self.METHODS.items():
+                setattr(self, method, getattr(logger, target))
+            self._logger = logger
+        return self._logger
+
+    def setLevel(self, level):
+        self.level = level
+        if self._logger is not None:
+            self._logger.setLevel(level)
+
+    def isEnabledFor(self, level):
+        """
+        Whether the actual logger logs messages of ``level``, which is one
+        of the levels defined in this module.
+        """
+        logger = self.logger
+        if hasattr(logger, 'isEnabledFor'):
+            return logger.isEnabledFor(level)
+        import logbook
+        return getattr(logbook, LEVEL_NAMES[level]) >= logger.level
+
+    def _proxy_method(method):
+        def log(self, *args, **kwargs):
+            self.logger # replaces this method by the one of the logger
+            return getattr(self, method)(*args, **kwargs)
+        log.__name__ = method
+        return log
+
+    debug = _proxy_method('debug')
+    info = _proxy_method('info')
+    notice = _proxy_method('notice')
+    warn = _proxy_method('warn')
+    warning = _proxy_method('warning')
+    error = _proxy_method('error')
+    exception = _proxy_method('exception')
+    critical = _proxy_method('critical')
+    log = _proxy_method('log')
+    del _proxy_method
+
 
 class logged(object):
     """
-    A decorator for injecting a logger into classes.
+    A decorator for injecting a logger into classes. The logger is created
+    lazily, see :py:class:`.LazyLogger`. Without a ``level``, the logger
+    inherits the level of its parents, e.g. of ``striptease``.
     """
 
-    def __init__(self, disable=False, level=logging.INFO):
+    def __init__(self, disable=False, level=None):
         self.disable=disable
         self.level=level
 
@@ -35,8 +126,8 @@ class logged(object):
         if self.disable:
             cls.logger = VoidLogger()
         else:
-            cls.logger = Logger('%s.%s' % (cls.__module__, cls.__name__),
-                                level=self.level)
+            cls.logger = LazyLogger('%s.%s' % (cls.__module__, cls.__name__),
+                                    level=self.level)
         return cls
 
 
@@ -49,6 +140,119 @@ class VoidLogger(object):
             critical = log = lambda *args, **kwargs: None
 
 
+class LazyModule(types.ModuleType):
+    """
+    A copy of ``module``, which calls the module level ``__getattr__`` of
+    ``module`` for missing attributes and keeps the result. Python versions
+    before 3.7 only call ``__getattr__`` of the class of a module.
+    """
+
+    def __init__(self, module):
+        types.ModuleType.__init__(self, module.__name__, module.__doc__)
+        self.__dict__.update(module.__dict__)
+        # the functions of module still use its globals, so keep it alive
+        self.__dict__['_module'] = module
+
+    def __getattr__(self, name):
+        value = self._module.__getattr__(name)
+        setattr(self, name, value)
+        return value
+
+
+#: Maximum number of buffers handed to the kernel in one call
+IOV_MAX = 1024
+
+
+def byte_view(buf):
+    """
+    A ``memoryview`` of the bytes of ``buf``, which may be any object
+    supporting the buffer protocol, sliced by bytes instead of elements.
+    """
+    if not hasattr(buf, 'tobytes') and hasattr(buf, 'tostring'):
+        buf = buf.tostring() # array.array in Python 2
+    view = memoryview(buf)
+    if hasattr(view, 'cast'):
+        view = view.cast('B')
+    return view
+
+
+def window(buf, start, end):
+    """
+    A read-only view of ``buf[start:end]`` without copying it. In Python 2
+    this is a ``buffer``, which unlike a ``memoryview`` is accepted by
+    ``zlib``, ``crcmod`` and ``mmap``.
+    """
+    if sys.version_info[0] == 2:
+        return buffer(buf, start, end - start)
+    return memoryview(buf)[start:end]
+
+
+def advance(views, sent):
+    """
+    Drop the first ``sent`` bytes from the deque ``views`` of bytestrings or
+    byte views after a partial write, the first remaining one is replaced
+    by a ``memoryview`` of its rest.
+    """
+    while sent:
+        view = views[0]
+        if sent >= len(view):
+            sent -= len(view)
+            views.popleft()
+        else:
+            views[0] = memoryview(view)[sent:]
+            sent = 0
+
+
+def gather(write, buffers):
+    """
+    Write all ``buffers`` with the scatter-gather function ``write``, which
+    takes a list of buffers and returns the number of bytes written. Handles
+    partial writes by slicing the buffers with ``memoryview``.
+    """
+    from collections import deque
+    from itertools import islice
+    views = deque(byte_view(buf) for buf in buffers if len(buf))
+    total = 0
+    while views:
+        sent = write(list(islice(views, IOV_MAX)))
+        total += sent
+        advance(views, sent)
+    return total
+
+
+def send_buffers(sock, buffers):
+    """
+    Send the list of ``buffers`` as returned by
+    :py:meth:`.Struct.encode_buffers` via ``sock.sendmsg``. Falls back to
+    one ``sendall`` per buffer, if ``sendmsg`` is not available.
+    """
+    if hasattr(sock, 'sendmsg'):
+        return gather(sock.sendmsg, buffers)
+    total = 0
+    for buf in buffers:
+        sock.sendall(buf)
+        total += len(buf) * getattr(buf, 'itemsize', 1)
+    return total
+
+
+def write_buffers(fd, buffers):
+    """
+    Write the list of ``buffers`` to the file descriptor ``fd`` via
+    ``os.writev``. Falls back to ``os.write``, if ``writev`` is not
+    available.
+    """
+    if hasattr(os, 'writev'):
+        return gather(lambda views: os.writev(fd, views), buffers)
+    total = 0
+    for buf in buffers:
+        view = byte_view(buf)
+        while len(view):
+            sent = os.write(fd, view)
+            view = view[sent:]
+            total += sent
+    return total
+
+
 if __name__ == '__main__':
     @logged(level=DEBUG)
     class A(object):
@@ -45,3 +45,81 @@ def test_struct():
         assert out_dikt['bar'] == bar, "%d != %d" % (out_dikt['bar'], bar)
         assert payload == ''
 
+
+
+def test_struct_plan():
+    coder_token = Struct().append(
+        uint8('foo'),
+        Padding('asdf'),
+        uint16('bar'),
+        Struct('baz').append(
+            uint32('moo'),
+            single('meh')
+        )
+    )
+    plan = coder_token.plan()
+    assert plan.size == 15
+    assert [f.offset for f in plan.fields] == [0, 1, 5, 7]
+    assert coder_token.plan() is plan
+    coder_token.append(uint8('bang'))
+    assert coder_token.plan() is not plan
+    assert coder_token.plan()['bang'].offset == 15
+
+
+def test_flat():
+    coder_token = Struct().append(
+        uint8('foo'),
+        Padding('asdf'),
+        Struct('baz').append(
+            uint32('moo'),
+            Struct('bang').append(
+                uint16('meh'),
+            ),
+        ),
+        uint16('bar'),
+    )
+    in_dikt = {'foo': 1, 'bar': 2, 'baz': {'moo': 3, 'bang': {'meh': 4}}}
+    flat = {'foo': 1, 'bar': 2, 'baz.moo': 3, 'baz.bang.meh': 4}
+    dikt, payload = coder_token.encode(in_dikt)
+    assert len(coder_token.flat_plan().steps) == 1
+    assert coder_token.flat_plan().keys == ['foo', 'baz.moo', 'baz.bang.meh',
+                                            'bar']
+    assert coder_token.encode_flat(dict(flat))[1] == payload
+    assert coder_token.decode_flat(payload) == ('', flat)
+
+
+def test_scan():
+    from striptease import Dynamic, String
+    for coder_token in [
+            Struct().append(uint8('msg_id'), uint16('trans')),
+            Struct().append(uint8('len'), Dynamic('len', String('data')),
+                            uint8('msg_id'), uint16('trans'))]:
+        records = [{'msg_id': i % 4, 'trans': i * 10, 'data': 'x' * i}
+                   for i in range(20)]
+        buffer = "".join(coder_token.encode(dict(r))[1] for r in records)
+        matches = list(coder_token.scan(buffer, {'msg_id': 3, 'trans': 150}))
+        assert [r['trans'] for r in matches] == [150]
+        where = lambda view: view['msg_id'] == 3 and view['trans'] > 100
+        matches = list(coder_token.scan(buffer, where))
+        assert [r['trans'] for r in matches] == [110, 150, 190]
+        assert len(list(coder_token.scan(buffer))) == 20
+    assert [r['data'] for r in coder_token.scan(
+        buffer, lambda view: view['data'] == 'xx')] == ['xx']
+
+
+def test_scan_floats():
+    from striptease import Dynamic, String, double
+    for coder_token in [
+            Struct().append(uint8('id'), double('value'), double('pair')[2]),
+            Struct().append(uint8('len'), Dynamic('len', String('data')),
+                            uint8('id'), double('value'), double('pair')[2])]:
+        values = [0.0, -0.0, 1.5, float('nan')]
+        buffer = "".join(coder_token.encode(
+            {'id': i, 'value': value, 'pair': [value, 1.0], 'data': 'x' * i}
+        )[1] for i, value in enumerate(values))
+        for where in [{'value': 0.0}, {'value': -0.0},
+                      {'pair': [-0.0, 1.0]}, {'id': 1, 'value': 0.0}]:
+            expected = [1] if 'id' in where else [0, 1]
+            assert [r['id'] for r in coder_token.scan(buffer, where)] \
+                == expected
+        assert list(coder_token.scan(buffer, {'value': float('nan')})) == []
@@ -1,3 +1,116 @@
 # -*- coding: utf-8 -*-
 
-assert False, "Implement Testcases for Checksum"
+import mmap
+
+import pytest
+
+from striptease import Struct, Dynamic, String, uint8, uint16
+from striptease.checksum import XOR, CRC, ChecksumError, crc_width
+
+
+def checksummed(checksum):
+    return Struct().append(
+        uint8('foo'),
+        checksum.child(Struct('inner').append(
+            uint8('len'),
+            uint16('bar'),
+            Dynamic('len', String('baz')),
+        )),
+        uint8('moo'),
+    )
+
+
+def test_checksums():
+    for checksum in [XOR('chk', 1), XOR('chk', 2), CRC('chk', 'crc-16'),
+                     CRC('chk', 'crc-32')]:
+        struct = checksummed(checksum)
+        dikt, payload = struct.encode({'foo': 1, 'moo': 2,
+                                       'inner': {'bar': 3, 'baz': 'hello'}})
+        payload, dikt = struct.decode(payload + 'rest', dict())
+        assert payload == 'rest'
+        assert dikt['inner'] == {'bar': 3, 'len': 5, 'baz': 'hello'}
+        assert dikt['foo'] == 1 and dikt['moo'] == 2
+
+
+def test_crc_width():
+    assert [crc_width(name) for name in ['crc-8', 'crc-16', 'crc-32',
+                                         'crc-64']] == [8, 16, 32, 64]
+    assert crc_width(0x11021) == 16
+    assert CRC('foo', 'crc-32').crc is CRC('bar', 'crc-32').crc
+
+
+def test_trusted():
+    struct = checksummed(CRC('chk', 'crc-32'))
+    dikt, payload = struct.encode({'foo': 1, 'moo': 2,
+                                   'inner': {'bar': 3, 'baz': 'hello'}})
+    corrupt = payload[:4] + 'j' + payload[5:]
+    with pytest.raises(ChecksumError):
+        struct.decode(corrupt, dict())
+    payload, dikt = struct.decode(corrupt, dict(), trusted=True)
+    assert dikt['inner']['baz'] == 'jello'
+    assert dikt['moo'] == 2
+    struct.trust()
+    payload, dikt = struct.decode(corrupt, dict())
+    assert dikt['inner']['baz'] == 'jello'
+    struct.trust(False)
+    with pytest.raises(ChecksumError):
+        struct.decode(corrupt, dict())
+
+
+def test_flat():
+    struct = checksummed(XOR('chk', 1))
+    dikt, payload = struct.encode({'foo': 1, 'moo': 2,
+                                   'inner': {'bar': 3, 'baz': 'hello'}})
+    flat = {'foo': 1, 'moo': 2, 'chk': dikt['chk'], 'inner.len': 5,
+            'inner.bar': 3, 'inner.baz': 'hello'}
+    assert struct.decode_flat(payload) == ('', flat)
+    del flat['chk'], flat['inner.len']
+    assert struct.encode_flat(flat)[1] == payload
+    assert flat['chk'] == dikt['chk']
+    corrupt = payload[:4] + 'j' + payload[5:]
+    with pytest.raises(ChecksumError):
+        struct.decode_flat(corrupt)
+    assert struct.decode_flat(corrupt, trusted=True)[1]['inner.baz'] == \
+        'jello'
+
+
+def test_scan():
+    static = Struct().append(
+        uint8('foo'),
+        XOR('chk', 1).child(Struct('inner').append(uint8('a'), uint16('b'))),
+        uint8('moo'),
+    )
+    for struct in [static, checksummed(XOR('chk', 1))]:
+        records = [struct.encode({'foo': i, 'moo': 2, 'inner': {
+            'a': i, 'b': 4, 'bar': 3, 'baz': 'x' * i}})[0]
+            for i in range(4)]
+        buffer = ''.join(struct.encode(dict(r))[1] for r in records)
+        chk = records[2]['chk']
+        if struct is static: # comparable, since it has a static size
+            assert [r['foo'] for r in struct.scan(buffer, {'chk': chk})] \
+                == [r['foo'] for r in records if r['chk'] == chk]
+        assert [r['foo'] for r in struct.scan(
+            buffer, lambda view: view['chk'] == chk and view['moo'] == 2)] \
+            == [r['foo'] for r in records if r['chk'] == chk]
+
+
+def test_patch():
+    for checksum in [XOR('chk', 1), XOR('chk', 2), CRC('chk', 'crc-16')]:
+        struct = checksummed(checksum)
+        dikt = {'foo': 1, 'moo': 2, 'inner': {'bar': 3, 'baz': 'hello'}}
+        buffer = bytearray(struct.encode(dikt)[1])
+        struct.patch(buffer, {'moo': 5, 'inner': {'bar': 0x1234}})
+        dikt['moo'], dikt['inner']['bar'] = 5, 0x1234
+        assert str(buffer) == struct.encode(dikt)[1]
+        with pytest.raises(ValueError):
+            struct.patch(buffer, {'inner': {'baz': 'jello'}})
+        with pytest.raises(ValueError):
+            struct.patch(buffer, {'inner': {'len': 3}})
+        with pytest.raises(ValueError):
+            struct.patch(buffer, {'chk': 0})
+
+        mapped = mmap.mmap(-1, len(buffer))
+        mapped[:] = str(buffer)
+        struct.patch(mapped, {'inner': {'bar': 7}})
+        dikt['inner']['bar'] = 7
+        assert mapped[:] == struct.encode(dikt)[1]
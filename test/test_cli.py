@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import json
+
+import pytest
+
+from striptease import cli, Struct, Padding, String, CString, uint8, uint32
+
+SCHEMA = '''
+from striptease import Struct, Dynamic, Static, Array, String, uint8, uint16
+
+def message():
+    return Struct().append(
+        uint8('len'),
+        uint16('msg_id'),
+        Dynamic('len', String('data')),
+        Struct('header').append(uint8('flags')),
+        Static(2, Array('trans').of(uint16(''))),
+    )
+'''
+
+
+def test_cli(tmpdir):
+    schema = tmpdir.join('schema.py')
+    schema.write(SCHEMA)
+    spec = '%s:message' % schema
+    struct_token = cli.load(spec)
+    records = [{'msg_id': i, 'data': 'a\x00b"' * (i % 5),
+                'header': {'flags': i % 3}, 'trans': [i, 2 * i]}
+               for i in range(50)]
+    binary = tmpdir.join('records.bin')
+    binary.write("".join(struct_token.encode(dict(r))[1] for r in records),
+                 'wb')
+    for fmt in ['jsonl', 'csv']:
+        for jobs in ['1', '2']:
+            text = str(tmpdir.join('records.' + fmt))
+            out = str(tmpdir.join('out.bin'))
+            assert cli.main(['decode', spec, str(binary), '-o', text, '-f',
+                             fmt, '-j', jobs, '-b', '7', '-q']) == 0
+            assert cli.main(['encode', spec, text, '-o', out, '-f', fmt,
+                             '-j', jobs, '-b', '7', '-q']) == 0
+            assert open(out, 'rb').read() == binary.read('rb')
+    lines = open(str(tmpdir.join('records.jsonl'))).read().splitlines()
+    assert len(lines) == 50
+    assert json.loads(lines[1])['data'] == 'a\\x00b"'
+
+
+class Reader(io.BytesIO):
+
+    def __init__(self, data):
+        io.BytesIO.__init__(self, data)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return io.BytesIO.read(self, size)
+
+
+def test_iter_batches(monkeypatch):
+    monkeypatch.setattr(cli, 'CHUNK_SIZE', 5)
+    struct_token = Struct().append(
+        CString('name'),
+        Struct('inner').append(uint8('n'), Padding('\xff'),
+                               String('s')['n']),
+    )
+    data = "".join(struct_token.encode({'name': 'x' * i, 'inner':
+                                        {'s': 'y' * (i % 4)}})[1]
+                   for i in range(10))
+    batches = list(cli.iter_batches(struct_token, Reader(data), 3))
+    assert len(batches) == 4 and "".join(batches) == data
+    with pytest.raises(ValueError):
+        list(cli.iter_batches(struct_token, Reader(data[:-1]), 3))
+
+    # a corrupt record is framed by its sizes and fails to decode
+    monkeypatch.setattr(cli, 'SCHEMA', struct_token)
+    batches = cli.iter_batches(struct_token,
+                               Reader(data.replace('\xff', '\xfe', 1)), 3)
+    with pytest.raises(AssertionError):
+        cli.decode_batch((next(batches), 'jsonl'))
+
+    # a large record is read up to its end at once
+    struct_token = Struct().append(uint32('n'), String('s')['n'])
+    data = struct_token.encode({'s': 'z' * 100000})[1]
+    reader = Reader(data)
+    assert list(cli.iter_batches(struct_token, reader)) == [data]
+    assert reader.reads <= 4
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+import string
+import random
+
+from striptease import Padding, Struct, Dynamic, Static, Array, String, \
+                       Integer, uint8, uint16, uint32
+from striptease.checksum import XOR
+
+
+def test_decode_columns():
+    # static records are unpacked by a single fused codec
+    coder_token = Struct().append(
+        uint8('foo'),
+        Padding('asdf'),
+        uint16('bar'),
+        uint32('moo'),
+    )
+    records = [dict(foo=i, bar=i * 3, moo=i * 7) for i in range(50)]
+    buffer = "".join(coder_token.encode(r)[1] for r in records)
+    columns = coder_token.decode_columns(buffer, ['moo', 'foo'])
+    assert sorted(columns) == ['foo', 'moo']
+    assert list(columns['foo']) == [r['foo'] for r in records]
+    assert list(columns['moo']) == [r['moo'] for r in records]
+
+    # dynamic records are delimited one by one
+    coder_token = Struct().append(
+        uint8('foo_len'),
+        Dynamic('foo_len', String('foo')),
+        Integer('bar', False, 2),
+        Static(3, Array('moo').of(Integer('', True, 4))),
+    )
+    records = []
+    for i in range(30):
+        foo = "".join(random.sample(string.ascii_letters, i % 10 + 1))
+        records.append(dict(foo=foo, bar=i, moo=[i, -i, 2 * i]))
+    buffer = "".join(coder_token.encode(dict(r))[1] for r in records)
+    columns = coder_token.decode_columns(buffer, ['bar', 'foo', 'moo'])
+    assert list(columns['bar']) == [r['bar'] for r in records]
+    assert list(columns['foo']) == [r['foo'] for r in records]
+    assert columns['moo'] == [r['moo'] for r in records]
+
+    # a checksum spans its child, it is no plain number
+    coder_token = Struct().append(
+        uint8('foo'),
+        XOR('chk', 1).child(Struct('inner').append(uint8('a'), uint16('b'))),
+        uint8('moo'),
+    )
+    payload = coder_token.encode({'foo': 1, 'moo': 2,
+                                  'inner': {'a': 3, 'b': 4}})[1]
+    columns = coder_token.decode_columns(payload * 3, ['moo', 'chk'])
+    assert list(columns['chk']) == [0xF8] * 3
+    assert list(columns['moo']) == [2] * 3
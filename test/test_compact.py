@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import random
+
+import pytest
+
+from striptease import Struct, Dynamic, Static, Consumer, Integer, uint8, \
+                       uint16
+from striptease import compact
+from striptease.compact import DeltaArray, RLEArray
+
+
+def series(length):
+    random.seed(length)
+    value, samples = 1 << 20, list()
+    for i in range(length):
+        if random.random() < 0.2:
+            value += random.randint(-100, 100)
+        samples.append(value)
+    return samples
+
+
+def structs(token):
+    return [
+        Struct().append(Static(200, token), uint8('end')),
+        Struct().append(uint16('count'), uint8('end'),
+                        Dynamic('count', token)),
+        Struct().append(uint8('end'), Consumer(token)),
+    ]
+
+
+@pytest.mark.parametrize('threshold', [1, compact.NUMPY_THRESHOLD])
+def test_compact(monkeypatch, threshold):
+    monkeypatch.setattr(compact, 'NUMPY_THRESHOLD', threshold)
+    samples = series(200)
+    for token in [DeltaArray('samples').of(Integer('', False, 4)),
+                  DeltaArray('samples', Integer('', True, 2, '<'))
+                  .of(Integer('', True, 4, '<')),
+                  RLEArray('samples').of(Integer('', False, 4)),
+                  RLEArray('samples', uint16('')).of(Integer('', True, 4))]:
+        for struct in structs(token):
+            dikt, payload = struct.encode({'samples': samples, 'end': 7})
+            assert len(payload) < 200 * 3
+            plan = struct.plan()
+            for decode in [struct.decode, plan.decode]:
+                rest, dikt = decode(payload, dict())
+                assert rest == ''
+                assert dikt['samples'] == samples
+                assert dikt['end'] == 7
+
+    token = Static(3, DeltaArray('samples').of(Integer('', False, 2)))
+    with pytest.raises(ValueError):
+        token.encode({'samples': [0, 1000, 1001]})
+
+
+@pytest.mark.parametrize('threshold', [1, compact.NUMPY_THRESHOLD])
+def test_overlong_run(monkeypatch, threshold):
+    monkeypatch.setattr(compact, 'NUMPY_THRESHOLD', threshold)
+    runs = Consumer(RLEArray('samples').of(uint16('')))
+    payload = runs.encode({'samples': [1, 1, 1, 2, 2]})[1]
+    for length in [2, 4]:
+        token = Static(length, RLEArray('samples').of(uint16('')))
+        with pytest.raises(ValueError):
+            token.decode(payload + payload, dict())
+
+
+def test_long_runs():
+    token = Consumer(RLEArray('samples').of(Integer('', True, 2)))
+    samples = [1] * 600 + [-1] * 10
+    payload = token.encode({'samples': samples})[1]
+    assert len(payload) == 4 * 3
+    assert token.decode(payload, dict())[1]['samples'] == samples
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from striptease import Struct, Dynamic, Consumer, Array, String, uint8, \
+                       uint16
+from striptease import compress
+from striptease.compress import Compressed, codec
+
+
+def test_compressed():
+    for name in ['zlib', 'bz2', 'lzma']:
+        try:
+            codec(name)
+        except ImportError:
+            continue
+        coder_token = Struct().append(
+            uint8('foo'),
+            Compressed(Struct('inner').append(
+                uint16('len'),
+                Dynamic('len', String('bar')),
+            ), name),
+            Compressed(Consumer(Array('moo').of(uint16(''))), name, 64),
+        )
+        for bar, moo in [('x', [1]), ('x' * 5000, range(1000))]:
+            in_dikt = {'foo': 1, 'inner': {'bar': bar}, 'moo': list(moo)}
+            dikt, payload = coder_token.encode(in_dikt)
+            assert len(payload) < 8000
+            assert coder_token.decode(payload, dict()) == ('', dikt)
+            assert "".join(coder_token.iter_encode(in_dikt)) == payload
+
+
+def test_raw():
+    coder_token = Compressed(Consumer(String('foo')), threshold=4)
+    assert coder_token.encode({'foo': 'bar'})[1] == '\x00\x00\x00\x00\x03bar'
+    payload = coder_token.encode({'foo': 'barbar'})[1]
+    assert payload[0] == '\x01'
+    assert coder_token.decode(payload + 'x', dict()) == ('x', {'foo': 'barbar'})
+    with pytest.raises(ValueError):
+        codec('rot13')
+
+
+def test_streamed(monkeypatch):
+    monkeypatch.setattr(compress, 'CHUNK_SIZE', 16)
+    inner = Struct('inner').append(
+        uint16('len'),
+        Dynamic('len', Array('bar').of(uint16(''))),
+        uint8('moo'),
+    )
+    coder_token = Struct().append(Compressed(inner, threshold=0), uint8('x'))
+    assert coder_token.structure[0].streamed()
+    in_dikt = {'inner': {'bar': list(range(300)), 'moo': 7}, 'x': 1}
+    dikt, payload = coder_token.encode(in_dikt)
+    assert coder_token.decode(payload, dict()) == ('', dikt)
+    with pytest.raises(TypeError):
+        Compressed(Dynamic('len', String('bar')))
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import io
+
+import pytest
+
+from striptease import Struct, Dynamic, String, uint8, uint16, uint32
+from striptease.conditional import Optional, If
+
+
+def conditional():
+    return Struct().append(
+        uint8('version'),
+        uint8('flags'),
+        If('flags', 0x02, uint32('seq'), mask=0x02),
+        uint16('len'),
+        Optional(Dynamic('len', String('data')),
+                 lambda dikt: dikt['version'] > 1),
+        uint8('moo'),
+        If('version', 3, Struct('ext').append(uint8('foo'), uint8('bar'))),
+    )
+
+
+def test_conditional():
+    coder_token = conditional()
+    records = [
+        {'version': 1, 'flags': 0, 'moo': 1},
+        {'version': 2, 'flags': 3, 'seq': 42, 'data': 'meh', 'moo': 2},
+        {'version': 3, 'flags': 1, 'data': '', 'moo': 3,
+         'ext': {'foo': 4, 'bar': 5}},
+    ]
+    buffer = ''
+    for record in records:
+        dikt, payload = coder_token.encode(dict(record))
+        assert coder_token.plan().encode(dict(record)) == (dikt, payload)
+        assert coder_token.decode(payload + 'x', dict()) == ('x', dikt)
+        assert coder_token.plan().decode(payload, dict()) == ('', dikt)
+        assert coder_token.decode_stream(io.BytesIO(payload)) == dikt
+        positions, end, values = coder_token.plan().locate(payload)
+        assert end == len(payload)
+        buffer += payload
+    assert len(payload) == 1 + 1 + 2 + 1 + 2
+    kinds = [step[0] for step in coder_token.plan().steps]
+    assert kinds == ['run', 'token', 'run', 'token', 'run', 'token']
+    assert [r['moo'] for r in coder_token.scan(buffer, {'moo': 2})] == [2]
+    # views decode optional fields with the conditions' fields
+    assert [r['moo'] for r in coder_token.scan(
+        buffer, lambda view: view.get('seq') == 42)] == [2]
+    assert [r['moo'] for r in coder_token.scan(
+        buffer, lambda view: 'data' not in view)] == [1]
+    with pytest.raises(KeyError):
+        list(coder_token.scan(buffer, lambda view: view['seq']))
+    columns = coder_token.decode_columns(buffer, ['seq', 'moo'])
+    assert list(columns['seq']) == [None, 42, None]
+
+
+def test_conditional_flat():
+    coder_token = Struct().append(
+        uint8('foo'),
+        Struct('baz').append(
+            uint8('flags'),
+            If('flags', 1, uint8('moo')),
+        ),
+    )
+    for flat in [{'foo': 1, 'baz.flags': 0}, {'foo': 1, 'baz.flags': 1,
+                                               'baz.moo': 7}]:
+        flat, payload = coder_token.encode_flat(flat)
+        assert coder_token.decode_flat(payload) == ('', flat)
+
+    coder_token = conditional() # with an optional struct
+    for flat in [{'version': 2, 'flags': 0, 'data': 'meh', 'moo': 1},
+                 {'version': 3, 'flags': 2, 'seq': 7, 'data': '', 'moo': 2,
+                  'ext.foo': 4, 'ext.bar': 5}]:
+        flat, payload = coder_token.encode_flat(flat)
+        assert payload == coder_token.encode(coder_token.decode(
+            payload, dict())[1])[1]
+        assert coder_token.decode_flat(payload) == ('', flat)
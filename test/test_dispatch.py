@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from striptease import Struct, String, uint8, uint16
+from striptease.dispatch import Dispatcher
+
+
+class Store(object):
+
+    def __init__(self, name=''):
+        self.name = name
+
+
+def test_dispatcher():
+    dispatcher = Dispatcher(Struct().append(
+        uint16('length'),
+        uint8('msg_id'),
+    ))
+    dispatcher.register(0x01, Struct().append(
+        uint8('nlen'),
+        String('name')['nlen'],
+    ), Store)
+    dispatcher.register(0x02, Struct().append(uint16('status')))
+    with pytest.raises(LookupError):
+        dispatcher.register(0x02, Struct())
+    dispatcher.register('ping', Struct())
+    with pytest.raises(LookupError) as error:
+        dispatcher.register('ping', Struct())
+    assert "'ping'" in str(error.value)
+
+    stream = dispatcher.encode(0x01, Store('foo')) + \
+        dispatcher.encode(0x02, {'status': 7})
+    assert dispatcher.peek(stream) == (1, 4)
+    end = dispatcher.frame(stream)
+    assert end == 7 and dispatcher.frame(stream, end) == len(stream)
+    assert dispatcher.frame(stream[:-1], end) is None
+    message = dispatcher.decode(stream, 0, end)
+    assert isinstance(message, Store) and message.name == 'foo'
+    assert dispatcher.decode(stream, end) == {'status': 7}
+
+    with pytest.raises(ValueError):
+        dispatcher.decode(stream)
+    with pytest.raises(ValueError):
+        dispatcher.decode('\x00\x00\x03')
+    with pytest.raises(ValueError):
+        Dispatcher(Struct().append(uint8('msg_id')), length='length')
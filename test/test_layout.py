@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import ctypes
+
+from striptease import Struct, String, Padding, uint8, uint16, uint32, \
+                       int64, double
+
+
+def test_aligned_struct():
+    coder_token = Struct(aligned=True).append(
+        uint8('foo', '@'),
+        uint32('bar', '@'),
+        uint8('moo', '@'),
+        Struct('baz', aligned=True).append(
+            uint16('meh', '@'),
+            double('bang', '@'),
+        ),
+        uint8('bla', '@'),
+    )
+
+    class Expected(ctypes.Structure):
+        _fields_ = [('foo', ctypes.c_uint8), ('bar', ctypes.c_uint32),
+                    ('moo', ctypes.c_uint8),
+                    ('baz', type('Baz', (ctypes.Structure,), {'_fields_': [
+                        ('meh', ctypes.c_uint16), ('bang', ctypes.c_double)]})),
+                    ('bla', ctypes.c_uint8)]
+
+    assert coder_token.static_size() == ctypes.sizeof(Expected)
+    in_dikt = {'foo': 1, 'bar': 2, 'moo': 3, 'bla': 5,
+               'baz': {'meh': 4, 'bang': 0.5}}
+    dikt, payload = coder_token.encode(in_dikt)
+    assert len(payload) == ctypes.sizeof(Expected)
+    view = coder_token.ctype().from_buffer_copy(payload)
+    assert (view.foo, view.bar, view.moo, view.baz.meh, view.baz.bang,
+            view.bla) == (1, 2, 3, 4, 0.5, 5)
+    expected = Expected.from_buffer_copy(payload)
+    assert expected.baz.bang == 0.5 and expected.bla == 5
+    assert coder_token.decode(payload, dict()) == ('', in_dikt)
+    assert coder_token.plan().decode(payload, dict()) == ('', in_dikt)
+
+
+def test_packed_ctype():
+    coder_token = Struct().append(
+        uint8('foo'),
+        Padding('ab'),
+        uint32('bar'),
+        String('moo')[3],
+        int64('meh')[2],
+    )
+    in_dikt = {'foo': 1, 'bar': 2, 'moo': 'abc', 'meh': [-1, 7]}
+    dikt, payload = coder_token.encode(in_dikt)
+    view = coder_token.ctype('Packed').from_buffer(bytearray(payload))
+    assert (view.foo, view.bar, view.moo, list(view.meh)) == (1, 2, 'abc',
+                                                              [-1, 7])
+
+
+def test_packed_inner_struct():
+    coder_token = Struct(aligned=True).append(
+        uint8('foo', '@'),
+        Struct('inner').append(uint8('bar', '@'), uint32('baz', '@')),
+        uint8('moo', '@'),
+    )
+
+    class Inner(ctypes.Structure):
+        _pack_ = 1
+        _fields_ = [('bar', ctypes.c_uint8), ('baz', ctypes.c_uint32)]
+
+    class Expected(ctypes.Structure):
+        _fields_ = [('foo', ctypes.c_uint8), ('inner', Inner),
+                    ('moo', ctypes.c_uint8)]
+
+    assert coder_token.static_size() == ctypes.sizeof(Expected) == 7
+    in_dikt = {'foo': 1, 'inner': {'bar': 2, 'baz': 3}, 'moo': 4}
+    dikt, payload = coder_token.encode(in_dikt)
+    view = coder_token.ctype().from_buffer_copy(payload)
+    assert (view.foo, view.inner.bar, view.inner.baz, view.moo) == (1, 2, 3, 4)
+    assert coder_token.decode(payload, dict()) == ('', in_dikt)
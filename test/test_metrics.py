@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+import gc
+import threading
+
+import pytest
+
+from striptease import Struct, uint8, uint16
+from striptease.checksum import CRC, ChecksumError
+from striptease.dispatch import Dispatcher
+from striptease.metrics import REGISTRY, SAMPLE, exposition
+
+
+def test_metrics():
+    struct = Struct('msg').append(
+        uint8('type'),
+        CRC('chk', 'crc-16').child(uint16('trans')),
+    )
+    metrics = struct.instrument(sample=1.0)
+    assert struct.instrument() is metrics
+    payload = struct.encode({'type': 1, 'trans': 2})[1]
+
+    def work():
+        for i in range(100):
+            struct.decode(payload, dict())
+    threads = [threading.Thread(target=work) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with pytest.raises(ChecksumError):
+        struct.decode(payload[:2] + 'x' + payload[3:], dict())
+    with pytest.raises(Exception):
+        struct.decode(payload[:2], dict())
+
+    snapshot = metrics.snapshot()
+    assert snapshot['encoded'] == 1 and snapshot['bytes_out'] == 5
+    assert snapshot['decoded'] == 400 and snapshot['bytes_in'] == 2000
+    assert snapshot['checksum_failures'] == 1
+    assert sum(snapshot['errors'].values()) == 2
+    assert snapshot['decode_latency'].count == 400
+
+    text = exposition([metrics])
+    assert 'striptease_messages_decoded_total{schema="msg"} 400' in text
+    assert 'striptease_decode_seconds_count{schema="msg"} 400' in text
+    assert 'striptease_checksum_failures_total{schema="msg"} 1' in text
+
+    metrics.reset()
+    assert metrics.snapshot()['decoded'] == 0
+
+
+def test_plan_metrics():
+    struct = Struct('rec').append(uint8('a'), uint16('b'))
+    dispatcher = Dispatcher(Struct().append(uint8('msg_id')), length=None)
+    dispatcher.register(1, struct) # holds on to the plan
+    metrics = struct.instrument(sample=1.0)
+    payload = struct.encode({'a': 1, 'b': 2})[1]
+
+    message = dispatcher.encode(1, {'a': 1, 'b': 2})
+    assert dispatcher.decode(message) == {'a': 1, 'b': 2}
+    struct.decode(payload, dict(), trusted=True) # decodes via the plan
+    assert list(struct.scan(payload * 2)) == [{'a': 1, 'b': 2}] * 2
+    assert list(struct.decode_columns(payload * 3)['b']) == [2, 2, 2]
+    assert ''.join(struct.iter_encode({'a': 1, 'b': 2})) == payload
+    buffer = bytearray(3)
+    assert struct.encode_into({'a': 1, 'b': 2}, buffer) == 3
+
+    snapshot = metrics.snapshot()
+    assert snapshot['encoded'] == 4 and snapshot['bytes_out'] == 12
+    assert snapshot['decoded'] == 7 and snapshot['bytes_in'] == 21
+    assert snapshot['decode_latency'].count == 4
+
+
+def test_registry():
+    struct = Struct('a "quoted"\nname\\').append(uint8('a'))
+    metrics = struct.instrument()
+    assert metrics in REGISTRY
+    assert metrics.every == int(round(1.0 / SAMPLE))
+    text = exposition()
+    assert 'schema="a \\"quoted\\"\\nname\\\\"' in text
+    REGISTRY.discard(metrics)
+    assert 'quoted' not in exposition()
+
+    struct = Struct('gone').append(uint8('a'))
+    struct.instrument()
+    del struct
+    gc.collect()
+    assert 'gone' not in exposition()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+import random
+
+import pytest
+
+from striptease import Struct, Padding, String, Array, Dynamic, Consumer, \
+                       If, Compressed, uint8, uint16, uint32, int16
+
+
+def make_struct():
+    return Struct().append(
+        uint8('foo'),
+        Padding('ab'),
+        uint16('bar'),
+        uint8('moo_len'),
+        String('moo')['moo_len'],
+        int16('meh'),
+        uint32('bang'),
+    )
+
+
+def test_fused_codec():
+    coder_token = make_struct()
+    fused = coder_token.plan()
+    assert [step[0] for step in fused.steps] == ['run', 'token', 'run']
+    for i in range(100):
+        in_dikt = dict(foo=random.getrandbits(8), bar=random.getrandbits(16),
+                       moo='x' * random.getrandbits(4),
+                       meh=random.getrandbits(15), bang=random.getrandbits(32))
+        dikt, payload = coder_token.encode(dict(in_dikt))
+        _dikt, _payload = fused.encode(dict(in_dikt))
+        assert _payload == payload and _dikt == dikt
+        rest, out_dikt = fused.decode(payload, dict())
+        assert rest == '' and out_dikt == dikt
+
+
+def nested_paddings(pads):
+    """ Paddings within arrays, optional and compressed token """
+    return Struct().append(
+        uint8('count'),
+        Dynamic('count', Array('fixed').of(Struct().append(
+            uint8('a'), Padding(pads[0])))),
+        uint8('flag'),
+        If('flag', 1, Struct('optional').append(
+            Padding(pads[1]), uint8('b'))),
+        Compressed(Struct('packed').append(uint16('c'), Padding(pads[2])),
+                   threshold=0),
+        Consumer(Array('varying').of(Struct().append(
+            uint8('len'), String('s')['len'], Padding(pads[3])))),
+    )
+
+
+def test_trusted_nested():
+    dikt = {'fixed': [{'a': 1}, {'a': 2}], 'flag': 1, 'optional': {'b': 3},
+            'packed': {'c': 4}, 'varying': [{'s': 'x'}, {'s': 'yz'}]}
+    dikt, payload = nested_paddings('PPPP').encode(dikt)
+    for i in range(4):
+        corrupt = nested_paddings('PPPP'[:i] + 'Q' + 'PPPP'[i + 1:])
+        with pytest.raises(AssertionError):
+            corrupt.decode(payload, dict())
+        with pytest.raises(AssertionError):
+            corrupt.plan().decode(payload, dict())
+        assert corrupt.decode(payload, dict(), trusted=True) == ('', dikt)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from striptease import Struct, Record, Array, Dynamic, Padding, String, \
+                       uint8, uint16
+from striptease.dispatch import Dispatcher
+
+
+class Store(Record):
+    trans = uint8()
+    nlen = uint8()
+    name = String()['nlen']
+    pad = Padding('\x00')
+    dlen = uint16()
+    data = String()['dlen']
+    tag = String()[4]
+
+
+class Batch(Record):
+    count = uint16()
+    items = Dynamic('count', Array().of(Struct().append(uint8('a'))))
+
+
+def test_record():
+    assert Store.FIELDS == ('trans', 'nlen', 'name', 'dlen', 'data', 'tag')
+    assert isinstance(Store.STRUCTURE.children()[3], Padding)
+    store = Store(1, name='foo', data='bar', tag='ab')
+    with pytest.raises(TypeError):
+        Store(pad='\x00')
+    assert not hasattr(store, 'pad')
+    assert not hasattr(store, '__dict__')
+    with pytest.raises(AttributeError):
+        store.other = 1
+    payload = store.encode()
+    assert payload == '\x01\x03foo\x00\x00\x03barab\x00\x00'
+    assert payload == Store.STRUCTURE.encode(
+        {'trans': 1, 'name': 'foo', 'data': 'bar', 'tag': 'ab'})[1]
+    assert store.nlen == 3 and store.dlen == 3
+    assert Store(1, 3, 'foo', 3, 'bar', 'ab') == store
+
+    rest, decoded = Store.decode(payload + 'rest')
+    assert rest == 'rest' and decoded == store
+    assert decoded.asdict() == Store.STRUCTURE.decode(payload, dict())[1]
+    with pytest.raises(AssertionError):
+        Store.decode(payload.replace('foo\x00', 'foo\x01'))
+    assert Store.decode(payload.replace('foo\x00', 'foo\x01'), True)[1] \
+        == store
+
+    batch = Batch(items=[{'a': 1}, {'a': 2}])
+    assert Batch.decode(batch.encode())[1].items == [{'a': 1}, {'a': 2}]
+
+    with pytest.raises(TypeError):
+        Store(other=1)
+    with pytest.raises(TypeError):
+        class Extended(Store):
+            extra = uint8()
+
+
+def test_dispatch_records():
+    dispatcher = Dispatcher(Struct().append(uint8('msg_id'),
+                                            uint16('length')))
+    dispatcher.register(0x01, Store)
+    store = Store(7, name='foo', data='', tag='abcd')
+    message = dispatcher.decode(dispatcher.encode(0x01, store))
+    assert isinstance(message, Store) and message == store
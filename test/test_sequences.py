@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 
 import string
+import struct
 import random
 
+import pytest
+
 from striptease import Struct, Dynamic, Static, Consumer, Array,\
                        String, Integer, uint8
 
@@ -85,3 +88,190 @@ def test_string():
                 assert payload == ""
 
 
+
+def test_iter_encode():
+    coder_token = Struct().append(
+        uint8('foo_len'),
+        Dynamic('foo_len', String('foo')),
+        Static(4, String('bar')),
+        Static(3, Array('moo').of(Integer('', True, 4))),
+        Consumer(String('blob')),
+    )
+    blob = "x" * 10000
+    in_dikt = dict(foo='meh', bar='ab', moo=[1, -2, 3], blob=blob)
+    dikt, payload = coder_token.encode(dict(in_dikt))
+    chunks = list(coder_token.iter_encode(dict(in_dikt), threshold=64))
+    assert "".join(chunks) == payload
+    assert chunks[-1] is blob
+
+    from StringIO import StringIO
+    fileobj = StringIO()
+    assert coder_token.write(dict(in_dikt), fileobj) == len(payload)
+    assert fileobj.getvalue() == payload
+
+
+def test_encode_buffers():
+    from array import array
+    coder_token = Struct().append(
+        uint8('foo'),
+        Static(2000, String('bar')),
+        uint8('moo_len'),
+        Dynamic('moo_len', Array('moo').of(Integer('', False, 1))),
+        Consumer(String('blob')),
+    )
+    bar = "b" * 3000
+    moo = bytearray(range(200))
+    blob = "x" * 5000
+    in_dikt = dict(foo=1, bar=bar, moo=moo, blob=blob)
+    buffers = coder_token.encode_buffers(dict(in_dikt))
+    assert len(buffers) == 4
+    assert buffers[1].tobytes() == bar[:2000]
+    assert buffers[2].startswith(chr(200)) and buffers[3] is blob
+    dikt, payload = coder_token.encode(dict(in_dikt, moo=list(moo)))
+    assert "".join(str(b) if type(b) != memoryview else b.tobytes()
+                   for b in buffers) == payload
+
+    moo = array('B', range(10))
+    buffers = coder_token.encode_buffers(dict(in_dikt, moo=moo))
+    assert "".join(str(b) if type(b) != memoryview else b.tobytes()
+                   for b in buffers) == coder_token.encode(
+                           dict(in_dikt, moo=list(moo)))[1]
+
+
+def test_decode_stream():
+    from StringIO import StringIO
+    coder_token = Struct().append(
+        uint8('foo_len'),
+        Dynamic('foo_len', String('foo')),
+        Static(2, Array('bar').of(Integer('', False, 2))),
+        Consumer(String('blob')),
+    )
+    in_dikt = dict(foo='meh', bar=[1, 2], blob='x' * 100000)
+    dikt, payload = coder_token.encode(dict(in_dikt))
+    out_dikt = coder_token.decode_stream(StringIO(payload))
+    blob = out_dikt['blob']
+    assert len(blob) == 100000
+    assert blob.read(10) == 'x' * 10
+    assert blob.tobytes() == in_dikt['blob']
+    out_dikt['blob'] = in_dikt['blob']
+    assert out_dikt == dict(in_dikt, foo_len=3)
+
+    coder_token = Struct().append(
+        uint8('foo'),
+        Consumer(Array('samples').of(Integer('', True, 2))),
+    )
+    in_dikt = dict(foo=1, samples=range(-20000, 20000))
+    dikt, payload = coder_token.encode(dict(in_dikt))
+    out_dikt = coder_token.decode_stream(StringIO(payload))
+    assert list(out_dikt['samples']) == in_dikt['samples']
+
+
+def test_flat():
+    coder_token = Struct().append(
+        uint8('foo'),
+        Struct('baz').append(
+            uint8('moo_len'),
+            Integer('bar', False, 2, '@'),
+            Dynamic('moo_len', String('moo')),
+            Static(2, Array('meh').of(Integer('', True, 4))),
+        ),
+        Consumer(String('blob')),
+    )
+    in_dikt = {'foo': 1, 'blob': 'bla',
+               'baz': {'moo': 'moep', 'bar': 7, 'meh': [-1, 1]}}
+    dikt, payload = coder_token.encode(in_dikt)
+    flat = {'foo': 1, 'blob': 'bla', 'baz.moo': 'moep', 'baz.bar': 7,
+            'baz.meh': [-1, 1]}
+    assert coder_token.encode_flat(flat)[1] == payload
+    assert flat['baz.moo_len'] == 4
+    assert coder_token.decode_flat(payload) == ('', flat)
+
+
+def test_padded_string():
+    from striptease import PaddedString
+    for reverse in [True, False]:
+        coder_token = Struct().append(
+            PaddedString('foo', reverse=reverse)[8],
+            PaddedString('bar', 'utf-8', ' ')[10],
+        )
+        foo = 'ab\x00c' if reverse else '\x00ab\x00c'
+        in_dikt = {'foo': foo, 'bar': u'm\xf6p'}
+        dikt, payload = coder_token.encode(dict(in_dikt))
+        assert len(payload) == 18
+        assert payload[8:] == u'm\xf6p'.encode('utf-8') + ' ' * 6
+        assert coder_token.decode(payload, dict()) == ('', in_dikt)
+
+
+def test_cstring():
+    from striptease import CString
+    coder_token = Struct().append(
+        CString('foo'),
+        uint8('bar'),
+        CString('moo', 'utf-8'),
+    )
+    in_dikt = {'foo': 'meh', 'bar': 0, 'moo': u'\xe4\xf6'}
+    dikt, payload = coder_token.encode(dict(in_dikt))
+    assert payload == 'meh\x00\x00\xc3\xa4\xc3\xb6\x00'
+    assert coder_token.decode(payload + 'x', dict()) == ('x', in_dikt)
+    columns = coder_token.decode_columns(payload * 3, ['moo', 'bar'])
+    assert columns['moo'] == [in_dikt['moo']] * 3
+
+
+def test_struct_array():
+    from striptease import Padding, uint16
+    fixed = Struct().append(
+        uint8('foo'),
+        Padding('\xff'),
+        uint16('bar'),
+    )
+    nested = Struct().append(
+        uint8('foo'),
+        Struct('baz').append(uint16('bar')),
+    )
+    variable = Struct().append(
+        uint8('len'),
+        Dynamic('len', String('foo')),
+    )
+    for element, data in [
+            (fixed, [{'foo': i, 'bar': i * 3} for i in range(10)]),
+            (nested, [{'foo': i, 'baz': {'bar': i}} for i in range(10)]),
+            (variable, [{'foo': 'x' * i} for i in range(10)])]:
+        for reverse in [True, False]:
+            coder_token = Struct().append(
+                uint8('count'),
+                Dynamic('count', Array('elements', reverse).of(element)),
+                Consumer(Array('rest').of(element)),
+            )
+            in_dikt = {'elements': data, 'rest': data[:3]}
+            dikt, payload = coder_token.encode(in_dikt)
+            assert coder_token.decode(payload, dict()) == ('', dikt)
+    coder_token = Static(2, Array('foo').of(fixed.trust()))
+    data = [{'foo': 0, 'bar': 0}, {'foo': 1, 'bar': 3}]
+    payload = coder_token.encode({'foo': data})[1].replace('\xff', '\x00')
+    assert coder_token.decode(payload, dict())[1]['foo'] == data
+
+
+def test_views():
+    from striptease import Padding
+    coder_token = Struct().append(
+        uint8('len'),
+        Dynamic('len', String('data', view=True)),
+        Padding('\x00'),
+        Static(4, Array('bytes', view=True).of(uint8(''))),
+        Consumer(String('rest', view=True)),
+    )
+    payload = '\x03moo\x00\x01\x02\x03\x04blob'
+    for buf in [payload, memoryview(payload), bytearray(payload)]:
+        rest, dikt = coder_token.decode(buf, dict())
+        assert [type(dikt[key]) for key in ['data', 'bytes', 'rest']] == \
+            [memoryview] * 3
+        assert dikt['data'].tobytes() == 'moo'
+        assert dikt['bytes'].tobytes() == '\x01\x02\x03\x04'
+        assert dikt['rest'].tobytes() == 'blob'
+        assert coder_token.encode(dikt)[1] == payload
+        assert "".join(coder_token.iter_encode(dikt)) == payload
+    for buf in [payload[:3], payload[:7]]: # shorter than the lengths
+        with pytest.raises(struct.error):
+            coder_token.decode(buf, dict())
+    with pytest.raises(ValueError): # only arrays of uint8 are views
+        Array('foo', view=True).of(Integer('', False, 2))
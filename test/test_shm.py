@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+
+from striptease import Struct, Dynamic, String, uint8, uint16, uint32
+from striptease.shm import RecordRing
+
+
+def fixed():
+    return Struct().append(uint32('seq'), uint16('foo'), uint8('bar'))
+
+
+def variable():
+    return Struct().append(uint32('seq'), uint8('len'),
+                           Dynamic('len', String('data')))
+
+
+def record(i):
+    return {'seq': i, 'foo': i % 1000, 'bar': i % 256, 'data': 'x' * (i % 50)}
+
+
+def produce(ring, count):
+    for i in range(count):
+        ring.put(record(i))
+
+
+def test_ring():
+    for factory in [fixed, variable]:
+        struct_token = factory()
+        ring = RecordRing(struct_token, capacity=128)
+        assert ring.get(timeout=0) is None
+        for i in range(300):
+            assert ring.put(record(i))
+            dikt = ring.get()
+            expected = struct_token.encode(record(i))[0]
+            assert dikt == dict((key, expected[key]) for key in dikt)
+        assert ring.put(record(5))
+        view = ring.peek()
+        assert view['seq'] == 5
+        ring.release()
+        assert ring.empty()
+        while ring.put(record(1), timeout=0):
+            pass
+        assert not ring.empty()
+        ring.close()
+        ring.unlink()
+
+
+def test_ring_processes():
+    ring = RecordRing(variable(), capacity=1000)
+    producer = multiprocessing.Process(target=produce, args=(ring, 2000))
+    producer.start()
+    for i in range(2000):
+        dikt = ring.get(timeout=10)
+        assert dikt['seq'] == i
+        assert dikt['data'] == 'x' * (i % 50)
+    producer.join()
+    assert ring.empty()
+    ring.close()
+    ring.unlink()
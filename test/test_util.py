@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import array
+import subprocess
+import logging
+from collections import deque
+
+import pytest
+
+from striptease.base import as_bytes
+from striptease.util import DEBUG, INFO, IOV_MAX, byte_view, advance, \
+                            logged, gather, send_buffers, write_buffers
+
+
+def test_byte_view():
+    numbers = array.array('H', [1, 2, 0x0304])
+    for buf in ['abc', bytearray('abc'), numbers]:
+        view = byte_view(buf)
+        assert isinstance(view, memoryview)
+        assert len(view) == len(buf) * getattr(buf, 'itemsize', 1)
+        assert view.tobytes() == as_bytes(buf)
+    assert byte_view(numbers)[4:].tobytes() == as_bytes(numbers[2:])
+
+
+def test_advance():
+    views = deque(['abc', byte_view(bytearray('defg')), 'hi'])
+    advance(views, 0)
+    assert list(views)[0] == 'abc' and len(views) == 3
+    advance(views, 1)
+    assert isinstance(views[0], memoryview)
+    assert [as_bytes(view) for view in views] == ['bc', 'defg', 'hi']
+    advance(views, 2) # exactly the first buffer
+    assert len(views) == 2 and views[0].tobytes() == 'defg'
+    advance(views, 5) # across buffers
+    assert [as_bytes(view) for view in views] == ['i']
+    advance(views, 1)
+    assert not views
+
+
+class Writer(object):
+    """ Takes at most ``limit`` bytes per call, like a full socket """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.data = list()
+        self.calls = list()
+
+    def __call__(self, views):
+        self.calls.append(len(views))
+        data = ''.join(as_bytes(view) for view in views)[:self.limit]
+        self.data.append(data)
+        return len(data)
+
+
+def buffers(count=1):
+    numbers = array.array('H', range(100))
+    return ['head', '', numbers, bytearray('tail')] * count, \
+        ('head' + as_bytes(numbers) + 'tail') * count
+
+
+def test_gather():
+    bufs, expected = buffers()
+    writer = Writer(7) # partial writes within and across buffers
+    assert gather(writer, bufs) == len(expected)
+    assert ''.join(writer.data) == expected
+    assert len(writer.calls) == -(-len(expected) // 7)
+
+    bufs, expected = buffers(IOV_MAX) # more buffers than one call takes
+    writer = Writer(len(expected))
+    assert gather(writer, bufs) == len(expected)
+    assert ''.join(writer.data) == expected
+    assert writer.calls == [IOV_MAX] * 3 # empty buffers are skipped
+
+
+def test_send_buffers():
+    bufs, expected = buffers()
+
+    class Socket(object):
+        sendmsg = Writer(100)
+    sock = Socket()
+    assert send_buffers(sock, bufs) == len(expected)
+    assert ''.join(sock.sendmsg.data) == expected
+
+    class Fallback(object):
+        def __init__(self):
+            self.data = list()
+
+        def sendall(self, buf):
+            self.data.append(as_bytes(buf))
+    sock = Fallback()
+    assert send_buffers(sock, bufs) == len(expected)
+    assert ''.join(sock.data) == expected
+
+
+@pytest.mark.parametrize('writev', [True, False])
+def test_write_buffers(monkeypatch, writev):
+    if writev and not hasattr(os, 'writev'):
+        pytest.skip('os.writev is not available')
+    if not writev:
+        monkeypatch.delattr(os, 'writev', raising=False)
+    bufs, expected = buffers(64) # fits into the pipe
+    read, write = os.pipe()
+    try:
+        assert write_buffers(write, bufs) == len(expected)
+        os.close(write)
+        data = list()
+        while True:
+            chunk = os.read(read, 65536)
+            if not chunk:
+                break
+            data.append(chunk)
+    finally:
+        os.close(read)
+    assert ''.join(data) == expected
+
+
+def test_logged():
+    try:
+        import logbook
+    except ImportError:
+        pass
+    else:
+        pytest.skip('logbook is installed')
+
+    @logged()
+    class Logging(object):
+        pass
+
+    parent = logging.getLogger(Logging.__module__)
+    records = list()
+    handler = logging.Handler()
+    handler.emit = records.append
+    parent.addHandler(handler)
+    try:
+        parent.setLevel(logging.DEBUG)
+        assert Logging.logger.isEnabledFor(DEBUG)
+        Logging.logger.debug('foo')
+        parent.setLevel(logging.WARNING)
+        assert not Logging.logger.isEnabledFor(INFO)
+        Logging.logger.info('bar')
+        Logging.logger.warning('baz')
+    finally:
+        parent.removeHandler(handler)
+        parent.setLevel(logging.NOTSET)
+    assert [record.getMessage() for record in records] == ['foo', 'baz']
+
+
+def test_lazy_import():
+    script = '\n'.join([
+        'import sys, striptease',
+        'assert "striptease.checksum" not in sys.modules',
+        'assert "name" not in vars(striptease)',
+        'from striptease import XOR',
+        'assert striptease.XOR is XOR and striptease.CRC',
+        'assert "striptease.checksum" in sys.modules',
+        'assert not hasattr(striptease, "missing")',
+    ])
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    subprocess.check_call([sys.executable, '-c', script], env=env)